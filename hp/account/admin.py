@@ -27,6 +27,7 @@ from django_object_actions import takes_instance_or_queryset
 from reversion.admin import VersionAdmin
 
 from antispam.utils import normalize_email
+from core.gpg import get_key_fetcher
 from core.utils import version
 
 from .constants import PURPOSE_REGISTER
@@ -192,9 +193,13 @@ class GpgKeyAdmin(DjangoObjectActions, admin.ModelAdmin):
 
     @takes_instance_or_queryset
     def refresh(self, request, queryset):
+        queryset = list(queryset)
+        # an explicit refresh must not use cached keys, as they might have been revoked in the meantime
+        keys = get_key_fetcher().fetch_many((obj.fingerprint.upper() for obj in queryset), refresh=True)
+
         for obj in queryset:
             try:
-                obj.refresh()
+                obj.refresh(keys[obj.fingerprint.upper()].result())
             except Exception as e:
                 log.exception(e)
                 messages.error(request, _('Error importing %(fingerprint)s: %(error)s') % {
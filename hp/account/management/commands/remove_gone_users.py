@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the jabber.at homepage (https://github.com/jabber-at/hp).
+#
+# This project is free software: you can redistribute it and/or modify it under the terms of the GNU General
+# Public License as published by the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This project is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License along with this project. If not, see
+# <http://www.gnu.org/licenses/>.
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from ...tasks import remove_gone_users
+
+
+class Command(BaseCommand):
+    help = 'Remove users that are no longer present on the XMPP server.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', default=False,
+                            help='Only list users that would be removed.')
+        parser.add_argument('--batch-size', type=int, default=1000, metavar='N',
+                            help='Remove N users per transaction (default: %(default)s).')
+        parser.add_argument('hosts', nargs='*', metavar='HOST',
+                            help='Only handle the given hosts (default: all hosts).')
+
+    def handle(self, *args, **options):
+        hosts = options['hosts'] or list(settings.XMPP_HOSTS)
+        for hostname in hosts:
+            if hostname not in settings.XMPP_HOSTS:
+                raise CommandError('%s: Unknown host.' % hostname)
+
+        for hostname in hosts:
+            removed = remove_gone_users(hostname, dry_run=options['dry_run'],
+                                        batch_size=options['batch_size'])
+            if removed is None:
+                self.stdout.write(self.style.WARNING('%s: Skipped, backend returned too few users.'
+                                                     % hostname))
+                continue
+
+            if options['dry_run']:
+                for username in removed:
+                    self.stdout.write(username)
+                self.stdout.write('%s: Would remove %s users.' % (hostname, len(removed)))
+            else:
+                self.stdout.write(self.style.SUCCESS('%s: Removed %s users.' % (hostname, len(removed))))
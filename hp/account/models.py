@@ -24,9 +24,6 @@ from django.core.mail import EmailMultiAlternatives
 from django.db import models
 from django.db.models.signals import post_save
 from django.dispatch import receiver
-from django.template import Context
-from django.template import Template
-from django.template.loader import render_to_string
 from django.urls import reverse
 from django.utils import timezone
 from django.utils import translation
@@ -44,10 +41,14 @@ from xmpp_backends.django.models import XmppBackendUser
 
 from antispam.models import BlockedEmail
 from antispam.models import BlockedIpAddress
+from core.gpg import get_key_fetcher
+from core.gpg import get_keyring_pool
+from core.mail import MailTemplate
+from core.mail import PreparedMessage
+from core.mail import send_message
 from core.models import Address
 from core.models import BaseModel
 from core.models import CachedMessage
-from core.utils import load_private_key
 
 from .constants import PURPOSE_DELETE
 from .constants import PURPOSE_REGISTER
@@ -173,12 +174,13 @@ class User(XmppBackendUser, PermissionsMixin):
             pass
 
     @contextmanager
-    def gpg_keyring(self, init=True, hostname=None, **kwargs):
+    def gpg_keyring(self, init=True, **kwargs):
         """Context manager that yields a temporary GPG keyring.
 
         To avoid any locking issues and to isolate the GPG keys for users, every operation that
         interacts with gpg (and thus uses the keyring) is with a separate, temporary keyring that
-        is created specifically for the operations.
+        is created specifically for the operations. Use :py:meth:`gpg_host_keyring` for sending
+        mails.
 
         Example::
 
@@ -191,24 +193,40 @@ class User(XmppBackendUser, PermissionsMixin):
 
         init : bool, optional
             If ``False``, do not import existing (valid) keys into the keyring.
-        hostname : str, optional
-            If set, also import the private key for the given host configured in the ``XMPP_HOSTS``
-            setting.
         """
-        if hostname is not None:
-            host_fp, host_key, host_pub = load_private_key(hostname)
-
         with gpg_backend.temp_keyring(**kwargs) as backend:
             if init is True:  # import existing valid gpg keys
                 for key in self.gpg_keys.valid():
                     backend.import_key(key.key.encode('utf-8'))
 
-            if hostname is not None:
-                backend.import_private_key(host_key)
-                backend.import_key(host_pub)
-
             yield backend
 
+    @contextmanager
+    def gpg_host_keyring(self, hostname, **kwargs):
+        """Context manager that yields the persistent keyring for the given host.
+
+        The keyring already contains the private key for the given host configured in the
+        ``XMPP_HOSTS`` setting, valid keys of this user are imported if they are not yet present.
+        See :py:mod:`core.gpg` for details.
+
+        Example::
+
+            with user.gpg_host_keyring('example.com', default_trust=True) as keyring:
+                keyring.import_key(...)
+                msg = GpgEmailMessage(..., gpg_backend=keyring.backend)
+
+        Parameters
+        ----------
+
+        hostname : str
+            The host to get the keyring for.
+        """
+        with get_keyring_pool().keyring(hostname, **kwargs) as keyring:
+            for key in self.gpg_keys.valid():
+                keyring.import_key(key.key)
+
+            yield keyring
+
     def add_gpg_key(self, keys, fingerprint, address):
         if isinstance(keys, str):
             keys = keys.encode('utf-8')  # convert to bytes
@@ -268,6 +286,8 @@ class User(XmppBackendUser, PermissionsMixin):
             A bytestring to use as a GPG key instead of any key set for the user. Pass ``False`` to
             send a plaintext email even if the user has GPG keys defined.
 
+        If a :py:func:`~core.mail.mail_queue` is active, the message is queued and sent in a batch.
+
         Raises
         ------
 
@@ -289,19 +309,21 @@ class User(XmppBackendUser, PermissionsMixin):
         if gpg_key is not False and (keys or gpg_key):
             sign_fp = host.get('GPG_FINGERPRINT')
 
-            with self.gpg_keyring(default_trust=True, hostname=host['NAME']) as backend:
+            with self.gpg_host_keyring(host['NAME'], default_trust=True) as keyring:
                 if gpg_key:
                     log.info('Imported custom keys.')
-                    keys = backend.import_key(gpg_key)
+                    keys = keyring.import_key(gpg_key)
 
                 msg = GpgEmailMessage(subject, message, frm, [to],
-                                      gpg_backend=backend, gpg_recipients=keys, gpg_signer=sign_fp)
+                                      gpg_backend=keyring.backend, gpg_recipients=keys, gpg_signer=sign_fp)
                 msg.attach_alternative(html_message, 'text/html')
-                msg.send()
+                msg = PreparedMessage(msg)  # encrypt while the keyring is held
+
+            send_message(msg)
         else:
             msg = EmailMultiAlternatives(subject, message, frm, [to])
             msg.attach_alternative(html_message, 'text/html')
-            msg.send()
+            send_message(msg)
 
     def send_mail_template(self, template_base, context, subject, host=None, to=None,
                            gpg_key=None):
@@ -325,9 +347,7 @@ class User(XmppBackendUser, PermissionsMixin):
         gpg_key
             Passed to :py:class:`~account.models.User.send_mail`.
         """
-        subject = Template(subject).render(Context(context))
-        txt = render_to_string('%s.txt' % template_base, context).strip()
-        html = render_to_string('%s.html' % template_base, context).strip()
+        subject, txt, html = MailTemplate(template_base, subject).render(context)
         self.send_mail(subject, txt, html, host=host, to=to, gpg_key=gpg_key)
 
     def __str__(self):
@@ -440,8 +460,19 @@ class GpgKey(BaseModel):
     expires = models.DateTimeField(null=True, blank=True)
     revoked = models.BooleanField(default=False)
 
-    def refresh(self):
-        refetched = gpg_backend.fetch_key('0x%s' % self.fingerprint, keyserver=settings.GPG_KEYSERVER)
+    def refresh(self, refetched=None):
+        """Refresh this key from the keyserver.
+
+        Parameters
+        ----------
+
+        refetched : bytes, optional
+            The key as already fetched from the keyserver, e.g. by
+            :py:meth:`~core.gpg.KeyFetcher.fetch_many`. If omitted, the key is fetched (bypassing the
+            cache of fetched keys).
+        """
+        if refetched is None:
+            refetched = get_key_fetcher().fetch(self.fingerprint, refresh=True)
 
         with self.user.gpg_keyring(init=False) as backend:
             key = backend.import_key(refetched)[0]
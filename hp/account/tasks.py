@@ -13,9 +13,12 @@
 # You should have received a copy of the GNU General Public License along with this project. If
 # not, see <http://www.gnu.org/licenses/>.
 
+import smtplib
 import socket
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
 from datetime import timedelta
+from itertools import groupby
 from urllib.error import URLError
 
 import pytz
@@ -26,22 +29,27 @@ from celery.utils.log import get_task_logger
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.messages import constants as messages
+from django.db import transaction
 from django.urls import reverse
+from django.utils import timezone
 from django.utils import translation
 from django.utils.translation import gettext as _
 from django.utils.translation import gettext_noop
 
 from gpgliblib.base import UnknownGpgliblibError
-from gpgliblib.django import gpg_backend
 from xmpp_backends.base import UserNotFound
 from xmpp_backends.django import xmpp_backend
 
+from core.gpg import get_key_fetcher
+from core.mail import MailTemplate
+from core.mail import mail_queue
 from core.models import Address
 from core.tasks import activate_language
 from core.utils import format_timedelta
 
 from .constants import PURPOSE_SET_EMAIL
 from .models import Confirmation
+from .models import Notifications
 from .models import UserLogEntry
 
 User = get_user_model()
@@ -66,7 +74,7 @@ class FetchKeyTask(Task):
             The user to logg error messages to.
         """
         try:
-            return gpg_backend.fetch_key('0x%s' % fingerprint).decode('utf-8')
+            return get_key_fetcher().fetch(fingerprint).decode('utf-8')
         except (URLError, socket.timeout) as e:
             retries = self.request.retries
 
@@ -188,130 +196,310 @@ def resend_confirmations(*conf_pks):
 
         # Resend confirmation keys with primary keys 3, 5 and 10:
         >>> resend_confirmations.delay(3, 5, 10)
+
+    Raises
+    ------
+
+    smtplib.SMTPException
+        If any confirmation could not be sent, so that the task fails visibly.
     """
-    for pk in conf_pks:
-        conf = Confirmation.objects.get(pk=pk)
-        conf.send()
+    with mail_queue() as queue:  # send all mails over one connection
+        for conf in Confirmation.objects.filter(pk__in=conf_pks).select_related('user'):
+            conf.send()
 
+    if queue.failed:
+        raise smtplib.SMTPException('Could not send confirmations to %s.' % ', '.join(
+            sorted(addr for message in queue.failed for addr in message.to)))
 
-@shared_task
-def update_last_activity(random_update=50):
-    # Update some random users with recent activity so we have at least a vague picture of
-    # how recent users are active.
-    for user in User.objects.order_by('?').not_expiring()[:random_update]:
-        try:
-            last_activity = xmpp_backend.get_last_activity(user.node, user.domain)
-        except UserNotFound:
-            log.warn('%s: User not found in XMPP backend.', user)
-            continue
 
-        if last_activity is None:
-            log.warn('%s: Could not get last activity.', user)
-            continue
+def get_last_activity(user):
+    """Get the last activity of the given user from the XMPP backend.
 
-        #user.last_activity = timezone.make_aware(last_activity)
-        user.last_activity = pytz.utc.localize(last_activity)
-        user.save()
+    Returns
+    -------
 
-    for user in User.objects.confirmed().new().unused():
-        try:
-            last_activity = xmpp_backend.get_last_activity(user.node, user.domain)
-        except UserNotFound:
-            log.warn('%s: User not found in XMPP backend.', user)
-            continue
+    datetime or None
+        The timezone-aware last activity or ``None`` if it could not be retrieved.
+    """
+    try:
+        last_activity = xmpp_backend.get_last_activity(user.node, user.domain)
+    except UserNotFound:
+        log.warn('%s: User not found in XMPP backend.', user)
+        return None
 
-        if last_activity is None:
-            log.warn('%s: Could not get last activity.', user)
-            continue
+    if last_activity is None:
+        # This may happen when the user was already deleted in the backend (handled by cleanup)
+        log.warn('%s: Could not get last activity.', user)
+        return None
 
-        #user.last_activity = timezone.make_aware(last_activity)
-        user.last_activity = pytz.utc.localize(last_activity)
-        user.save()
+    return pytz.utc.localize(last_activity)
 
-    # Update last activity of users with more then 350 days of inactivity
-    for user in User.objects.select_related('notifications').expiring():
-        log.debug('%s: Updating last activity.', user)
 
-        try:
-            last_activity = xmpp_backend.get_last_activity(user.node, user.domain)
-        except UserNotFound:
-            log.warn('%s: User not found in XMPP backend.', user)
-            continue
+def sync_last_activity(users, workers=None, batch_size=None):
+    """Update the last activity of the given users from the XMPP backend.
+
+    The backend is queried concurrently with a pool of ``workers`` threads. Users with a changed
+    last activity are written to the database with a bulk update in chunks of ``batch_size``, the
+    ``last_activity`` attribute of the passed user instances is updated as well.
 
+    Parameters
+    ----------
+
+    users : list of User
+    workers : int, optional
+        The number of concurrent backend queries, the default is the value of the
+        ``ACCOUNT_LAST_ACTIVITY_WORKERS`` setting.
+    batch_size : int, optional
+        The number of users written per query, the default is the value of the
+        ``ACCOUNT_LAST_ACTIVITY_BATCH_SIZE`` setting.
+
+    Returns
+    -------
+
+    synced : list of User
+        All users where the last activity could be retrieved from the backend.
+    changed : list of User
+        The subset of ``synced`` where the last activity was updated.
+    """
+    if workers is None:
+        workers = settings.ACCOUNT_LAST_ACTIVITY_WORKERS
+    if batch_size is None:
+        batch_size = settings.ACCOUNT_LAST_ACTIVITY_BATCH_SIZE
+
+    if workers > 1 and len(users) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            activities = list(executor.map(get_last_activity, users))
+    else:
+        activities = [get_last_activity(user) for user in users]
+
+    synced = []
+    changed = []
+    for user, last_activity in zip(users, activities):
         if last_activity is None:
-            # This may happen when the user was already deleted in the backend (handled by cleanup)
-            log.warn('%s: Could not get last activity.', user)
             continue
 
-        # Update last activity in the database if it is not up to date.
+        synced.append(user)
         if last_activity != user.last_activity:
             log.debug('%s: Updated last_activity from %s to %s.', user, user.last_activity, last_activity)
-            user.last_activity = pytz.utc.localize(last_activity)
-            user.save()
-
-        notifs = user.notifications
-
-        # On what date the user will be removed and how many days this is from now
-        when = user.last_activity.date() + settings.ACCOUNT_EXPIRES_DAYS
-        delta = when - date.today()
-
-        # If the updated last_activity still isn't more recent, the user requested a notification
-        # and has a confirmed email address, we send a mail to the user.
-        if user.is_confirmed and user.is_expiring and notifs.account_expires and \
-                notifs.account_expires_notified is False and delta > timedelta():
-            log.debug('%s: Notifying user at %s', user, user.email)
-
-            host = settings.XMPP_HOSTS[user.domain]
-            base_url = host['CANONICAL_BASE_URL'].rstrip('/')
-
-            context = {  # NOQA
-                'domain': user.domain,
-                'expires_days': settings.ACCOUNT_EXPIRES_DAYS.days,
-                'host': host,
-                'jid': user.username,
-                'login_url': '%s%s' % (base_url, reverse('account:login')),
-                'password_url': '%s%s' % (base_url, reverse('account:reset_password')),
-                'user': user,
-                'when': when,
-                'when_days': delta.days,
-            }
-
-            log.info('%s: Sending expiration notice to %s.', user, user.email)
-            with translation.override(user.default_language):
-                subject = _('Your account on {{ domain }} is about to expire')
-                user.send_mail_template('account/email/user_expires', context, subject)
-
-            notifs.account_expires_notified = True
-            notifs.save()
-        elif not user.is_expiring:
-            # The account is no longer expiring, this means it has logged on in the meantime
-            notifs.account_expires_notified = False
-            notifs.save()
-
-        user.save()
+            user.last_activity = last_activity
+            changed.append(user)
+
+    if changed:
+        User.objects.bulk_update(changed, ['last_activity'], batch_size=batch_size)
+
+    return synced, changed
+
+
+@shared_task(rate_limit=settings.MAIL_RATE_LIMIT)
+def send_expiration_notices(*user_pks):
+    """Send expiration notices to the given users.
+
+    This task is started by :py:func:`notify_expiring_users`. The task first claims its users by marking
+    them as notified, users that are already marked as notified (e.g. by a different task) are skipped.
+    Users are notified grouped by language, so that templates are loaded only once per language, and all
+    mails are sent over a single connection. Users whose mail could not be sent (including users that were
+    not reached because an exception was raised) are notified again the next time the notifications are sent.
+    """
+    with transaction.atomic():
+        claimed = list(Notifications.objects.select_for_update().filter(
+            user__in=User.objects.filter(pk__in=user_pks).exclude(email=''), account_expires_notified=False
+        ).values_list('user_id', flat=True))
+        Notifications.objects.filter(user__in=claimed).update(account_expires_notified=True)
+
+    users = list(User.objects.filter(pk__in=claimed))
+    queued = set()  # users whose mail was queued
+    queue = None
+
+    def language_key(user):
+        return user.default_language
+
+    try:
+        with mail_queue() as queue:
+            for language, group in groupby(sorted(users, key=language_key), key=language_key):
+                with translation.override(language):
+                    subject = _('Your account on {{ domain }} is about to expire')
+                    mail = MailTemplate('account/email/user_expires', subject)
+
+                    for user in group:
+                        # On what date the user will be removed and how many days this is from now
+                        when = user.last_activity.date() + settings.ACCOUNT_EXPIRES_DAYS
+                        delta = when - date.today()
+
+                        host = settings.XMPP_HOSTS[user.domain]
+                        base_url = host['CANONICAL_BASE_URL'].rstrip('/')
+
+                        context = {  # NOQA
+                            'domain': user.domain,
+                            'expires_days': settings.ACCOUNT_EXPIRES_DAYS.days,
+                            'host': host,
+                            'jid': user.username,
+                            'login_url': '%s%s' % (base_url, reverse('account:login')),
+                            'password_url': '%s%s' % (base_url, reverse('account:reset_password')),
+                            'user': user,
+                            'when': when,
+                            'when_days': delta.days,
+                        }
+
+                        log.info('%s: Sending expiration notice to %s.', user, user.email)
+                        user.send_mail(*mail.render(context))
+                        queued.add(user.pk)
+    finally:
+        # Users whose mail could not be sent or was never queued (because an exception was raised before)
+        # are notified again the next time the notifications are sent.
+        failed = {addr for message in queue.failed for addr in message.to} if queue is not None else set()
+        unsent = [u for u in users if u.pk not in queued or u.email in failed]
+        if unsent:
+            log.error('Could not send expiration notices to %s.', ', '.join(sorted(u.email for u in unsent)))
+            Notifications.objects.filter(user__in=[u.pk for u in unsent]).update(
+                account_expires_notified=False)
+
+
+def notify_expiring_users(user_pks=None):
+    """Notify users whose account is about to expire.
+
+    Candidates are selected with a single query. The mails are sent by :py:func:`send_expiration_notices`
+    subtasks (with ``MAIL_BATCH_SIZE`` users each), so a slow mail server does not block this function. The
+    subtasks mark users as notified, so users of a subtask that could not be started are notified the next
+    time. Users that are no longer expiring (because they logged in again) are marked as not notified, so
+    they are notified again once they expire again.
+
+    Parameters
+    ----------
+
+    user_pks : list of int, optional
+        Only notify the given users. :py:func:`update_last_activity` only passes users whose last activity
+        was just synced from the XMPP backend.
+
+    Returns
+    -------
+
+    int
+        The number of users passed to subtasks.
+    """
+    if settings.ACCOUNT_EXPIRES_DAYS is None:
+        return 0
+
+    now = timezone.now()
+    Notifications.objects.filter(account_expires_notified=True).exclude(
+        user__in=User.objects.expiring(now=now)).update(account_expires_notified=False)
+
+    # Users that requested a notification, have a confirmed email address and are not yet removed
+    candidates = User.objects.confirmed().expiring(now=now).filter(
+        notifications__account_expires=True, notifications__account_expires_notified=False,
+        last_activity__date__gt=date.today() - settings.ACCOUNT_EXPIRES_DAYS)
+    if user_pks is not None:
+        candidates = candidates.filter(pk__in=user_pks)
+
+    candidates = list(candidates.values_list('pk', flat=True))
+    for i in range(0, len(candidates), settings.MAIL_BATCH_SIZE):
+        send_expiration_notices.delay(*candidates[i:i + settings.MAIL_BATCH_SIZE])
+    return len(candidates)
+
+
+@shared_task
+def update_last_activity(random_update=50):
+    # Update some random users with recent activity so we have at least a vague picture of
+    # how recent users are active, all new users that were not used so far and users with more then
+    # 350 days of inactivity.
+    users = {u.pk: u for u in User.objects.order_by('?').not_expiring()[:random_update]}
+    users.update((u.pk, u) for u in User.objects.confirmed().new().unused())
+    expiring = {u.pk: u for u in User.objects.expiring()}
+    users.update(expiring)
+
+    synced, changed = sync_last_activity(list(users.values()))
+    notify_expiring_users([u.pk for u in synced if u.pk in expiring])
+
+    stats = {
+        'checked': len(users),
+        'changed': len(changed),
+        'skipped': len(users) - len(synced),
+    }
+    log.info('Checked last activity of %(checked)s users: %(changed)s changed, %(skipped)s skipped.',
+             stats)
+    return stats
+
+
+def remove_gone_users(hostname, dry_run=False, batch_size=1000):
+    """Remove users of the given host from the database that are gone from the XMPP server.
+
+    Users present in the backend are compared with local users as a set difference, only primary keys
+    and usernames of local users are loaded. Users are deleted in chunks of ``batch_size``, each chunk
+    in its own transaction, so that no lock is held for the whole run.
+
+    Parameters
+    ----------
+
+    hostname : str
+    dry_run : bool, optional
+        If ``True``, only report which users would be removed.
+    batch_size : int, optional
+        How many users to remove per transaction.
+
+    Returns
+    -------
+
+    list of str or None
+        Usernames of removed users or ``None`` if the host was skipped.
+    """
+    existing_users = set([u.lower() for u in xmpp_backend.all_users(hostname)])
+
+    if len(existing_users) < 50:
+        # A safety check if the backend for some reason does not return any users and does not
+        # raise an exception.
+        log.info('Skipping %s: Only %s users received.', hostname, len(existing_users))
+        return None
+
+    qs = User.objects.exclude(is_superuser=True).has_no_confirmations().host(hostname)
+    gone = [(pk, username) for pk, username in qs.values_list('pk', 'username')
+            if username.split('@', 1)[0].lower() not in existing_users]
+
+    if dry_run is True:
+        for pk, username in gone:
+            log.info('%s: Would remove user (gone from backend).', username)
+        return [username for pk, username in gone]
+
+    for i in range(0, len(gone), batch_size):
+        chunk = gone[i:i + batch_size]
+        with transaction.atomic():
+            User.objects.filter(pk__in=[pk for pk, username in chunk]).delete()
+
+        for pk, username in chunk:
+            log.info('%s: Remove user (gone from backend).', username)
+
+    return [username for pk, username in gone]
 
 
 @shared_task
-def cleanup():
-    UserLogEntry.objects.expired().delete()
-    Confirmation.objects.expired().delete()
+def cleanup(dry_run=False):
+    """Remove expired data and users that are gone from the XMPP server.
+
+    Parameters
+    ----------
+
+    dry_run : bool, optional
+        If ``True``, do not remove anything but only log and count users that would be removed.
+
+    Returns
+    -------
+
+    dict
+        Number of (to be) removed users per host.
+    """
+    if dry_run is False:
+        UserLogEntry.objects.expired().delete()
+        Confirmation.objects.expired().delete()
 
     # Remove users that are gone from the real XMPP server
+    report = {}
     for hostname in settings.XMPP_HOSTS:
-        existing_users = set([u.lower() for u in xmpp_backend.all_users(hostname)])
-
-        if len(existing_users) < 50:
-            # A safety check if the backend for some reason does not return any users and does not
-            # raise an exception.
-            log.info('Skipping %s: Only %s users received.', hostname, len(existing_users))
+        removed = remove_gone_users(hostname, dry_run=dry_run)
+        if removed is None:
             continue
 
-        count = 0
-        for user in User.objects.exclude(is_superuser=True).has_no_confirmations().host(hostname):
-            username = user.node.lower()
-            if username not in existing_users:
-                log.info('%s: Remove user (gone from backend).', user.username)
-                user.delete()
-                count += 1
+        report[hostname] = len(removed)
+        if dry_run is True:
+            log.info('%s: Would remove %s users.', hostname, len(removed))
+        else:
+            log.info('%s: Removed %s users.', hostname, len(removed))
 
-        log.info('%s: Removed %s users.', hostname, count)
+    return report
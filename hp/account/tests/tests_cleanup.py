@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the jabber.at homepage (https://github.com/jabber-at/hp).
+#
+# This project is free software: you can redistribute it and/or modify it under the terms of the
+# GNU General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This project is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this project. If
+# not, see <http://www.gnu.org/licenses/>.
+
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from xmpp_backends.django import xmpp_backend
+
+from core.tests.base import TestCase
+
+from ..tasks import cleanup
+from ..tasks import remove_gone_users
+
+User = get_user_model()
+
+DOMAIN = 'example.com'
+PWD = 'password123'
+
+
+class RemoveGoneUsersTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # users that exist in the backend (the task skips hosts with less then 50 users)
+        for i in range(50):
+            xmpp_backend.create_user('user%s' % i, DOMAIN, PWD)
+
+    def setUp(self):
+        super().setUp()
+
+        for i in range(5):
+            User.objects.create(username='user%s@%s' % (i, DOMAIN), email='user%s@example.net' % i)
+
+        # users that are gone from the backend
+        self.gone = ['gone%s@%s' % (i, DOMAIN) for i in range(5)]
+        for i, username in enumerate(self.gone):
+            User.objects.create(username=username, email='gone%s@example.net' % i)
+
+    def assertUsers(self, count):
+        self.assertEqual(User.objects.host(DOMAIN).count(), count)
+
+    def test_remove(self):
+        self.assertUsers(10)
+        self.assertCountEqual(remove_gone_users(DOMAIN, batch_size=2), self.gone)
+        self.assertUsers(5)
+        self.assertFalse(User.objects.filter(username__in=self.gone).exists())
+
+        # nothing left to remove
+        self.assertEqual(remove_gone_users(DOMAIN), [])
+        self.assertUsers(5)
+
+    def test_dry_run(self):
+        self.assertCountEqual(remove_gone_users(DOMAIN, dry_run=True), self.gone)
+        self.assertUsers(10)
+
+    def test_case_insensitive(self):
+        User.objects.filter(username='user0@%s' % DOMAIN).update(username='User0@%s' % DOMAIN)
+        self.assertCountEqual(remove_gone_users(DOMAIN), self.gone)
+        self.assertTrue(User.objects.filter(username='User0@%s' % DOMAIN).exists())
+
+    def test_skip(self):
+        self.assertIsNone(remove_gone_users('example.net'))
+
+    def test_cleanup(self):
+        self.assertEqual(cleanup(dry_run=True), {DOMAIN: 5})
+        self.assertUsers(10)
+        self.assertEqual(cleanup(), {DOMAIN: 5})
+        self.assertUsers(5)
+
+    def test_command(self):
+        stdout = StringIO()
+        call_command('remove_gone_users', DOMAIN, dry_run=True, stdout=stdout)
+        self.assertUsers(10)
+        self.assertEqual(stdout.getvalue().splitlines(),
+                         sorted(self.gone) + ['%s: Would remove 5 users.' % DOMAIN])
+
+        stdout = StringIO()
+        call_command('remove_gone_users', DOMAIN, batch_size=3, stdout=stdout)
+        self.assertUsers(5)
+        self.assertIn('%s: Removed 5 users.' % DOMAIN, stdout.getvalue())
+
+        with self.assertRaisesRegex(CommandError, r'^example\.invalid: Unknown host\.$'):
+            call_command('remove_gone_users', 'example.invalid', stdout=StringIO())
@@ -13,8 +13,12 @@
 # You should have received a copy of the GNU General Public License along with this project. If
 # not, see <http://www.gnu.org/licenses/>.
 
+import smtplib
+import threading
+import time
 from datetime import datetime
 from datetime import timedelta
+from unittest import mock
 
 import pytz
 from freezegun import freeze_time
@@ -25,8 +29,15 @@ from django.test import override_settings
 
 from xmpp_backends.django import xmpp_backend
 
+from core.mail import MailQueue
 from core.tests.base import TestCase
 
+from ..constants import PURPOSE_RESET_PASSWORD
+from ..models import Confirmation
+from ..tasks import notify_expiring_users
+from ..tasks import resend_confirmations
+from ..tasks import send_expiration_notices
+from ..tasks import sync_last_activity
 from ..tasks import update_last_activity
 
 User = get_user_model()
@@ -81,7 +92,7 @@ class AccountExpiresTestCase(TestCase):
             self.assertFalse(user.notifications.account_expires_notified)
             update_last_activity()
 
-        self.assertTaskCount(mocked, 0)
+        self.assertTaskCall(mocked, send_expiration_notices, user.pk)  # mail is sent in a subtask
         self.assertEqual(len(mail.outbox), 1)
         self.assertEqual(user.last_activity, LAST_ACTIVITY_2)  # last activity stays the same
 
@@ -122,3 +133,183 @@ class AccountExpiresTestCase(TestCase):
             self.assertFalse(user.is_expiring)
             self.assertTrue(user.notifications.account_expires)
             self.assertFalse(user.notifications.account_expires_notified)
+
+
+class NotifyExpiringUsersTestCase(TestCase):
+    @override_settings(ACCOUNT_EXPIRES_NOTIFICATION_DAYS=timedelta(days=355),
+                       ACCOUNT_EXPIRES_DAYS=timedelta(days=365), MAIL_BATCH_SIZE=1)
+    def test_notify(self):
+        ok = User.objects.create(username='ok@%s' % DOMAIN, email='ok@example.net',
+                                 last_activity=LAST_ACTIVITY_2, confirmed=LAST_ACTIVITY_2)
+        failed = User.objects.create(username='failed@%s' % DOMAIN, email='failed@example.net',
+                                     last_activity=LAST_ACTIVITY_2, confirmed=LAST_ACTIVITY_2)
+        unconfirmed = User.objects.create(username='unconfirmed@%s' % DOMAIN, email='unconfirmed@example.net',
+                                          last_activity=LAST_ACTIVITY_2)
+
+        def send(queue, message):
+            return message.to != ['failed@example.net']
+
+        with self.mock_celery() as mocked, freeze_time(NOW_2_STR), \
+                mock.patch.object(MailQueue, 'send', side_effect=send, autospec=True):
+            self.assertEqual(notify_expiring_users(), 2)
+
+        self.assertTaskCount(mocked, 2)  # one subtask per batch
+        self.assertTrue(User.objects.get(pk=ok.pk).notifications.account_expires_notified)
+        self.assertFalse(User.objects.get(pk=unconfirmed.pk).notifications.account_expires_notified)
+
+        # failed mails are sent again the next time
+        self.assertFalse(User.objects.get(pk=failed.pk).notifications.account_expires_notified)
+        with self.mock_celery() as mocked, freeze_time(NOW_2_STR):
+            self.assertEqual(notify_expiring_users(), 1)
+        self.assertTaskCall(mocked, send_expiration_notices, failed.pk)
+        self.assertEqual(mail.outbox[0].to, ['failed@example.net'])
+
+    @override_settings(ACCOUNT_EXPIRES_NOTIFICATION_DAYS=timedelta(days=355),
+                       ACCOUNT_EXPIRES_DAYS=timedelta(days=365))
+    def test_exception(self):
+        users = [User.objects.create(username='user%s@%s' % (i, DOMAIN), email='user%s@example.net' % i,
+                                     last_activity=LAST_ACTIVITY_2, confirmed=LAST_ACTIVITY_2)
+                 for i in range(3)]
+        send_mail = User.send_mail
+
+        def side_effect(user, *args, **kwargs):
+            if user.email == 'user1@example.net':
+                raise ValueError('broken key')
+            return send_mail(user, *args, **kwargs)
+
+        with self.mock_celery(), freeze_time(NOW_2_STR), self.assertRaises(ValueError), \
+                mock.patch.object(User, 'send_mail', side_effect=side_effect, autospec=True):
+            notify_expiring_users()
+
+        # Only users that received a mail are marked as notified, the others are notified the next time
+        received = {addr for message in mail.outbox for addr in message.to}
+        self.assertNotIn('user1@example.net', received)
+        for user in users:
+            user = User.objects.get(pk=user.pk)
+            self.assertEqual(user.notifications.account_expires_notified, user.email in received)
+
+        with self.mock_celery(), freeze_time(NOW_2_STR):
+            self.assertEqual(notify_expiring_users(), 3 - len(received))
+
+    @override_settings(ACCOUNT_EXPIRES_NOTIFICATION_DAYS=timedelta(days=355),
+                       ACCOUNT_EXPIRES_DAYS=timedelta(days=365), MAIL_BATCH_SIZE=1)
+    def test_publish_failed(self):
+        users = [User.objects.create(username='user%s@%s' % (i, DOMAIN), email='user%s@example.net' % i,
+                                     last_activity=LAST_ACTIVITY_2, confirmed=LAST_ACTIVITY_2)
+                 for i in range(3)]
+
+        # the broker becomes unreachable after the first subtask was started
+        def run(task, args, kwargs):
+            if mocked.call_count > 1:
+                raise ConnectionError('broker unreachable')
+            return task.run(*args, **kwargs)
+
+        with freeze_time(NOW_2_STR), self.assertRaises(ConnectionError), \
+                mock.patch('celery.app.task.Task.apply_async', side_effect=run, autospec=True) as mocked:
+            notify_expiring_users()
+
+        # only users of the started subtask are marked as notified
+        self.assertEqual([m.to for m in mail.outbox], [['user0@example.net']])
+        notified = [User.objects.get(pk=u.pk).notifications.account_expires_notified for u in users]
+        self.assertEqual(notified, [True, False, False])
+
+        with self.mock_celery(), freeze_time(NOW_2_STR):
+            self.assertEqual(notify_expiring_users(), 2)
+        self.assertEqual(len(mail.outbox), 3)
+
+    @override_settings(ACCOUNT_EXPIRES_NOTIFICATION_DAYS=timedelta(days=355),
+                       ACCOUNT_EXPIRES_DAYS=timedelta(days=365))
+    def test_claimed(self):
+        user = User.objects.create(username=JID, email=EMAIL, last_activity=LAST_ACTIVITY_2,
+                                   confirmed=LAST_ACTIVITY_2)
+
+        # a user passed to two subtasks is notified only once
+        with freeze_time(NOW_2_STR):
+            send_expiration_notices(user.pk)
+            send_expiration_notices(user.pk)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertTrue(User.objects.get(pk=user.pk).notifications.account_expires_notified)
+
+
+class UpdateLastActivityTestCase(TestCase):
+    def test_stats(self):
+        User.objects.create(username=JID, email=EMAIL, created_in_backend=True,
+                            last_activity=LAST_ACTIVITY_1, confirmed=LAST_ACTIVITY_1)
+        User.objects.create(username='gone@%s' % DOMAIN, email=EMAIL, created_in_backend=True,
+                            last_activity=LAST_ACTIVITY_1, confirmed=LAST_ACTIVITY_1)
+        xmpp_backend.create_user(NODE, DOMAIN, PWD)
+        xmpp_backend.set_last_activity(NODE, DOMAIN, timestamp=LAST_ACTIVITY_2)
+
+        with freeze_time(NOW_1_STR):
+            stats = update_last_activity()
+        self.assertEqual(stats, {'checked': 2, 'changed': 1, 'skipped': 1})
+        self.assertEqual(User.objects.get(username=JID).last_activity, LAST_ACTIVITY_2)
+
+        # Second run does not change anything
+        with freeze_time(NOW_1_STR):
+            stats = update_last_activity()
+        self.assertEqual(stats, {'checked': 2, 'changed': 0, 'skipped': 1})
+
+    def test_sync_concurrent(self):
+        users = [User.objects.create(username='user%s@%s' % (i, DOMAIN), email='user%s@example.net' % i,
+                                     last_activity=LAST_ACTIVITY_1) for i in range(4)]
+        activities = {
+            'user0': LAST_ACTIVITY_2,
+            'user1': LAST_ACTIVITY_1,  # unchanged
+            'user2': None,  # skipped
+            'user3': NOW_1,
+        }
+        barrier = threading.Barrier(4, timeout=5)
+
+        def get_last_activity(node, domain):
+            barrier.wait()  # all users are queried at the same time
+            if node == 'user0':
+                time.sleep(0.1)  # first user finishes last
+            if activities[node] is None:
+                return None
+            return activities[node].replace(tzinfo=None)
+
+        backend = mock.Mock()
+        backend.get_last_activity.side_effect = get_last_activity
+        with mock.patch('account.tasks.xmpp_backend', new=backend), self.assertNumQueries(1):
+            synced, changed = sync_last_activity(users, workers=4)
+
+        self.assertEqual(synced, [users[0], users[1], users[3]])
+        self.assertEqual(changed, [users[0], users[3]])
+        self.assertEqual(backend.get_last_activity.call_count, 4)
+        for user in users:
+            expected = activities[user.node] or LAST_ACTIVITY_1
+            self.assertEqual(user.last_activity, expected)
+            self.assertEqual(User.objects.get(pk=user.pk).last_activity, expected)
+
+
+class ResendConfirmationsTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.confs = []
+        for i in range(3):
+            user = User.objects.create(username='user%s@%s' % (i, DOMAIN), email='user%s@example.net' % i)
+            self.confs.append(Confirmation.objects.create(
+                user=user, purpose=PURPOSE_RESET_PASSWORD, language='en', to=user.email,
+                payload={'hostname': DOMAIN, 'base_url': 'https://example.com'}))
+
+    def test_resend(self):
+        resend_confirmations(*[c.pk for c in self.confs])
+        self.assertCountEqual([m.to for m in mail.outbox],
+                              [['user0@example.net'], ['user1@example.net'], ['user2@example.net']])
+
+    def test_failed(self):
+        send = MailQueue.send
+
+        def send_or_fail(queue, message):
+            if message.to == ['user1@example.net']:
+                return False
+            return send(queue, message)
+
+        with mock.patch.object(MailQueue, 'send', autospec=True, side_effect=send_or_fail):
+            with self.assertRaisesRegex(smtplib.SMTPException,
+                                        r'^Could not send confirmations to user1@example\.net\.$'):
+                resend_confirmations(*[c.pk for c in self.confs])
+
+        # other confirmations were still sent
+        self.assertCountEqual([m.to for m in mail.outbox], [['user0@example.net'], ['user2@example.net']])
@@ -15,6 +15,10 @@
 
 from django.conf import settings
 from django.db import models
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_save
+from django.dispatch import receiver
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
@@ -24,6 +28,7 @@ from .managers import BlockedEmailManager
 from .managers import BlockedIpAddressManager
 from .querysets import BlockedEmailQuerySet
 from .querysets import BlockedQuerySet
+from .utils import invalidate_ip_blacklist
 
 
 def _default_email_expires():
@@ -71,3 +76,10 @@ class BlockedIpAddress(BlockedMixin, BaseModel):
     class Meta:
         verbose_name = _('Blocked IP address')
         verbose_name_plural = _('Blocked IP addresses')
+
+
+@receiver(post_save, sender=BlockedIpAddress)
+@receiver(post_delete, sender=BlockedIpAddress)
+def blocked_ip_address_changed(sender, **kwargs):
+    # Invalidate only after commit, otherwise other processes might load the old data again
+    transaction.on_commit(invalidate_ip_blacklist)
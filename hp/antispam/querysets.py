@@ -21,8 +21,14 @@ from .utils import normalize_email
 
 
 class BlockedQuerySet(models.QuerySet):
+    def active(self, now=None):
+        """Blocks that are currently in effect."""
+        if now is None:
+            now = timezone.now()
+        return self.filter(Q(expires__isnull=True) | Q(expires__gt=now))
+
     def is_blocked(self, address):
-        return self.filter(Q(expires__isnull=True) | Q(expires__gt=timezone.now()), address=address).exists()
+        return self.active().filter(address=address).exists()
 
 
 class BlockedEmailQuerySet(BlockedQuerySet):
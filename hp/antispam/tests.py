@@ -1,3 +1,89 @@
-from django.test import TestCase  # NOQA
+# -*- coding: utf-8 -*-
+#
+# This file is part of the jabber.at homepage (https://github.com/jabber-at/hp).
+#
+# This project is free software: you can redistribute it and/or modify it under the terms of the
+# GNU General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This project is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this project.
+# If not, see <http://www.gnu.org/licenses/>.
 
-# Create your tests here.
+import ipaddress
+from datetime import timedelta
+
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.test import override_settings
+from django.utils import timezone
+
+from core.tests.base import TestCase
+
+from .models import BlockedIpAddress
+from .utils import IpBlacklist
+from .utils import NetworkIndex
+from .utils import get_ip_blacklist
+from .utils import invalidate_ip_blacklist
+
+
+@receiver(setting_changed)
+def spam_blacklist_changed(sender, setting, **kwargs):
+    if setting == 'SPAM_BLACKLIST':
+        invalidate_ip_blacklist()
+
+
+class NetworkIndexTests(TestCase):
+    def test_basic(self):
+        index = NetworkIndex()
+        index.add('192.0.2.0/24', 'a')
+        index.add('198.51.100.7', 'b')
+        index.add('2001:db8::/32', 'c')
+
+        self.assertEqual(index.get('192.0.2.0'), 'a')
+        self.assertEqual(index.get('192.0.2.255'), 'a')
+        self.assertEqual(index.get(ipaddress.ip_address('198.51.100.7')), 'b')
+        self.assertEqual(index.get('2001:db8:1::1'), 'c')
+        self.assertIsNone(index.get('192.0.3.1'))
+        self.assertIsNone(index.get('198.51.100.8'))
+        self.assertIsNone(index.get('2001:db9::1'))
+        self.assertEqual(index.get('2001:db9::1', 'default'), 'default')
+
+
+class IpBlacklistTests(TestCase):
+    def test_basic(self):
+        now = timezone.now()
+        bl = IpBlacklist(['192.0.2.0/24'], [
+            ('198.51.100.1', None),
+            ('198.51.100.2', now + timedelta(days=1)),
+            ('198.51.100.3', now - timedelta(days=1)),
+        ])
+
+        self.assertTrue(bl.is_blacklisted('192.0.2.1'))
+        self.assertFalse(bl.is_blacklisted('198.51.100.1'))
+        self.assertTrue(bl.is_blocked('198.51.100.1'))
+        self.assertTrue(bl.is_blocked('198.51.100.2'))
+        self.assertFalse(bl.is_blocked('198.51.100.3'))
+        self.assertFalse(bl.is_blocked('192.0.2.1'))
+
+    def test_invalidation(self):
+        self.assertFalse(get_ip_blacklist().is_blocked('198.51.100.1'))
+        with self.captureOnCommitCallbacks() as callbacks:
+            obj = BlockedIpAddress.objects.block('198.51.100.1')
+        self.assertEqual(callbacks, [invalidate_ip_blacklist])
+
+        # The blacklist is only invalidated once the transaction is committed
+        self.assertFalse(get_ip_blacklist().is_blocked('198.51.100.1'))
+        callbacks[0]()
+        self.assertTrue(get_ip_blacklist().is_blocked('198.51.100.1'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            obj.delete()
+        self.assertFalse(get_ip_blacklist().is_blocked('198.51.100.1'))
+
+        with override_settings(SPAM_BLACKLIST=set([ipaddress.ip_network('192.0.2.0/24')])):
+            self.assertTrue(get_ip_blacklist().is_blacklisted('192.0.2.1'))
+        self.assertFalse(get_ip_blacklist().is_blacklisted('192.0.2.1'))
@@ -13,7 +13,18 @@
 # You should have received a copy of the GNU General Public License along with this project.
 # If not, see <http://www.gnu.org/licenses/>.
 
+import ipaddress
+
+from django.conf import settings
+from django.utils import timezone
+
+from core.utils import bump_cache_version
+from core.utils import get_cache_version
+
 GMAIL_DOMAINS = set(['google.com', 'googlemail.com', 'gmail.com'])
+BLACKLIST_VERSION_CACHE_KEY = 'antispam_ip_blacklist_version'
+_missing = object()
+_blacklist = None
 
 
 def normalize_email(value):
@@ -25,3 +36,102 @@ def normalize_email(value):
         local = local.replace('.', '')
 
     return '%s@%s' % (local, domain)
+
+
+class NetworkIndex(object):
+    """An index of IPv4 and IPv6 networks for fast lookups of single addresses.
+
+    Networks are stored as integers of their network prefix, grouped by IP version and prefix length.
+    A lookup thus costs one dictionary lookup per distinct prefix length, regardless of the number of
+    networks in the index.
+
+    >>> index = NetworkIndex()
+    >>> index.add('192.0.2.0/24', 'foo')
+    >>> index.get('192.0.2.1')
+    'foo'
+    >>> index.get('198.51.100.1') is None
+    True
+    """
+
+    def __init__(self):
+        self._networks = {4: {}, 6: {}}
+
+    def add(self, network, value=True):
+        network = ipaddress.ip_network(network, strict=False)
+        shift = network.max_prefixlen - network.prefixlen
+        networks = self._networks[network.version].setdefault(network.prefixlen, {})
+        networks[int(network.network_address) >> shift] = value
+
+    def get(self, address, default=None):
+        if not isinstance(address, (ipaddress.IPv4Address, ipaddress.IPv6Address)):
+            address = ipaddress.ip_address(address)
+
+        value = int(address)
+        for prefixlen, networks in self._networks[address.version].items():
+            found = networks.get(value >> (address.max_prefixlen - prefixlen), _missing)
+            if found is not _missing:
+                return found
+        return default
+
+
+class IpBlacklist(object):
+    """Blacklisted networks (settings.SPAM_BLACKLIST) and blocked IP addresses (BlockedIpAddress).
+
+    Parameters
+    ----------
+
+    networks : list
+        List of blacklisted networks.
+    blocked : list
+        List of two-tuples of blocked addresses and when the block expires (``None`` if it never
+        expires).
+    """
+
+    def __init__(self, networks, blocked):
+        self.networks = NetworkIndex()
+        for network in networks:
+            self.networks.add(network)
+
+        self.blocked = NetworkIndex()
+        for address, expires in blocked:
+            self.blocked.add(address, expires)
+
+    def is_blacklisted(self, address):
+        return self.networks.get(address, False)
+
+    def is_blocked(self, address, now=None):
+        expires = self.blocked.get(address, _missing)
+        if expires is _missing:
+            return False
+        if expires is None:
+            return True
+
+        if now is None:
+            now = timezone.now()
+        return expires > now
+
+
+def get_ip_blacklist():
+    """Get the current :py:class:`~antispam.utils.IpBlacklist`.
+
+    The blacklist is loaded once per process and reloaded only if the version stored in the cache
+    changes, which happens when a ``BlockedIpAddress`` is saved or deleted.
+    """
+    global _blacklist
+
+    from .models import BlockedIpAddress
+
+    version = get_cache_version(BLACKLIST_VERSION_CACHE_KEY)
+    if _blacklist is None or _blacklist[0] != version:
+        blocked = BlockedIpAddress.objects.active().values_list('address', 'expires')
+        _blacklist = version, IpBlacklist(getattr(settings, 'SPAM_BLACKLIST', set()), blocked)
+
+    return _blacklist[1]
+
+
+def invalidate_ip_blacklist():
+    """Force all processes to reload the blacklist with the next call of ``get_ip_blacklist()``."""
+    global _blacklist
+
+    _blacklist = None
+    bump_cache_version(BLACKLIST_VERSION_CACHE_KEY)
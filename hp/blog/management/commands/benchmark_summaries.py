@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the jabber.at homepage (https://github.com/jabber-at/hp).
+#
+# This project is free software: you can redistribute it and/or modify it under the terms of the GNU General
+# Public License as published by the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This project is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License along with this project. If not, see
+# <http://www.gnu.org/licenses/>.
+
+import re
+import timeit
+
+from lxml import html
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ...models import BlogPost
+from ...models import Page
+from ...utils import crop_sentences
+from ...utils import get_sentences
+
+
+def get_sentences_regex(summary):
+    """The previous implementation of get_sentences(), compiling the regex on every call."""
+
+    return ['%s.' % m.strip(' .:') for m in re.split(r'(?<![.0-9])[:.](?=([ <]|\Z))', summary)]
+
+
+def crop_summary_concat(summary, length):
+    """The previous implementation of crop_summary(), splitting the text for every length."""
+
+    sentences = get_sentences_regex(summary)
+    summary = ''
+    for sentence in sentences:
+        new_summary = '%s %s.' % (summary, sentence)
+        if len(new_summary) > length:
+            return summary or new_summary
+        summary = new_summary
+    return summary.strip()
+
+
+def summaries_concat(text):
+    return [crop_summary_concat(text, 160), crop_summary_concat(text, 200),
+            ' '.join(get_sentences_regex(text)[:3])]
+
+
+def summaries_single_pass(text):
+    sentences = get_sentences(text)
+    return crop_sentences(sentences, [160, 200]) + [' '.join(sentences[:3])]
+
+
+class Command(BaseCommand):
+    help = 'Compare the speed of cropping summaries with the previous implementation.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-n', '--number', type=int, default=100, metavar='N',
+                            help='Process every text N times (default: %(default)s).')
+
+    def get_texts(self):
+        """Get the plain text of all blog posts and pages in all languages."""
+
+        texts = []
+        for model in [BlogPost, Page]:
+            fields = ['text_%s' % lang for lang, _name in settings.LANGUAGES]
+            for row in model.objects.values_list(*fields):
+                texts += [html.fromstring(t).text_content() for t in row if t]
+        return texts
+
+    def handle(self, *args, **options):
+        texts = self.get_texts()
+        if not texts:
+            self.stdout.write(self.style.WARNING('No blog posts or pages found.'))
+            return
+
+        number = options['number']
+        size = sum(len(t) for t in texts) / 1024
+        self.stdout.write('Processing %s texts (%.1f KB) %s times...' % (len(texts), size, number))
+
+        timings = {}
+        for func in [summaries_concat, summaries_single_pass]:
+            timings[func] = timeit.timeit(lambda: [func(t) for t in texts], number=number)
+            self.stdout.write('%s: %.3f seconds (%.3f ms per text)' % (
+                func.__name__, timings[func], timings[func] * 1000 / number / len(texts)))
+
+        self.stdout.write('Speedup: %.1fx' % (timings[summaries_concat] / timings[summaries_single_pass]))
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the jabber.at homepage (https://github.com/jabber-at/hp).
+#
+# This project is free software: you can redistribute it and/or modify it under the terms of the GNU General
+# Public License as published by the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This project is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License along with this project. If not, see
+# <http://www.gnu.org/licenses/>.
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.utils import translation
+
+from core.menu import get_menu
+
+from ...models import BlogPost
+from ...models import Page
+
+
+class Command(BaseCommand):
+    help = 'Render and store summaries of all blog posts and pages in all languages and for all sites.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', default=False,
+                            help='Render summaries again even if they are already stored.')
+
+    def get_request(self, site, lang):
+        """Get a request as it would be returned by the middlewares used by this project."""
+
+        request = RequestFactory().get('/', HTTP_HOST=site['NAME'])
+        request.site = site
+        request.user = AnonymousUser()
+        request.LANGUAGE_CODE = lang
+        request.os = 'any'
+        request.os_mobile = True
+        request.hp_request_context = {
+            'menu': get_menu(),
+        }
+        return request
+
+    def handle(self, *args, **options):
+        for model in [Page, BlogPost]:
+            objects = list(model.objects.all())
+            for obj in objects:
+                if options['force']:
+                    obj.summaries = {}
+
+                for lang, _name in settings.LANGUAGES:
+                    with translation.override(lang):
+                        for site in settings.XMPP_HOSTS.values():
+                            obj.get_summaries(self.get_request(site, lang))
+
+            name = model._meta.verbose_name_plural
+            self.stdout.write('Rendered summaries for %s %s.' % (len(objects), name))
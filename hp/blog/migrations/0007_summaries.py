@@ -0,0 +1,25 @@
+# Generated by Django 3.1.6 on 2026-10-18 20:25
+
+import blog.models
+from django.db import migrations
+import jsonfield.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0006_auto_20161224_1021'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blogpost',
+            name='summaries',
+            field=jsonfield.fields.JSONField(blank=True, default=blog.models._default_summaries, editable=False),
+        ),
+        migrations.AddField(
+            model_name='page',
+            name='summaries',
+            field=jsonfield.fields.JSONField(blank=True, default=blog.models._default_summaries, editable=False),
+        ),
+    ]
@@ -23,18 +23,36 @@ from django.conf import settings
 from django.core.files.storage import FileSystemStorage
 from django.core.files.storage import default_storage
 from django.db import models
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_save
+from django.dispatch import receiver
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.safestring import mark_safe
+from django.utils.translation import get_language
 from django.utils.translation import gettext_lazy as _
 
+from jsonfield import JSONField
+
 from core.modelfields import LocalizedCharField
 from core.modelfields import LocalizedTextField
 from core.models import BaseModel
+from core.utils import FEED_VERSION_CACHE_KEY
+from core.utils import MENU_VERSION_CACHE_KEY
+from core.utils import RESPONSE_CACHE_VERSION_CACHE_KEY
+from core.utils import SITEMAP_VERSION_CACHE_KEY
+from core.utils import bump_cache_versions_on_commit
 from core.utils import canonical_link
+from core.utils import get_cache_version
 
 from .querysets import BlogPostQuerySet
 from .querysets import PageQuerySet
+from .utils import LINKS_VERSION_CACHE_KEY
+from .utils import compile_template
+from .utils import crop_sentences
+from .utils import get_sentences
+from .utils import template_cache
 
 if settings.BLOG_MEDIA_ROOT:
     fs = FileSystemStorage(location=settings.BLOG_MEDIA_ROOT, base_url=settings.BLOG_MEDIA_URL)
@@ -42,6 +60,10 @@ else:
     fs = default_storage
 
 
+def _default_summaries():
+    return {}
+
+
 class BasePage(BaseModel):
     objects = PageQuerySet.as_manager()
 
@@ -64,20 +86,37 @@ class BasePage(BaseModel):
     html_summary = LocalizedTextField(blank=True, null=True, verbose_name="HTML", help_text=_(
         'Any length, but must be valid HTML. Shown in RSS feeds.'))
 
-    def render_template(self, text, request, extra_context=None):
+    # Rendered summaries by language and site, see get_summaries()
+    summaries = JSONField(default=_default_summaries, blank=True, editable=False)
+
+    def get_template(self, text, field):
+        """Get the compiled template for the given text of a field in the current language.
+
+        Templates are cached per page, language, field and modification time, so unchanged pages are
+        parsed only once per process.
+        """
+        if self.pk is None:  # e.g. previews of unsaved pages
+            return compile_template(text)
+
+        key = (self._meta.label, self.pk, get_language(), field, self.updated)
+        return template_cache.get(key, text)
+
+    def render_template(self, text, request, extra_context=None, field=None):
         if extra_context is None:
             extra_context = {}
         context = template.RequestContext(request, extra_context)
 
-        t = '{%% load blog core icons %%}%s' % text
-        return template.Template(t).render(context)
+        if field is None:
+            tmpl = compile_template(text)
+        else:
+            tmpl = self.get_template(text, field)
+        return tmpl.render(context)
 
     def render(self, context, summary=False):
         if summary is True:
             return mark_safe(self.get_html_summary(context['request']))
         else:
-            t = '{%% load blog core icons %%}%s' % self.text.current
-            return template.Template(t).render(context)
+            return self.get_template(self.text.current, 'text').render(context)
 
     def render_from_request(self, request, extra_context=None):
         if extra_context is None:
@@ -87,62 +126,25 @@ class BasePage(BaseModel):
         return self.render(context)
 
     def get_text_summary(self, request):
-        rendered = self.render_template(self.text.current, request)
+        rendered = self.render_template(self.text.current, request, field='text')
         text = html.fromstring(rendered).text_content()
         return re.sub('[\r\n]+', '\n', text).split('\n', 1)[0].strip(' \n').strip()
 
     def get_sentences(self, summary):
-        """Split a text into sentences.
-
-        At the most basic level, this function splits the given text on occurence of a dot (".")
-        and one or more spaces. A semicolon is recognized as a sentence, so "foo: bar." counts as
-        two sentences and the semicolon will not be preserved. A dot does not count as a sentence
-        if it is preceeded by a number ("16. February") and only if followed by a space, a "<" (for
-        HTML tags) or as end of string.
-        """
-        return ['%s.' % m.strip(' .:') for m in re.split(r'(?<![.0-9])[:.](?=([ <]|\Z))', summary)]
+        """Split a text into sentences, see :py:func:`~blog.utils.get_sentences`."""
+        return get_sentences(summary)
 
     def crop_summary(self, summary, length):
-        sentences = self.get_sentences(summary)
-        summary = ''
-        for sentence in sentences:
-            new_summary = '%s %s.' % (summary, sentence)
-            if len(new_summary) > length:
-                # If summary is currently Falsy, we return new_summary instead. This happens when
-                # the first sentence is already longer then 160 chars.
-                return summary or new_summary
-            summary = new_summary
-        return summary.strip()
+        return crop_sentences(get_sentences(summary), [length])[0]
 
     def get_meta_summary(self, request):
-        if self.meta_summary.current:
-            return self.render_template(self.meta_summary.current, request)
-
-        full_summary = self.get_text_summary(request)
-        if len(full_summary) <= 160:
-            return full_summary
-        return self.crop_summary(full_summary, 160).strip()
+        return self.get_summaries(request)['meta']
 
     def get_twitter_summary(self, request):
-        if self.twitter_summary.current:
-            return self.render_template(self.twitter_summary.current, request)
-        if self.meta_summary.current:
-            return self.render_template(self.meta_summary.current, request)
-
-        full_summary = self.get_text_summary(request)
-        if len(full_summary) <= 200:
-            return full_summary
-        return self.crop_summary(full_summary, 200).strip()
+        return self.get_summaries(request)['twitter']
 
     def get_opengraph_summary(self, request):
-        if self.opengraph_summary.current:
-            return self.render_template(self.opengraph_summary.current.strip(), request)
-        twitter_summary = self.get_twitter_summary(request)
-        if twitter_summary:
-            return twitter_summary
-
-        summary = self.get_text_summary(request)
-        return ' '.join(self.get_sentences(summary)[:3]).strip()
+        return self.get_summaries(request)['opengraph']
 
     def cleanup_html(self, html):
         """Cleanup HTML for HTML summaries (e.g. RSS feeds)."""
@@ -154,13 +156,110 @@ class BasePage(BaseModel):
         return bleach.clean(html, tags=tags, attributes=attrs, strip=True)
 
     def get_html_summary(self, request):
+        return self.get_summaries(request)['html']
+
+    def render_summaries(self, request):
+        """Render all summaries in the current language, see :py:meth:`get_summaries`."""
+
+        text_summary = self.get_text_summary(request)
+
+        # split the text only once and crop it to all lengths in a single pass
+        sentences = get_sentences(text_summary)
+        meta_crop, twitter_crop = crop_sentences(sentences, [160, 200])
+
+        if self.meta_summary.current:
+            meta = self.render_template(self.meta_summary.current, request, field='meta_summary')
+        elif len(text_summary) <= 160:
+            meta = text_summary
+        else:
+            meta = meta_crop
+
+        if self.twitter_summary.current:
+            twitter = self.render_template(self.twitter_summary.current, request, field='twitter_summary')
+        elif self.meta_summary.current:
+            twitter = meta
+        elif len(text_summary) <= 200:
+            twitter = text_summary
+        else:
+            twitter = twitter_crop
+
+        if self.opengraph_summary.current:
+            opengraph = self.render_template(self.opengraph_summary.current.strip(), request,
+                                             field='opengraph_summary')
+        elif twitter:
+            opengraph = twitter
+        else:
+            opengraph = ' '.join(sentences[:3])
+
         if self.html_summary.current:
-            return self.cleanup_html(self.html_summary.current)
+            html_summary = self.cleanup_html(self.html_summary.current)
+        else:
+            summary = self.render_from_request(request)
+            html_summary = self.cleanup_html(' '.join(get_sentences(summary)[:3]).strip())
+
+        return {
+            'meta': meta,
+            'twitter': twitter,
+            'opengraph': opengraph,
+            'html': html_summary,
+        }
+
+    def get_stored_summaries(self, lang, site, version):
+        """Get the summaries stored for the given language and site or ``None`` if they are outdated.
+
+        ``version`` is the current version of links in pages, see :py:meth:`get_summaries`.
+        """
+
+        summaries = self.summaries.get(lang, {}).get(site)
+        if summaries is not None and summaries.get('version') == version:
+            return summaries
+
+    def get_summaries(self, request):
+        """Get all summaries in the current language for the site of the given request.
+
+        Summaries require rendering the whole text of the page, so they are rendered only once and
+        stored in the database. Stored summaries are removed whenever the page is saved. Since summaries
+        may contain links to other pages, they are also outdated whenever any page is saved or deleted.
+        """
+
+        lang = get_language()
+        site = request.site['NAME']
+        version = get_cache_version(LINKS_VERSION_CACHE_KEY)
+
+        summaries = self.get_stored_summaries(lang, site, version)
+        if summaries is None:
+            summaries = self.render_summaries(request)
+            summaries['version'] = version
+            self.summaries.setdefault(lang, {})[site] = summaries
+
+            if self.pk is not None:
+                self.store_summaries(lang, site, summaries)
 
-        summary = self.render_from_request(request)
+        return summaries
+
+    def store_summaries(self, lang, site, summaries):
+        """Store rendered summaries in the database.
+
+        The summaries are merged with the summaries currently stored in the database, which may have been
+        rendered concurrently (e.g. in a different language). Nothing is stored if the page was saved in the
+        meantime or if the summaries are already outdated.
+        """
 
-        html = ' '.join(self.get_sentences(summary)[:3]).strip()
-        return self.cleanup_html(html)
+        manager = type(self)._default_manager
+        with transaction.atomic():
+            stored = manager.select_for_update().filter(pk=self.pk, updated=self.updated).values_list(
+                'summaries', flat=True).first()
+            if stored is None or summaries['version'] != get_cache_version(LINKS_VERSION_CACHE_KEY):
+                return
+
+            stored.setdefault(lang, {})[site] = summaries
+
+            # use update() so that the modification time of the page does not change
+            manager.filter(pk=self.pk).update(summaries=stored)
+
+    def save(self, *args, **kwargs):
+        self.summaries = {}  # summaries are rendered again the next time they are needed
+        super().save(*args, **kwargs)
 
     def get_canonical_url(self):
         """Get the full canonical URL of this object."""
@@ -204,3 +303,18 @@ class Image(BaseModel):
 
     def __str__(self):
         return self.name
+
+
+@receiver(post_save, sender=Page)
+@receiver(post_delete, sender=Page)
+@receiver(post_save, sender=BlogPost)
+@receiver(post_delete, sender=BlogPost)
+def page_changed(sender, instance, **kwargs):
+    # The menu and links in other pages depend on titles and slugs
+    keys = [MENU_VERSION_CACHE_KEY, LINKS_VERSION_CACHE_KEY, RESPONSE_CACHE_VERSION_CACHE_KEY,
+            SITEMAP_VERSION_CACHE_KEY]
+    if sender == BlogPost:
+        keys.append(FEED_VERSION_CACHE_KEY)
+    bump_cache_versions_on_commit(*keys)
+
+    template_cache.invalidate(sender._meta.label, instance.pk)
@@ -16,18 +16,32 @@
 from django.conf import settings
 from django.db import models
 from django.utils import timezone
+from django.utils.translation import get_language
+
+from .utils import get_link_index
 
 
 class BasePageQuerySet(models.QuerySet):
+    # fields required to display a summary (in addition to title and slug), see listing()
+    listing_fields = ['created', 'updated', 'published', 'summaries']
+
     def slug(self, slug):
-        """Filters for a given slug in any language."""
+        """Filters for a given slug in any language.
 
-        query = None
+        The slug is resolved using :py:class:`~blog.utils.LinkIndex`, the slug fields are filtered as well
+        in case the index is stale (e.g. because another process rebuilt the index just before a slug was
+        changed). If no object matches both, the slug fields are queried without the index.
+        """
+
+        query = models.Q()
         for lang, _name in settings.LANGUAGES:
-            if query is None:
-                query = models.Q(**{'slug_%s' % lang: slug})
-            else:
-                query |= models.Q(**{'slug_%s' % lang: slug})
+            query |= models.Q(**{'slug_%s' % lang: slug})
+
+        pks = get_link_index(self.model).get_pks(slug)
+        if pks:
+            indexed = self.filter(query, pk__in=pks)
+            if indexed.exists():
+                return indexed
 
         return self.filter(query)
 
@@ -38,17 +52,31 @@ class BasePageQuerySet(models.QuerySet):
         else:
             return self.slug(val).get()
 
+    def listing(self):
+        """Load only the fields required to display summaries in the current language.
+
+        Summaries are displayed from the stored summaries (see
+        :py:meth:`~blog.models.BasePage.get_summaries`), so text and summary fields are not loaded.
+        """
+        lang = get_language()
+        return self.only(*self.listing_fields, 'title_%s' % lang, 'slug_%s' % lang)
+
 
 class PageQuerySet(BasePageQuerySet):
     pass
 
 
 class BlogPostQuerySet(BasePageQuerySet):
+    listing_fields = BasePageQuerySet.listing_fields + ['publication_date', 'author', 'author__username']
+
     def published(self, now=None):
         if now is None:
             now = timezone.now()
 
         return self.filter(published=True, publication_date__lt=now)
 
+    def listing(self):
+        return super().listing().select_related('author')
+
     def blog_order(self):
         return self.order_by('-sticky', '-created')
@@ -13,6 +13,7 @@
 # You should have received a copy of the GNU General Public License along with this project. If
 # not, see <http://www.gnu.org/licenses/>.
 
+from django.conf import settings
 from django.contrib.sitemaps import Sitemap
 
 from core.sitemaps import SitemapMixin
@@ -22,15 +23,20 @@ from .models import Page
 
 
 class BasePageSitemap(Sitemap):
+    def get_fields(self):
+        """Only the fields required to generate the URL and lastmod are loaded from the database."""
+
+        return ['updated'] + ['slug_%s' % code for code, _name in settings.LANGUAGES]
+
     def lastmod(self, item):
         return item.updated
 
 
 class BlogPostSitemap(SitemapMixin, BasePageSitemap):
     def items(self):
-        return BlogPost.objects.filter(published=True)
+        return BlogPost.objects.filter(published=True).only(*self.get_fields()).order_by('pk')
 
 
 class PageSitemap(SitemapMixin, BasePageSitemap):
     def items(self):
-        return Page.objects.filter(published=True)
+        return Page.objects.filter(published=True).only(*self.get_fields()).order_by('pk')
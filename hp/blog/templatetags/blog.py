@@ -21,6 +21,7 @@ from core.utils import format_link
 
 from ..models import BlogPost
 from ..models import Page
+from ..utils import get_link_index
 
 log = logging.getLogger(__name__)
 register = template.Library()
@@ -42,7 +43,7 @@ def page_url(pk_or_slug, quiet=True):
     """
 
     try:
-        page = Page.objects.pk_or_slug(pk_or_slug)
+        page = get_link_index(Page).pk_or_slug(pk_or_slug)
     except Page.DoesNotExist:
         if quiet is False:
             raise
@@ -81,7 +82,7 @@ def page(context, pk, text=None, anchor=None, **attrs):
     """
 
     try:
-        page = Page.objects.pk_or_slug(pk)
+        page = get_link_index(Page).pk_or_slug(pk)
     except Page.DoesNotExist:
         log.error('%s: Page %s does not exist.', context['request'].path, pk)
         return text or ''
@@ -93,7 +94,7 @@ def page(context, pk, text=None, anchor=None, **attrs):
         text = attrs['title']
         del attrs['title']
 
-    text = text or page.title.current
+    text = text or page.title
     url = page.get_absolute_url()
     if anchor is not None:
         url = '%s#%s' % (url, anchor)
@@ -110,7 +111,7 @@ def post(context, pk, text=None, anchor=None, **attrs):
     """
 
     try:
-        post = BlogPost.objects.pk_or_slug(pk)
+        post = get_link_index(BlogPost).pk_or_slug(pk)
     except BlogPost.DoesNotExist:
         log.error('%s: BlogPost %s does not exist.', context['request'].path, pk)
         return text or ''
@@ -122,7 +123,7 @@ def post(context, pk, text=None, anchor=None, **attrs):
         text = attrs['title']
         del attrs['title']
 
-    text = text or post.title.current
+    text = text or post.title
     url = post.get_absolute_url()
     if anchor is not None:
         url = '%s#%s' % (url, anchor)
@@ -13,9 +13,34 @@
 # You should have received a copy of the GNU General Public License along with this project. If not, see
 # <http://www.gnu.org/licenses/>.
 
-from django.test import TestCase
+import doctest
+from io import StringIO
+from unittest import mock
 
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.template import Context
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import translation
+
+from core.tests.base import TestCase
+
+from . import utils
+from .management.commands.render_summaries import Command as RenderSummariesCommand
+from .models import BlogPost
 from .models import Page
+from .utils import TemplateCache
+from .utils import compile_template
+from .utils import get_link_index
+
+
+def load_tests(loader, tests, ignore):
+    tests.addTests(doctest.DocTestSuite(utils))
+    return tests
 
 
 class BasePageTests(TestCase):
@@ -29,3 +54,274 @@ class BasePageTests(TestCase):
 
         self.assertEqual(b.cleanup_html('test <table><tr><td>foo</td></tr></table>'),
                          'test foo')
+
+
+class TemplateCacheTests(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache = TemplateCache(size=2)
+        self.patcher = mock.patch('blog.models.template_cache', self.cache)
+        self.patcher.start()
+        self.addCleanup(self.patcher.stop)
+
+    def render(self, page, lang='en'):
+        with translation.override(lang):
+            return page.render(Context({}))
+
+    def test_basic(self):
+        page = Page.objects.create(title_en='title', title_de='titel', slug_en='en', slug_de='de',
+                                   text_en='{% if True %}text{% endif %}', text_de='Text')
+        self.assertEqual(self.render(page), 'text')
+        self.assertEqual(self.render(page), 'text')
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+        # other languages are cached separately
+        self.assertEqual(self.render(page, 'de'), 'Text')
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 2))
+
+        # saving the page invalidates the cache
+        page.text_en = 'changed'
+        page.save()
+        self.assertEqual(len(self.cache.templates), 0)
+        self.assertEqual(self.render(page), 'changed')
+
+    def test_size(self):
+        pages = [Page.objects.create(title_en='t', title_de='t', slug_en='en%s' % i, slug_de='de%s' % i,
+                                     text_en='text %s' % i, text_de='Text') for i in range(0, 3)]
+        for page in pages:
+            self.render(page)
+        self.assertEqual(len(self.cache.templates), 2)
+
+        self.assertEqual(self.render(pages[2]), 'text 2')
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_unsaved(self):
+        self.assertEqual(self.render(Page(text_en='text')), 'text')
+        self.assertEqual(len(self.cache.templates), 0)
+
+
+class SummaryTests(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.page = Page.objects.create(
+            title_en='title', title_de='titel', slug_en='en', slug_de='de',
+            text_en='<p>First sentence. Second sentence with <strong>{{ site.BRAND }}</strong>.</p>',
+            text_de='<p>Erster Satz.</p>')
+
+    def get_request(self, site=settings.DEFAULT_XMPP_HOST, lang='en'):
+        return RenderSummariesCommand().get_request(settings.XMPP_HOSTS[site], lang)
+
+    def test_basic(self):
+        request = self.get_request()
+        with translation.override('en'):
+            self.assertEqual(self.page.get_meta_summary(request),
+                             'First sentence. Second sentence with example.com.')
+            self.assertIn('<strong>example.com</strong>', self.page.get_html_summary(request))
+
+            # summaries are stored in the database
+            page = Page.objects.get(pk=self.page.pk)
+            with self.assertNumQueries(0):
+                self.assertEqual(page.get_twitter_summary(request),
+                                 'First sentence. Second sentence with example.com.')
+
+            # other sites have their own summaries
+            self.assertEqual(page.get_meta_summary(self.get_request('example.org')),
+                             'First sentence. Second sentence with example.org.')
+
+        with translation.override('de'):
+            self.assertEqual(page.get_meta_summary(self.get_request(lang='de')), 'Erster Satz.')
+
+        # saving the page removes stored summaries
+        page.meta_summary_en = 'Explicit meta summary.'
+        page.save()
+        page = Page.objects.get(pk=self.page.pk)
+        self.assertEqual(page.summaries, {})
+        with translation.override('en'):
+            self.assertEqual(page.get_meta_summary(request), 'Explicit meta summary.')
+            self.assertEqual(page.get_opengraph_summary(request), 'Explicit meta summary.')
+
+    def test_linked_page_changed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            other = Page.objects.create(title_en='other', title_de='andere', slug_en='other-en',
+                                        slug_de='other-de')
+        self.page.text_en = '<p>Link to {%% page %s %%}.</p>' % other.pk
+        self.page.save()
+
+        request = self.get_request()
+        with translation.override('en'):
+            self.assertIn('>other</a>', self.page.get_html_summary(request))
+
+            # renaming the linked page makes stored summaries of other pages outdated
+            other.title_en = 'renamed'
+            with self.captureOnCommitCallbacks(execute=True):
+                other.save()
+
+            page = Page.objects.get(pk=self.page.pk)
+            self.assertIn('>renamed</a>', page.get_html_summary(request))
+
+    def test_store_concurrent(self):
+        request = self.get_request()
+        stale = Page.objects.get(pk=self.page.pk)
+        other = Page.objects.get(pk=self.page.pk)
+
+        # summaries rendered concurrently in different languages are merged
+        with translation.override('en'):
+            stale.get_summaries(request)
+        with translation.override('de'):
+            other.get_summaries(self.get_request(lang='de'))
+        self.assertEqual(set(Page.objects.get(pk=self.page.pk).summaries), {'en', 'de'})
+
+        # summaries of a stale instance do not overwrite summaries removed by saving the page
+        self.page.text_en = '<p>Changed text.</p>'
+        self.page.save()
+        stale.summaries = {}
+        with translation.override('en'):
+            self.assertIn('First sentence.', stale.get_meta_summary(request))
+        self.assertEqual(Page.objects.get(pk=self.page.pk).summaries, {})
+
+    def test_crop(self):
+        self.page.text_en = '<p>%s</p>' % ' '.join(['Sentence %s of many.' % i for i in range(20)])
+        self.page.save()
+
+        with translation.override('en'):
+            request = self.get_request()
+            meta = self.page.get_meta_summary(request)
+            twitter = self.page.get_twitter_summary(request)
+
+        self.assertTrue(meta.startswith('Sentence 0 of many. Sentence 1 of many.'))
+        self.assertTrue(meta.endswith('Sentence 7 of many.'))
+        self.assertLessEqual(len(meta), 160)
+        self.assertTrue(twitter.endswith('Sentence 9 of many.'))
+        self.assertLessEqual(len(twitter), 200)
+
+    def test_benchmark(self):
+        stdout = StringIO()
+        call_command('benchmark_summaries', number=1, stdout=stdout)
+        self.assertIn('Speedup: ', stdout.getvalue())
+
+    def test_command(self):
+        call_command('render_summaries', stdout=StringIO())
+        page = Page.objects.get(pk=self.page.pk)
+
+        with self.assertNumQueries(0):
+            for lang, _name in settings.LANGUAGES:
+                with translation.override(lang):
+                    for site in settings.XMPP_HOSTS:
+                        page.get_opengraph_summary(self.get_request(site, lang))
+        self.assertEqual(set(page.summaries), set(lang for lang, _name in settings.LANGUAGES))
+
+
+class LinkIndexTests(TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.page = Page.objects.create(title_en='Page', title_de='Seite', slug_en='page', slug_de='seite')
+        self.post = BlogPost.objects.create(title_en='Post', title_de='Beitrag', slug_en='post',
+                                            slug_de='beitrag')
+
+    def render(self, text, lang='en'):
+        with translation.override(lang):
+            return compile_template(text).render(Context({}))
+
+    def test_tags(self):
+        text = '{%% page %s %%} {%% page "seite" %%} {%% post %s %%} {%% page_url "page" %%}' % (
+            self.page.pk, self.post.pk)
+        self.render(text)  # build index
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.render(text),
+                             '<a href="%s">Page</a> <a href="%s">Page</a> <a href="%s">Post</a> %s' % (
+                                 self.page.get_absolute_url(), self.page.get_absolute_url(),
+                                 self.post.get_absolute_url(), self.page.get_absolute_url()))
+
+        with translation.override('de'):
+            url = self.page.get_absolute_url()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.render('{% page "page" %}', 'de'), '<a href="%s">Seite</a>' % url)
+
+        # saving a page updates the index
+        self.page.title_en = 'Changed'
+        self.page.slug_en = 'changed'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.page.save()
+        self.assertEqual(self.render('{% page "changed" %}'),
+                         '<a href="%s">Changed</a>' % self.page.get_absolute_url())
+        self.assertEqual(self.render('{% page_url "page" %}'), '')
+
+    def test_slug(self):
+        Page.objects.slug('page').get()  # build index
+
+        # slugs are resolved by the index
+        with self.assertNumQueries(2):
+            self.assertEqual(Page.objects.slug('seite').get(), self.page)
+        self.assertFalse(Page.objects.slug('post').exists())
+        self.assertEqual(BlogPost.objects.pk_or_slug('beitrag'), self.post)
+
+        # pages that are not yet in the index (the version is bumped only after commit) are found as well
+        new = Page.objects.create(title_en='new', title_de='neu', slug_en='new', slug_de='neu',
+                                  text_en='<p>Text.</p>', text_de='<p>Text.</p>')
+        self.assertFalse(get_link_index(Page).get_pks('neu'))
+        self.assertEqual(Page.objects.slug('neu').get(), new)
+        response = self.client.get(new.get_absolute_url())
+        self.assertEqual(response.status_code, 200)
+
+        # a stale index does not resolve a slug to a page that no longer has it
+        self.page.slug_en = 'renamed'
+        self.page.save()
+        other = Page.objects.create(title_en='other', title_de='andere', slug_en='page', slug_de='andere',
+                                    text_en='<p>Text.</p>', text_de='<p>Text.</p>')
+        self.assertEqual(get_link_index(Page).get_pks('page'), [self.page.pk])
+        self.assertEqual(Page.objects.slug('page').get(), other)
+        self.assertEqual(Page.objects.slug('seite').get(), self.page)
+        other.delete()
+        self.page.slug_en = 'page'
+        self.page.save()
+
+        # unpublished pages are not found
+        self.page.published = False
+        self.page.save()
+        self.assertFalse(Page.objects.filter(published=True).slug('page').exists())
+
+        # views redirect to the slug in the current language
+        with translation.override('de'):
+            url = self.post.get_absolute_url()
+        response = self.client.get(url, HTTP_ACCEPT_LANGUAGE='en')
+        self.assertRedirects(response, self.post.get_absolute_url(), fetch_redirect_response=False)
+
+
+class BlogPostListViewTests(TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.author = get_user_model().objects.create(username='author@example.com', email='a@example.com')
+
+    def create(self, count):
+        start = BlogPost.objects.count()
+        for i in range(start, start + count):
+            BlogPost.objects.create(title_en='Post %s' % i, title_de='Beitrag %s' % i, slug_en='post-%s' % i,
+                                    slug_de='beitrag-%s' % i, author=self.author,
+                                    text_en='<p>Text of post %s. Second sentence.</p>' % i,
+                                    text_de='<p>Text von Beitrag %s.</p>' % i)
+
+    def get(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('blog:home'))
+        self.assertEqual(response.status_code, 200)
+        return response, queries
+
+    def test_listing(self):
+        self.create(3)
+        response, queries = self.get()  # renders and stores summaries
+        self.assertContains(response, 'Text of post 2.')
+
+        # summaries are now stored and no template is rendered
+        with mock.patch.object(BlogPost, 'render_template', side_effect=AssertionError):
+            response, queries = self.get()
+        self.assertContains(response, 'Text of post 2.')
+        self.assertContains(response, 'author')
+        self.assertFalse([q for q in queries if 'text_en' in q['sql']])
+
+        # number of queries does not depend on the number of posts
+        self.create(7)
+        self.get()
+        self.assertEqual(len(self.get()[1]), len(queries))
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the jabber.at homepage (https://github.com/jabber-at/hp).
+#
+# This project is free software: you can redistribute it and/or modify it under the terms of the GNU General
+# Public License as published by the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This project is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License along with this project. If not, see
+# <http://www.gnu.org/licenses/>.
+
+import re
+import threading
+from collections import OrderedDict
+
+from django import template
+from django.conf import settings
+from django.utils import translation
+from django.utils.translation import get_language
+
+from core.utils import get_cache_version
+
+LINKS_VERSION_CACHE_KEY = 'blog_links_version'
+_link_indexes = {}
+_SENTENCE_RE = re.compile(r'(?<![.0-9])[:.](?=[ <]|\Z)')
+
+
+def compile_template(text):
+    """Compile the given text of a blog post or page to a template."""
+
+    return template.Template('{%% load blog core icons %%}%s' % text)
+
+
+def get_sentences(text):
+    """Split a text into sentences.
+
+    At the most basic level, this function splits the given text on occurence of a dot (".") and one or
+    more spaces. A colon is recognized as a sentence, so "foo: bar." counts as two sentences and the colon
+    will not be preserved. A dot does not count as a sentence if it is preceeded by a number ("16.
+    February") and only if followed by a space, a "<" (for HTML tags) or as end of string.
+
+    >>> get_sentences('Foo: bar. On 16. February 1.5 million. ')
+    ['Foo.', 'bar.', 'On 16. February 1.5 million.']
+    """
+    sentences = (m.strip(' .:') for m in _SENTENCE_RE.split(text))
+    return ['%s.' % m for m in sentences if m]
+
+
+def crop_sentences(sentences, lengths):
+    """Join as many sentences as fit into each of the given lengths.
+
+    All lengths are computed in a single pass over the sentences. If the first sentence is already longer
+    than a length, the first sentence is returned anyway.
+
+    >>> crop_sentences(['Foo.', 'Bar bla.', 'Baz.'], [5, 13, 100])
+    ['Foo.', 'Foo. Bar bla.', 'Foo. Bar bla. Baz.']
+    >>> crop_sentences(['A long sentence.', 'Foo.'], [5])
+    ['A long sentence.']
+    """
+    limits = sorted(set(lengths))
+    counts = {}
+    length = -1  # the first sentence is not preceded by a space
+
+    for count, sentence in enumerate(sentences):
+        length += len(sentence) + 1
+        while limits and length > limits[0]:
+            counts[limits.pop(0)] = max(count, 1)
+        if not limits:
+            break
+
+    for limit in limits:  # all sentences fit into the remaining lengths
+        counts[limit] = len(sentences)
+    return [' '.join(sentences[:counts[length]]) for length in lengths]
+
+
+class TemplateCache(object):
+    """A bounded cache for compiled templates of blog posts and pages.
+
+    The least recently used templates are discarded if the cache is full. Keys are tuples that start with the
+    model label and the primary key of the page, see :py:meth:`~blog.models.BasePage.get_template`.
+
+    Parameters
+    ----------
+
+    size : int, optional
+        How many compiled templates to keep.
+    """
+
+    def __init__(self, size=256):
+        self.size = size
+        self.templates = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, text):
+        """Get the compiled template for the given key, compile ``text`` if it's not cached yet."""
+
+        with self.lock:
+            tmpl = self.templates.get(key)
+            if tmpl is not None:
+                self.templates.move_to_end(key)
+                self.hits += 1
+                return tmpl
+            self.misses += 1
+
+        tmpl = compile_template(text)
+        with self.lock:
+            self.templates[key] = tmpl
+            while len(self.templates) > self.size:
+                self.templates.popitem(last=False)
+        return tmpl
+
+    def invalidate(self, label, pk):
+        """Remove all templates of the given page."""
+
+        with self.lock:
+            for key in [k for k in self.templates if k[:2] == (label, pk)]:
+                del self.templates[key]
+
+
+template_cache = TemplateCache()
+
+
+class PageLink(object):
+    """Title and URL of a blog post or page in all languages, see :py:class:`~blog.utils.LinkIndex`."""
+
+    def __init__(self, page):
+        self.pk = page.pk
+        self.titles = {}
+        self.urls = {}
+
+        for code, _name in settings.LANGUAGES:
+            with translation.override(code):
+                self.titles[code] = page.title.current
+                self.urls[code] = page.get_absolute_url()
+
+    @property
+    def title(self):
+        """Title in the current language."""
+
+        return self.titles.get(get_language(), '')
+
+    def get_absolute_url(self):
+        return self.urls.get(get_language(), '')
+
+
+class LinkIndex(object):
+    """Index of links to all blog posts or pages by primary key and slug in any language.
+
+    The index is also used to look up objects by slug, so that a slug can be resolved with a single lookup by
+    primary key, no matter how many languages are configured.
+
+    Parameters
+    ----------
+
+    model : :py:class:`~blog.models.Page` or :py:class:`~blog.models.BlogPost`
+        The model to index.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.pks = {}
+        self.slugs = {}
+        self.slug_pks = {}  # slug -> all pks using this slug in any language
+
+        fields = []
+        for code, _name in settings.LANGUAGES:
+            fields += ['title_%s' % code, 'slug_%s' % code]
+
+        for page in model.objects.only(*fields).order_by('pk'):
+            link = PageLink(page)
+            self.pks[page.pk] = link
+
+            for code, _name in settings.LANGUAGES:
+                slug = getattr(page, 'slug_%s' % code)
+                if slug:
+                    self.slugs.setdefault(slug, link)
+                    pks = self.slug_pks.setdefault(slug, [])
+                    if page.pk not in pks:
+                        pks.append(page.pk)
+
+    def get_pks(self, slug):
+        """Get the primary keys of all objects that use the given slug in any language."""
+
+        return self.slug_pks.get(slug, [])
+
+    def pk_or_slug(self, val):
+        """Get a link either by primary key or slug in any language.
+
+        This works like :py:meth:`~blog.querysets.BasePageQuerySet.pk_or_slug` and raises ``DoesNotExist``
+        of the indexed model if no object is found.
+        """
+        if isinstance(val, int):
+            link = self.pks.get(val)
+        else:
+            link = self.slugs.get(val)
+
+        if link is None:
+            raise self.model.DoesNotExist('%s matching "%s" does not exist.' % (
+                self.model._meta.object_name, val))
+        return link
+
+
+def get_link_index(model):
+    """Get the :py:class:`~blog.utils.LinkIndex` for the given model.
+
+    The index is built once per process and built again if any blog post or page was saved or deleted.
+    """
+
+    version = get_cache_version(LINKS_VERSION_CACHE_KEY)
+    index = _link_indexes.get(model)
+    if index is None or index[0] != version:
+        index = version, LinkIndex(model)
+        _link_indexes[model] = index
+    return index[1]
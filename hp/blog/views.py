@@ -17,14 +17,17 @@ import logging
 
 from django.conf import settings
 from django.utils import timezone
+from django.utils.translation import get_language
 from django.views.generic.detail import DetailView
 from django.views.generic.list import ListView
 
+from core.utils import get_cache_version
 from core.views import HomepageViewMixin
 from core.views import TranslateSlugViewMixin
 
 from .models import BlogPost
 from .models import Page
+from .utils import LINKS_VERSION_CACHE_KEY
 
 log = logging.getLogger(__name__)
 _BLACKLIST = getattr(settings, 'SPAM_BLACKLIST', set())
@@ -52,6 +55,7 @@ class BasePageMixin(HomepageViewMixin):
 
 
 class PageView(TranslateSlugViewMixin, BasePageMixin, DetailView):
+    cache_response = True
     queryset = Page.objects.filter(published=True)
 
 
@@ -66,11 +70,36 @@ class BlogPostMixin(object):
 
 
 class BlogPostListView(HomepageViewMixin, BlogPostMixin, ListView):
-    queryset = BlogPost.objects.select_related('author').blog_order()
+    cache_response = True
+    queryset = BlogPost.objects.blog_order()
     paginate_by = 10
 
+    def get_queryset(self):
+        # queryset.listing() depends on the current language
+        return super().get_queryset().listing()
+
+    def render_missing_summaries(self, posts):
+        """Render summaries of posts that were not yet stored in the database.
+
+        The queryset only loads the fields required for displaying stored summaries, so posts without stored
+        summaries are loaded completely (with a single query) to render their summaries.
+        """
+        lang = get_language()
+        site = self.request.site['NAME']
+        version = get_cache_version(LINKS_VERSION_CACHE_KEY)
+        missing = [p for p in posts if p.get_stored_summaries(lang, site, version) is None]
+        if not missing:
+            return
+
+        full = BlogPost.objects.in_bulk([p.pk for p in missing])
+        for post in missing:
+            full[post.pk].get_summaries(self.request)
+            post.summaries = full[post.pk].summaries
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        self.render_missing_summaries(context['object_list'])
+
         if context['object_list']:
             newest = max(context['object_list'], key=lambda o: o.updated)
             context['updated'] = newest.updated
@@ -80,6 +109,7 @@ class BlogPostListView(HomepageViewMixin, BlogPostMixin, ListView):
 
 
 class BlogPostView(TranslateSlugViewMixin, BasePageMixin, BlogPostMixin, DetailView):
+    cache_response = True
     queryset = BlogPost.objects.all()
     context_object_name = 'post'
     static_context = {
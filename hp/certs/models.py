@@ -23,6 +23,9 @@ from cryptography.x509.oid import ExtensionOID
 
 from django.conf import settings
 from django.db import models
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_save
+from django.dispatch import receiver
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
@@ -30,6 +33,8 @@ from django.utils.translation import gettext_lazy as _
 from jsonfield import JSONField
 
 from core.models import BaseModel
+from core.utils import RESPONSE_CACHE_VERSION_CACHE_KEY
+from core.utils import bump_cache_versions_on_commit
 
 from .querysets import CertificateQuerySet
 from .utils import add_colons
@@ -123,3 +128,10 @@ class Certificate(BaseModel):
             return []
 
         return [format_general_name(name) for name in ext.value]
+
+
+@receiver(post_save, sender=Certificate)
+@receiver(post_delete, sender=Certificate)
+def certificate_changed(sender, **kwargs):
+    # Certificates are displayed on pages that may be cached
+    bump_cache_versions_on_commit(RESPONSE_CACHE_VERSION_CACHE_KEY)
@@ -35,6 +35,7 @@ from .serializers import CertificateSerializer
 class CertificateOverview(ListView):
     """List all available hostnames and the last update."""
 
+    cache_response = True
     queryset = Certificate.objects.enabled()
     template_name = 'certs/certificate_list.html'
 
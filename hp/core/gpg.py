@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the jabber.at homepage (https://github.com/jabber-at/hp).
+#
+# This project is free software: you can redistribute it and/or modify it under the terms of the GNU General
+# Public License as published by the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This project is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License along with this project. If not, see
+# <http://www.gnu.org/licenses/>.
+
+"""A pool of persistent GPG keyrings used for sending encrypted and signed mails and fetching of public keys.
+
+Creating a temporary keyring and importing the private key of a host for every mail is expensive. Instead,
+every process keeps one keyring per host that already contains the private key used for signing. Public
+keys of recipients are imported only once and kept in the keyring until they are evicted by more recently
+used keys.
+
+Keyrings are used by :py:meth:`account.models.User.gpg_host_keyring`.
+
+Public keys are fetched from the keyserver configured by ``GPG_KEYSERVER`` with a
+:py:class:`~core.gpg.KeyFetcher`, which caches fetched keys and fetches many keys concurrently.
+"""
+
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+
+from gpgliblib.django import gpg_backend
+
+from .utils import load_private_key
+
+log = logging.getLogger(__name__)
+_pool = None
+_fetcher = None
+
+
+class Keyring(object):
+    """A persistent GPG keyring for a host.
+
+    Parameters
+    ----------
+
+    backend : :py:class:`~gpgliblib.base.GpgBackendBase`
+        The backend using the home directory of this keyring.
+    hostname : str
+        The host (as configured in the ``XMPP_HOSTS`` setting) whose private key is imported.
+    size : int, optional
+        How many public keys are kept in the keyring at most.
+    """
+
+    def __init__(self, backend, hostname, size=100):
+        self.backend = backend
+        self.hostname = hostname
+        self.size = size
+        self.lock = threading.Lock()
+        self.keys = OrderedDict()  # digest of the key data -> list of fingerprints
+
+        self.fingerprint, host_key, host_pub = load_private_key(hostname)
+        if self.fingerprint:
+            backend.import_private_key(host_key)
+            backend.import_key(host_pub)
+
+    def import_key(self, data):
+        """Import a public key unless the same key was imported before.
+
+        Returns
+        -------
+
+        list of str
+            The fingerprints of the imported keys.
+        """
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+
+        digest = hashlib.sha256(data).hexdigest()
+        fingerprints = self.keys.get(digest)
+        if fingerprints is not None:
+            self.keys.move_to_end(digest)
+            return fingerprints
+
+        fingerprints = [key.fp for key in self.backend.import_key(data)]
+        self.keys[digest] = fingerprints
+        self.evict()
+        return fingerprints
+
+    def evict(self):
+        """Remove the least recently used public keys if the keyring holds more than ``size`` keys."""
+
+        while len(self.keys) > self.size:
+            _digest, fingerprints = self.keys.popitem(last=False)
+
+            # A key with the same fingerprint may have been imported again with different data
+            used = {fp for fps in self.keys.values() for fp in fps}
+            used.add(self.fingerprint)
+
+            for fp in fingerprints:
+                if fp in used:
+                    continue
+
+                for key in self.backend.list_keys(fp):
+                    try:
+                        key.delete()
+                    except Exception as e:
+                        log.exception(e)
+
+
+class KeyringPool(object):
+    """A pool holding one :py:class:`~core.gpg.Keyring` per host and backend settings.
+
+    Parameters
+    ----------
+
+    size : int, optional
+        How many public keys every keyring holds at most. The default is the ``GPG_KEYRING_SIZE`` setting.
+    """
+
+    def __init__(self, size=None):
+        if size is None:
+            size = settings.GPG_KEYRING_SIZE
+        self.size = size
+        self.keyrings = {}
+        self.homes = []
+        self.lock = threading.Lock()
+
+    def create(self, hostname, **kwargs):
+        home = tempfile.TemporaryDirectory()
+        self.homes.append(home)  # directory is removed when the pool is garbage collected
+
+        with gpg_backend.settings(home=home.name, **kwargs) as backend:
+            return Keyring(backend, hostname, size=self.size)
+
+    @contextmanager
+    def keyring(self, hostname, **kwargs):
+        """Context manager yielding the keyring for the given host.
+
+        Any ``kwargs`` are passed to the backend (e.g. ``default_trust=True``). The keyring is locked
+        while the context manager is active.
+        """
+        key = (hostname, tuple(sorted(kwargs.items())))
+        with self.lock:
+            keyring = self.keyrings.get(key)
+            if keyring is None:
+                keyring = self.keyrings[key] = self.create(hostname, **kwargs)
+
+        with keyring.lock:
+            yield keyring
+
+
+def get_keyring_pool():
+    """Get the keyring pool of this process."""
+
+    global _pool
+
+    if _pool is None:
+        _pool = KeyringPool()
+    return _pool
+
+
+class KeyFetcher(object):
+    """Fetch public keys from a keyserver.
+
+    Fetched keys are cached by fingerprint, so a key is fetched from the keyserver at most once every
+    ``timeout`` seconds. If a key is already being fetched by a different thread, the result of that fetch
+    is used instead of fetching the key again.
+
+    Parameters
+    ----------
+
+    keyserver : str, optional
+        The keyserver to use. The default is the ``GPG_KEYSERVER`` setting.
+    timeout : int, optional
+        How long (in seconds) fetched keys are cached. The default is the ``GPG_KEY_CACHE_TIMEOUT``
+        setting.
+    workers : int, optional
+        How many keys :py:meth:`~core.gpg.KeyFetcher.fetch_many` fetches concurrently at most. The default
+        is the ``GPG_FETCH_WORKERS`` setting.
+    """
+
+    def __init__(self, keyserver=None, timeout=None, workers=None):
+        if keyserver is None:
+            keyserver = settings.GPG_KEYSERVER
+        if timeout is None:
+            timeout = settings.GPG_KEY_CACHE_TIMEOUT
+        if workers is None:
+            workers = settings.GPG_FETCH_WORKERS
+
+        self.keyserver = keyserver
+        self.timeout = timeout
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.pending = {}  # fingerprint -> Future of the fetch currently running
+
+    def get_cache_key(self, fingerprint):
+        return 'gpg_key_%s' % fingerprint
+
+    def fetch(self, fingerprint, refresh=False):
+        """Fetch the key with the given fingerprint (without a "0x" prefix).
+
+        Any exception raised by the backend (e.g. a :py:class:`~urllib.error.URLError`) is propagated to
+        all threads waiting for the key. Failed fetches are not cached.
+
+        Parameters
+        ----------
+
+        fingerprint : str
+        refresh : bool, optional
+            If ``True``, do not use a cached key but always fetch it from the keyserver (or wait for a
+            fetch that is currently running) and update the cache.
+
+        Returns
+        -------
+
+        bytes
+            The ASCII armored key as returned by the keyserver.
+        """
+        fingerprint = fingerprint.upper()
+        cache_key = self.get_cache_key(fingerprint)
+
+        if refresh is False:
+            data = cache.get(cache_key)
+            if data is not None:
+                return data
+
+        with self.lock:
+            future = self.pending.get(fingerprint)
+            if future is None:
+                if refresh is False:
+                    # check again, another thread might have just finished fetching the key
+                    data = cache.get(cache_key)
+                    if data is not None:
+                        return data
+
+                future = self.pending[fingerprint] = Future()
+                owner = True
+            else:
+                owner = False
+
+        if owner is False:
+            return future.result()
+
+        try:
+            data = gpg_backend.fetch_key('0x%s' % fingerprint, keyserver=self.keyserver)
+            if self.timeout:
+                cache.set(cache_key, data, self.timeout)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(data)
+            return data
+        finally:
+            with self.lock:
+                del self.pending[fingerprint]
+
+    def fetch_many(self, fingerprints, refresh=False):
+        """Fetch many keys concurrently.
+
+        ``refresh`` is passed to :py:meth:`~core.gpg.KeyFetcher.fetch`.
+
+        Returns
+        -------
+
+        dict
+            A dictionary mapping the given fingerprints to completed futures, calling ``result()`` returns
+            the key or raises the exception raised when fetching the key.
+        """
+        fingerprints = list(fingerprints)
+        workers = min(self.workers, len(fingerprints))
+
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                return {fp: executor.submit(self.fetch, fp, refresh=refresh) for fp in fingerprints}
+
+        futures = {}
+        for fp in fingerprints:
+            future = futures[fp] = Future()
+            try:
+                future.set_result(self.fetch(fp, refresh=refresh))
+            except Exception as e:
+                future.set_exception(e)
+        return futures
+
+
+def get_key_fetcher():
+    """Get the key fetcher of this process."""
+
+    global _fetcher
+
+    if _fetcher is None:
+        _fetcher = KeyFetcher()
+    return _fetcher
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the jabber.at homepage (https://github.com/jabber-at/hp).
+#
+# This project is free software: you can redistribute it and/or modify it under the terms of the GNU General
+# Public License as published by the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This project is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License along with this project. If not, see
+# <http://www.gnu.org/licenses/>.
+
+"""Send emails in batches over a shared connection.
+
+By default, every message opens its own connection to the mail server. Code that sends many messages
+(e.g. periodic tasks sending notifications) can use :py:func:`~core.mail.mail_queue` to send all messages
+passed to :py:func:`~core.mail.send_message` in batches over a single connection::
+
+    with mail_queue():
+        for user in users:
+            user.send_mail(...)  # messages are queued and sent in batches
+
+Batches are sent when the queue holds ``MAIL_BATCH_SIZE`` messages and when the context manager exits.
+Messages that fail to send are retried up to ``MAIL_RETRIES`` times with a new connection, messages that
+still fail are logged and do not prevent other messages from being sent.
+
+Mails rendered from templates should use :py:class:`~core.mail.MailTemplate`, which loads all templates only
+once and can thus be used to render many mails.
+"""
+
+import logging
+import smtplib
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.template import Context
+from django.template import Template
+from django.template.loader import get_template
+from django.utils.translation import get_language
+
+log = logging.getLogger(__name__)
+_local = threading.local()
+
+
+@lru_cache(maxsize=128)
+def get_subject_template(language, subject):
+    """Get the compiled template for a subject.
+
+    Subjects are translated before they are compiled, so compiled templates are memoised per language and
+    subject. The ``language`` parameter is only used as part of the key.
+    """
+    return Template(subject)
+
+
+class MailTemplate(object):
+    """Subject, plain text and html body of a mail rendered from templates.
+
+    All templates are loaded when the instance is created, so the same instance can be used to render any
+    number of mails in the current language.
+
+    Parameters
+    ----------
+
+    template_base : str
+        The template base name to use. The class appends ``".txt"`` for the plain text version and
+        ``".html"`` for the html version of the email body.
+    subject : str
+        The subject for the email, it is also rendered as template.
+    """
+
+    def __init__(self, template_base, subject):
+        self.subject = get_subject_template(get_language(), str(subject))
+        self.txt = get_template('%s.txt' % template_base)
+        self.html = get_template('%s.html' % template_base)
+
+    def render(self, context):
+        """Render the mail with the given context.
+
+        Returns
+        -------
+
+        tuple of str
+            The subject, the plain text and the html version of the mail.
+        """
+        subject = self.subject.render(Context(context))
+        return subject, self.txt.render(context).strip(), self.html.render(context).strip()
+
+
+class PreparedMessage(object):
+    """An email message whose MIME representation is created immediately.
+
+    This is used for messages that can only be created while some resource is held, e.g. GPG encrypted
+    messages that require a keyring. The message can be sent after the resource was released. All other
+    attributes are taken from the wrapped message.
+    """
+
+    def __init__(self, message):
+        self.email_message = message
+        self.mime = message.message()
+
+    def message(self):
+        return self.mime
+
+    def send(self, fail_silently=False):
+        if not self.recipients():
+            return 0
+        return self.get_connection(fail_silently).send_messages([self])
+
+    def __getattr__(self, name):
+        return getattr(self.email_message, name)
+
+
+class MailQueue(object):
+    """A queue of messages that are sent in batches over a shared connection.
+
+    Parameters
+    ----------
+
+    batch_size : int, optional
+        Send messages once this many messages are queued. The default is the ``MAIL_BATCH_SIZE`` setting.
+    retries : int, optional
+        How often sending a message is retried. The default is the ``MAIL_RETRIES`` setting.
+    connection : optional
+        The connection to use, the default is a connection to the configured email backend.
+    """
+
+    def __init__(self, batch_size=None, retries=None, connection=None):
+        if batch_size is None:
+            batch_size = settings.MAIL_BATCH_SIZE
+        if retries is None:
+            retries = settings.MAIL_RETRIES
+        if connection is None:
+            connection = get_connection(fail_silently=False)
+
+        self.batch_size = batch_size
+        self.retries = retries
+        self.connection = connection
+        self.messages = []
+        self.sent = 0
+        self.failed = []
+
+    def add(self, message):
+        self.messages.append(message)
+        if len(self.messages) >= self.batch_size:
+            self.flush()
+
+    def send(self, message):
+        """Send a single message, reopening the connection if sending fails."""
+
+        for attempt in range(self.retries + 1):
+            try:
+                self.connection.send_messages([message])
+                return True
+            except smtplib.SMTPRecipientsRefused as e:  # retrying won't help
+                log.error('Recipients refused: %s', ', '.join(e.recipients))
+                return False
+            except (smtplib.SMTPException, OSError) as e:
+                log.warn('Error sending mail to %s (attempt %s): %s', ', '.join(message.to), attempt + 1, e)
+
+                # the connection is probably broken, so open a new one
+                self.connection.close()
+                try:
+                    self.connection.open()
+                except (smtplib.SMTPException, OSError) as e:
+                    log.warn('Error opening connection: %s', e)
+        return False
+
+    def flush(self):
+        """Send all queued messages.
+
+        Returns
+        -------
+
+        list
+            The messages that could not be sent.
+        """
+        messages, self.messages = self.messages, []
+        failed = []
+        if not messages:
+            return failed
+
+        try:
+            self.connection.open()
+        except (smtplib.SMTPException, OSError) as e:
+            log.warn('Error opening connection: %s', e)  # send() will try again
+
+        try:
+            for message in messages:
+                if self.send(message):
+                    self.sent += 1
+                else:
+                    log.error('Could not send mail to %s.', ', '.join(message.to))
+                    failed.append(message)
+        finally:
+            self.connection.close()
+
+        self.failed += failed
+        return failed
+
+
+def get_mail_queue():
+    """Get the currently active mail queue, or ``None`` if no queue is active."""
+
+    stack = getattr(_local, 'stack', None)
+    return stack[-1] if stack else None
+
+
+@contextmanager
+def mail_queue(**kwargs):
+    """Context manager queueing all messages sent with :py:func:`~core.mail.send_message`.
+
+    Any ``kwargs`` are passed to :py:class:`~core.mail.MailQueue`. Queued messages are sent when the context
+    manager exits.
+    """
+    queue = MailQueue(**kwargs)
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+
+    _local.stack.append(queue)
+    try:
+        yield queue
+    finally:
+        _local.stack.pop()
+        queue.flush()
+
+
+def send_message(message):
+    """Send the given message or add it to the active mail queue.
+
+    Parameters
+    ----------
+
+    message : :py:class:`~django.core.mail.EmailMessage` or :py:class:`~core.mail.PreparedMessage`
+        The message to send. GPG messages should be wrapped in a ``PreparedMessage`` while the keyring is
+        held and sent after it was released.
+    """
+    queue = get_mail_queue()
+    if queue is None:
+        message.send()
+    else:
+        queue.add(message)
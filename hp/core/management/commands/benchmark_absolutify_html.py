@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the jabber.at homepage (https://github.com/jabber-at/hp).
+#
+# This project is free software: you can redistribute it and/or modify it under the terms of the GNU General
+# Public License as published by the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This project is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License along with this project. If not, see
+# <http://www.gnu.org/licenses/>.
+
+import timeit
+from urllib.parse import urljoin
+
+import html5lib
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ...utils import absolutify_html
+
+
+def absolutify_html_dom(html, base_url):
+    """The previous implementation of absolutify_html(), using a html5lib DOM."""
+
+    attributes = [
+        ('a', 'href'),
+        ('img', 'src'),
+        ('link', 'href'),
+        ('script', 'src')
+    ]
+
+    tree_builder = html5lib.treebuilders.getTreeBuilder('dom')
+    parser = html5lib.html5parser.HTMLParser(tree=tree_builder)
+    dom = parser.parse(html)
+
+    for tag, attr in attributes:
+        for e in dom.getElementsByTagName(tag):
+            u = e.getAttribute(attr)
+            if u:
+                e.setAttribute(attr, urljoin(base_url, u))
+
+    body = dom.getElementsByTagName('body')[0]
+    tree_walker = html5lib.treewalkers.getTreeWalker('dom')
+    html_serializer = html5lib.serializer.HTMLSerializer()
+    return ''.join(html_serializer.serialize(tree_walker(body)))
+
+
+class Command(BaseCommand):
+    help = 'Compare the speed of absolutify_html() with the previous html5lib-based implementation.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-n', '--number', type=int, default=10, metavar='N',
+                            help='Process every text N times (default: %(default)s).')
+
+    def get_texts(self):
+        """Get the texts of all blog posts and pages in all languages."""
+
+        texts = []
+        for model in [apps.get_model('blog', 'BlogPost'), apps.get_model('blog', 'Page')]:
+            fields = ['text_%s' % lang for lang, _name in settings.LANGUAGES]
+            for row in model.objects.values_list(*fields):
+                texts += [t for t in row if t]
+        return texts
+
+    def handle(self, *args, **options):
+        base_url = settings.XMPP_HOSTS[settings.DEFAULT_XMPP_HOST]['CANONICAL_BASE_URL']
+        texts = self.get_texts()
+        if not texts:
+            self.stdout.write(self.style.WARNING('No blog posts or pages found.'))
+            return
+
+        number = options['number']
+        size = sum(len(t) for t in texts) / 1024
+        self.stdout.write('Processing %s texts (%.1f KB) %s times...' % (len(texts), size, number))
+
+        timings = {}
+        for func in [absolutify_html_dom, absolutify_html]:
+            timings[func] = timeit.timeit(lambda: [func(t, base_url) for t in texts], number=number)
+            self.stdout.write('%s: %.3f seconds (%.2f ms per text)' % (
+                func.__name__, timings[func], timings[func] * 1000 / number / len(texts)))
+
+        self.stdout.write('Speedup: %.1fx' % (timings[absolutify_html_dom] / timings[absolutify_html]))
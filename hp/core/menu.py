@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the jabber.at homepage (https://github.com/jabber-at/hp).
+#
+# This project is free software: you can redistribute it and/or modify it under the terms of the GNU General
+# Public License as published by the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This project is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License along with this project. If not, see
+# <http://www.gnu.org/licenses/>.
+
+"""The menu displayed in the navbar.
+
+The tree of :py:class:`~core.models.MenuItem` instances is compiled into a :py:class:`~core.menu.Menu` once
+per process. Titles and links are resolved in all languages when the menu is compiled, so rendering the
+menu does not require any database queries.
+"""
+
+import logging
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.utils import translation
+from django.utils.translation import get_language
+
+from .constants import TARGET_MODEL
+from .constants import TARGET_URL
+from .utils import MENU_VERSION_CACHE_KEY
+from .utils import get_cache_version
+
+log = logging.getLogger(__name__)
+_menu = None
+
+
+def get_navkey(menuitem):
+    """Get a hashable version of a navkey, as returned by ``get_menuitem()`` of a view.
+
+    >>> get_navkey('blog_page:1')
+    'blog_page:1'
+    >>> get_navkey(('core:contact', [], {'foo': 'bar'}))
+    ('core:contact', (), (('foo', 'bar'),))
+    """
+    if isinstance(menuitem, (tuple, list)):
+        name, args, kwargs = menuitem
+        return name, tuple(args), tuple(sorted(kwargs.items()))
+    return menuitem
+
+
+class MenuNode(object):
+    """A single compiled menu item.
+
+    Parameters
+    ----------
+
+    menu : :py:class:`~core.menu.Menu`
+        The menu this node belongs to.
+    item : :py:class:`~core.models.MenuItem`
+        The menu item this node represents.
+    """
+
+    def __init__(self, menu, item):
+        self.menu = menu
+        self.pk = item.pk
+        self.parent_id = item.parent_id
+        self.navkey = item.target.menu_key
+        self.titles = {}
+        self.hrefs = {}
+        self.children = []
+
+    def __repr__(self):
+        return '<MenuNode: %s>' % self.pk
+
+    @property
+    def title(self):
+        """Title of this menuitem in the current language."""
+
+        return self.titles.get(get_language(), '')
+
+    @property
+    def href(self):
+        """Link to this menuitem in the current language."""
+
+        return self.hrefs.get(get_language(), '')
+
+    def is_leaf_node(self):
+        return not self.children
+
+    def get_children(self):
+        return self.children
+
+    def is_active_parent(self, menuitem):
+        """Return True if the menuitem identified by the given navkey is a descendant of this node."""
+
+        return self.pk in self.menu.ancestors.get(get_navkey(menuitem), ())
+
+
+class Menu(object):
+    """The compiled tree of menu items.
+
+    Parameters
+    ----------
+
+    items : list of :py:class:`~core.models.MenuItem`
+        All menu items in tree order.
+    """
+
+    def __init__(self, items):
+        self.roots = []
+        self.nodes = {}
+        self.ancestors = {}  # navkey -> set of ancestor pks
+
+        for item in items:
+            node = MenuNode(self, item)
+            self.nodes[node.pk] = node
+
+            if node.parent_id is None:
+                self.roots.append(node)
+            elif node.parent_id in self.nodes:  # tree order: parents come first
+                self.nodes[node.parent_id].children.append(node)
+
+        self.resolve(items)
+
+        for node in self.nodes.values():
+            if not node.navkey:
+                continue
+
+            ancestors = self.ancestors.setdefault(get_navkey(node.navkey), set())
+            parent = self.nodes.get(node.parent_id)
+            while parent is not None:
+                ancestors.add(parent.pk)
+                parent = self.nodes.get(parent.parent_id)
+
+    def __iter__(self):
+        return iter(self.roots)
+
+    def __len__(self):
+        return len(self.roots)
+
+    def get_objects(self, items):
+        """Load all objects that menu items link to with one query per model."""
+
+        pks = defaultdict(set)
+        for item in items:
+            if int(item.target.get('typ', TARGET_URL)) == TARGET_MODEL:
+                pks[item.target['content_type']].add(item.target['object_id'])
+
+        objects = {}
+        for ct_id, object_ids in pks.items():
+            try:
+                ct = ContentType.objects.get_for_id(ct_id)
+            except ContentType.DoesNotExist:
+                log.warn('ContentType with id %s not found.', ct_id)
+                continue
+
+            for obj in ct.get_all_objects_for_this_type(pk__in=object_ids):
+                objects[(ct_id, str(obj.pk))] = obj
+        return objects
+
+    def resolve(self, items):
+        """Resolve titles and links of all menu items in all languages."""
+
+        objects = self.get_objects(items)
+
+        for code, _name in settings.LANGUAGES:
+            with translation.override(code):
+                for item in items:
+                    node = self.nodes[item.pk]
+                    node.titles[code] = item.title.current
+
+                    if int(item.target.get('typ', TARGET_URL)) == TARGET_MODEL:
+                        obj = objects.get((item.target['content_type'], str(item.target['object_id'])))
+                        if obj is None:
+                            node.hrefs[code] = ''
+                        elif hasattr(obj, 'get_absolute_url'):
+                            node.hrefs[code] = obj.get_absolute_url()
+                        else:
+                            log.warn('%s: Model has no get_absolute_url()', obj._meta.label)
+                            node.hrefs[code] = ''
+                    else:
+                        node.hrefs[code] = item.target.href
+
+
+def get_menu():
+    """Get the compiled menu displayed in the navbar.
+
+    The menu is compiled once per process and compiled again only if a menu item (or a page linked in the
+    menu) was saved or deleted.
+    """
+    global _menu
+
+    from .models import MenuItem
+
+    version = get_cache_version(MENU_VERSION_CACHE_KEY)
+    if _menu is None or _menu[0] != version:
+        _menu = version, Menu(list(MenuItem.objects.all()))
+    return _menu[1]
@@ -13,8 +13,10 @@
 # You should have received a copy of the GNU General Public License along with this project. If not, see
 # <http://www.gnu.org/licenses/>.
 
+import hashlib
 import json
 import logging
+from functools import lru_cache
 from urllib.parse import urlsplit
 
 from ua_parser import user_agent_parser
@@ -24,27 +26,54 @@ from django.contrib import messages
 from django.core.cache import cache
 from django.db import transaction
 from django.http import HttpResponseRedirect
-from django.http.request import split_domain_port
-from django.http.request import validate_host
 from django.template.response import TemplateResponse
 from django.urls import reverse
+from django.utils.functional import SimpleLazyObject
 from django.utils.translation import gettext as _
 
 from xmpp_backends.base import BackendError
 
 from .exceptions import HttpResponseException
+from .menu import get_menu
 from .models import CachedMessage
-from .models import MenuItem
+from .utils import RESPONSE_CACHE_VERSION_CACHE_KEY
+from .utils import SiteIndex
+from .utils import get_cache_version
 
 log = logging.getLogger(__name__)
 
 _KNOWN_OS = ['osx', 'ios', 'android', 'linux', 'windows', 'any', 'browser', 'console']
+_MOBILE_OS = ['android', 'ios', 'any']
+
+
+@lru_cache(maxsize=1024)
+def parse_os(user_agent):
+    """Get the OS for the given user agent string.
+
+    Parsing user agents is expensive, so results are cached for the most recently seen user agents. Use
+    ``parse_os.cache_info()`` to get the hit rate of the cache.
+    """
+
+    os = user_agent_parser.ParseOS(user_agent)['family'].lower().strip()
+    if os == 'mac os x':
+        return 'osx'
+    elif os == 'ios':
+        return 'ios'
+    elif os == 'android':
+        return 'android'
+    elif os == 'linux':
+        return 'linux'
+    elif os.startswith('windows'):
+        return 'win'
+
+    return 'any'
 
 
 class HomepageMiddleware(object):
     def __init__(self, get_response):
         self.get_response = get_response
         self.default_site = settings.XMPP_HOSTS[settings.DEFAULT_XMPP_HOST]
+        self.sites = SiteIndex(settings.XMPP_HOSTS, self.default_site)
 
     def get_os(self, request):
         if 'os' in request.GET:
@@ -54,57 +83,34 @@ class HomepageMiddleware(object):
             if os in _KNOWN_OS:
                 return os
 
-        ua_parsed = user_agent_parser.ParseOS(request.META.get('HTTP_USER_AGENT', ''))
-        os = ua_parsed['family'].lower().strip()
-        if os == 'mac os x':
-            return 'osx'
-        elif os == 'ios':
-            return 'ios'
-        elif os == 'android':
-            return 'android'
-        elif os == 'linux':
-            return 'linux'
-        elif os.startswith('windows'):
-            return 'win'
-
-        return 'any'
+        return parse_os(request.META.get('HTTP_USER_AGENT', ''))
 
     def __call__(self, request):
-        host = request._get_raw_host()
-        domain, port = split_domain_port(host)
-
         # Set request.site
-        request.site = self.default_site
-        for name, config in settings.XMPP_HOSTS.items():
-            if validate_host(domain, config.get('ALLOWED_HOSTS', [])):
-                request.site = config
-
-        # Attach any messages from the database to the messages system
-        # These messages usually come from asynchronous tasks (-> Celery)
-        if request.user.is_anonymous is False:
+        request.site = self.sites.resolve(request._get_raw_host())
+
+        # Attach any messages from the database to the messages system.
+        # These messages usually come from asynchronous tasks (-> Celery). The database is not
+        # queried if the marker in the cache says that there are no pending messages.
+        if request.user.is_anonymous is False and CachedMessage.has_pending(request.user.pk):
+            # Reset the marker before querying, so that a message created in the meantime sets it again
+            CachedMessage.set_pending(request.user.pk, False)
+
             with transaction.atomic():
-                stored_msgs = CachedMessage.objects.filter(user=request.user)
+                stored_msgs = list(CachedMessage.objects.filter(user=request.user).order_by('pk'))
                 for msg in stored_msgs:
                     messages.add_message(request, msg.level, _(msg.message) % json.loads(msg.payload))
 
-                stored_msgs.delete()
-
-        # Attach OS information to request
-        request.os = self.get_os(request)
-        request.os_mobile = request.os in ['android', 'ios', 'any']
+                CachedMessage.objects.filter(pk__in=[m.pk for m in stored_msgs]).delete()
 
-        # Get data that is used with every request and requires database access and cache it
-        cache_key = 'request_context'
-        cached = cache.get(cache_key)
-        if cached is None:
-            cached = {
-                'menuitems': MenuItem.objects.all(),
-            }
-            for item in cached['menuitems']:
-                item.cached_data  # touch cached_data to make sure that all properties serialized
+        # Attach OS information to request. The user agent is only parsed if the OS is actually used.
+        request.os = SimpleLazyObject(lambda: self.get_os(request))
+        request.os_mobile = SimpleLazyObject(lambda: str(request.os) in _MOBILE_OS)
 
-            cache.set(cache_key, cached)
-        request.hp_request_context = cached
+        # Get data that is used with every request and requires database access (held in memory)
+        request.hp_request_context = {
+            'menu': get_menu(),
+        }
 
         response = self.get_response(request)
         return response
@@ -158,3 +164,81 @@ def security_headers_middleware(get_response):
         response['X-Content-Type-Options'] = 'nosniff'
         return response
     return middleware
+
+
+def cache_response(view):
+    """Decorator marking a view function as cacheable by :py:class:`~core.middleware.ResponseCacheMiddleware`.
+
+    Class-based views set the ``cache_response`` class attribute instead.
+    """
+    view.cache_response = True
+    return view
+
+
+class ResponseCacheMiddleware(object):
+    """Cache complete responses for anonymous users.
+
+    Only responses of views that opt in are cached, either with the
+    :py:func:`~core.middleware.cache_response` decorator or (for class-based views) by setting the
+    ``cache_response`` class attribute to ``True``. Views must only opt in if their response does not depend
+    on anything but the host, language, OS and path of the request.
+
+    Responses are cached per scheme, host, language, OS and path for ``RESPONSE_CACHE_TIMEOUT`` seconds. The
+    cache is invalidated whenever a blog post, page, menu item or certificate changes. Only ``GET`` requests
+    without a query string are cached, responses that set cookies (including CSRF tokens), use messages,
+    modify the session or are marked as private or uncacheable are never cached.
+
+    This middleware must come after :py:class:`~core.middleware.HomepageMiddleware`.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def get_cache_key(self, request):
+        version = get_cache_version(RESPONSE_CACHE_VERSION_CACHE_KEY)
+        key = '%s:%s:%s:%s:%s' % (request.scheme, request.get_host(), request.LANGUAGE_CODE, request.os,
+                                  request.path)
+        return 'response_%s_%s' % (hashlib.md5(key.encode('utf-8')).hexdigest(), version)
+
+    def is_cacheable_view(self, view_func):
+        view_class = getattr(view_func, 'view_class', None)
+        if view_class is not None:
+            return getattr(view_class, 'cache_response', False)
+        return getattr(view_func, 'cache_response', False)
+
+    def is_cacheable_request(self, request):
+        return settings.RESPONSE_CACHE_TIMEOUT and request.method == 'GET' and not request.GET \
+            and request.user.is_anonymous and not len(messages.get_messages(request))
+
+    def is_cacheable_response(self, request, response):
+        if response.status_code != 200 or response.streaming or response.cookies:
+            return False
+        if request.META.get('CSRF_COOKIE_USED') or request.session.modified:
+            return False
+
+        storage = messages.get_messages(request)
+        if storage.added_new or storage.used:
+            return False
+
+        cache_control = response.get('Cache-Control', '')
+        return not any(d in cache_control for d in ['private', 'no-cache', 'no-store'])
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not self.is_cacheable_view(view_func) or not self.is_cacheable_request(request):
+            return None
+
+        cache_key = self.get_cache_key(request)
+        response = cache.get(cache_key)
+        if response is not None:
+            return response
+
+        request._response_cache_key = cache_key  # store the response in __call__()
+        return None
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        cache_key = getattr(request, '_response_cache_key', None)
+        if cache_key is not None and self.is_cacheable_response(request, response):
+            cache.set(cache_key, response, settings.RESPONSE_CACHE_TIMEOUT)
+        return response
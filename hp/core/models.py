@@ -14,9 +14,12 @@
 # <http://www.gnu.org/licenses/>.
 
 from django.conf import settings
+from django.core.cache import cache
 from django.db import models
-from django.utils import translation
-from django.utils.translation import get_language
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_save
+from django.dispatch import receiver
 from django.utils.translation import gettext_lazy as _
 
 #from composite_field.l10n import LocalizedCharField
@@ -35,6 +38,9 @@ from .modelfields import LinkTarget
 from .modelfields import LocalizedCharField
 from .querysets import AddressActivityQuerySet
 from .querysets import AddressQuerySet
+from .utils import MENU_VERSION_CACHE_KEY
+from .utils import RESPONSE_CACHE_VERSION_CACHE_KEY
+from .utils import bump_cache_versions_on_commit
 
 
 class BaseModel(models.Model):
@@ -50,7 +56,6 @@ class MenuItem(MPTTModel, BaseModel):
     parent = TreeForeignKey('self', models.PROTECT, null=True, blank=True, related_name='children',
                             db_index=True)
     target = LinkTarget()
-    _cached_data = None
 
     def __str__(self):
         return self.title.current
@@ -58,54 +63,37 @@ class MenuItem(MPTTModel, BaseModel):
     class MPTTMeta:
         order_insertion_by = ['title_en']
 
-    @property
-    def navkey(self):
-        """The key identifying this menuitem, used to display a menuitem as active."""
 
-        return self.cached_data.get('navkey')
-
-    @property
-    def href(self):
-        """Link to this menuitem in the current language."""
-
-        lang = get_language()
-        return self.cached_data.get(lang, {}).get('href', '')
-
-    def is_active_parent(self, menuitem):
-        return menuitem in self.cached_data['children']
-
-    @property
-    def cached_data(self):
-        """Precomputed data in all languages."""
-
-        lang = get_language()
-        if lang is None:
-            return {}
-
-        if self._cached_data is None:
-            data = {
-                'navkey': self.target.menu_key,
-                'children': [n.navkey for n in self.get_descendants()],
-            }
-
-            # set language-specific link
-            for code, _name in settings.LANGUAGES:
-                with translation.override(code):
-                    data[code] = {
-                        'href': self.target.href,
-                    }
-
-            self._cached_data = data
+class CachedMessage(BaseModel):
+    """A message for a user that is displayed with the next request of the user.
 
-        return self._cached_data
+    Messages are usually created by asynchronous tasks. A marker in the cache records if a user has any
+    pending messages, so that the database only has to be queried if there are any messages. If the marker
+    is missing (e.g. because it expired or was never set), the database is queried as well.
+    """
 
+    # Messages are removed by the cleanup task after 31 days, so the marker expires as well
+    PENDING_TIMEOUT = 86400 * 31
 
-class CachedMessage(BaseModel):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, models.CASCADE, db_index=True)
     level = models.IntegerField()
     message = models.TextField()
     payload = models.TextField(default='{}')
 
+    @classmethod
+    def get_cache_key(cls, user_id):
+        return 'pending_messages_%s' % user_id
+
+    @classmethod
+    def has_pending(cls, user_id):
+        """Return ``True`` if there may be pending messages for the given user."""
+        return cache.get(cls.get_cache_key(user_id), True)
+
+    @classmethod
+    def set_pending(cls, user_id, pending=True):
+        """Set the marker for pending messages of the given user."""
+        cache.set(cls.get_cache_key(user_id), pending, cls.PENDING_TIMEOUT)
+
 
 class Address(models.Model):
     objects = AddressManager.from_queryset(AddressQuerySet)()
@@ -148,3 +136,17 @@ class AddressActivity(models.Model):
     def __str__(self):
         return '%s: %s/%s' % (self.ACTIVITY_CHOICES[self.activity],
                               self.address.address, self.user.username)
+
+
+@receiver(post_save, sender=CachedMessage)
+def set_pending_messages(sender, instance, created, **kwargs):
+    if created:
+        # Set the marker only after commit, so that a concurrent request does not query the database
+        # (and reset the marker) before the message is visible.
+        transaction.on_commit(lambda: CachedMessage.set_pending(instance.user_id))
+
+
+@receiver(post_save, sender=MenuItem)
+@receiver(post_delete, sender=MenuItem)
+def menuitem_changed(sender, **kwargs):
+    bump_cache_versions_on_commit(MENU_VERSION_CACHE_KEY, RESPONSE_CACHE_VERSION_CACHE_KEY)
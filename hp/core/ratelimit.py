@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the jabber.at homepage (https://github.com/jabber-at/hp).
+#
+# This project is free software: you can redistribute it and/or modify it under the terms of the GNU General
+# Public License as published by the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This project is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License along with this project. If not, see
+# <http://www.gnu.org/licenses/>.
+
+"""Backends to ratelimit activities (e.g. registrations) per IP address.
+
+The backend is configured with the ``RATELIMIT_BACKEND`` setting, limits are configured with the
+``RATELIMIT_CONFIG`` setting.
+"""
+
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+_backend = None
+
+
+class RateLimitBackend(object):
+    """Base class for all ratelimit backends.
+
+    Parameters
+    ----------
+
+    config : dict, optional
+        Mapping of activities to a list of ``(timedelta, limit)`` tuples. The default is the
+        ``RATELIMIT_CONFIG`` setting.
+    """
+
+    def __init__(self, config=None):
+        if config is None:
+            config = settings.RATELIMIT_CONFIG
+        self.config = config
+
+    def is_limited(self, activity, address, now=None):
+        """Return ``True`` if the address exceeded any limit configured for the given activity."""
+        raise NotImplementedError
+
+    def hit(self, activity, address, now=None):
+        """Record that the given address performed the given activity."""
+        raise NotImplementedError
+
+
+class CacheRateLimitBackend(RateLimitBackend):
+    """Ratelimit backend using atomic counters in a Django cache.
+
+    Every configured time window is split into ``buckets`` fixed-size buckets with a counter each. The
+    number of hits in the window is the sum of all buckets in the window, with the oldest bucket weighted
+    by how much of it still overlaps with the window ("sliding window counter"). Old buckets simply expire
+    from the cache.
+
+    Checking an address costs a single ``get_many()`` for all windows, recording a hit uses atomic
+    ``add()``/``incr()`` calls, so counting is correct with many concurrent workers if the cache backend
+    implements these atomically (e.g. Redis or Memcached).
+
+    Parameters
+    ----------
+
+    cache : str, optional
+        The cache alias to use, the default is ``"default"``.
+    buckets : int, optional
+        Into how many buckets a time window is split.
+    """
+
+    def __init__(self, cache='default', buckets=10, **kwargs):
+        super().__init__(**kwargs)
+        self.cache = caches[cache]
+        self.buckets = buckets
+
+    def get_width(self, delta):
+        """Get the width of a bucket in seconds for a window of the given timedelta."""
+        return max(int(delta.total_seconds()) // self.buckets, 1)
+
+    def get_key(self, activity, address, width, index):
+        return 'rate_%s_%s_%s_%s' % (activity, address, width, index)
+
+    def get_windows(self, activity, address, now):
+        """Yield the limit, the cache keys and the weights of the buckets for each window."""
+
+        for delta, limit in self.config.get(activity, ()):
+            width = self.get_width(delta)
+            current = int(now) // width
+            start = now - delta.total_seconds()
+            buckets = []
+
+            for index in range(current - self.buckets, current + 1):
+                # weight is the share of the bucket that is still within the window
+                weight = min(max(((index + 1) * width - start) / width, 0), 1)
+                if weight > 0:
+                    buckets.append((self.get_key(activity, address, width, index), weight))
+
+            yield limit, buckets
+
+    def is_limited(self, activity, address, now=None):
+        if now is None:
+            now = time.time()
+
+        windows = list(self.get_windows(activity, address, now))
+        if not windows:
+            return False
+
+        counters = self.cache.get_many([key for limit, buckets in windows for key, weight in buckets])
+        for limit, buckets in windows:
+            if sum(counters.get(key, 0) * weight for key, weight in buckets) > limit:
+                return True
+        return False
+
+    def hit(self, activity, address, now=None):
+        if now is None:
+            now = time.time()
+
+        keys = {}
+        for delta, limit in self.config.get(activity, ()):
+            width = self.get_width(delta)
+            key = self.get_key(activity, address, width, int(now) // width)
+            keys[key] = width * (self.buckets + 2)  # keep the bucket as long as it's in any window
+
+        for key, timeout in keys.items():
+            self.cache.add(key, 0, timeout=timeout)
+            try:
+                self.cache.incr(key)
+            except ValueError:  # key expired in the meantime
+                self.cache.set(key, 1, timeout=timeout)
+
+
+def get_backend():
+    """Get the ratelimit backend configured by the ``RATELIMIT_BACKEND`` setting.
+
+    The backend is loaded only once per process.
+    """
+    global _backend
+
+    if _backend is None:
+        config = settings.RATELIMIT_BACKEND
+        _backend = import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+    return _backend
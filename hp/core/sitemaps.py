@@ -13,9 +13,18 @@
 # You should have received a copy of the GNU General Public License along with this project. If not, see
 # <http://www.gnu.org/licenses/>.
 
+import hashlib
+from functools import wraps
+
+from django.conf import settings
 from django.contrib.sitemaps import Sitemap
+from django.contrib.sitemaps import views
+from django.core.cache import cache
 from django.urls import reverse
 
+from .utils import SITEMAP_VERSION_CACHE_KEY
+from .utils import get_cache_version
+
 
 class SitemapMixin(object):
     protocol = 'https'
@@ -46,3 +55,31 @@ class StaticSitemap(SitemapMixin, Sitemap):
 
     def location(self, item):
         return reverse(item)
+
+
+def cache_sitemap(view):
+    """Decorator to cache the rendered XML of a sitemap view.
+
+    Responses are cached per host, section and page for ``SITEMAP_CACHE_TIMEOUT`` seconds or until a blog
+    post or page changes, so crawlers do not cause any load once a sitemap was rendered.
+    """
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = '%s:%s:%s' % (request.get_host(), kwargs.get('section'), request.GET.get('p', 1))
+        cache_key = 'sitemap_%s_%s' % (hashlib.md5(key.encode('utf-8')).hexdigest(),
+                                       get_cache_version(SITEMAP_VERSION_CACHE_KEY))
+        response = cache.get(cache_key)
+        if response is not None:
+            return response
+
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200:
+            response.render()
+            cache.set(cache_key, response, settings.SITEMAP_CACHE_TIMEOUT)
+        return response
+    return wrapper
+
+
+index = cache_sitemap(views.index)
+sitemap = cache_sitemap(views.sitemap)
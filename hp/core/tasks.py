@@ -29,9 +29,13 @@ from django.utils import translation
 from gpgliblib.django import GpgEmailMessage
 from xmpp_http_upload.models import Upload
 
+from .exceptions import TemporaryError
+from .mail import PreparedMessage
+from .mail import send_message
 from .models import Address
 from .models import AddressActivity
 from .models import CachedMessage
+from .utils import check_dnsbl
 from .utils import load_contact_keys
 
 User = get_user_model()
@@ -120,23 +124,39 @@ def send_contact_email(hostname, subject, message, recipient=None, user_pk=None,
         recv_fps += contact_fps.keys()
         sign_fp = host.get('GPG_FINGERPRINT')
 
-        with user.gpg_keyring(default_trust=True, hostname=hostname) as backend:
+        with user.gpg_host_keyring(hostname, default_trust=True) as keyring:
             for contact_key in contact_fps.values():
-                backend.import_key(contact_key)
+                keyring.import_key(contact_key)
 
             msg = GpgEmailMessage(
                 subject, message, from_email, recipient_list, reply_to=reply_to, headers=headers,
-                gpg_backend=backend, gpg_recipients=recv_fps, gpg_signer=sign_fp)
+                gpg_backend=keyring.backend, gpg_recipients=recv_fps, gpg_signer=sign_fp)
 
             # Attach the users public key(s) as "key.asc" so we can reply encrypted.
             attachment = ''.join(user.gpg_keys.valid().values_list('key', flat=True))
             msg.attach('key.asc', attachment, 'text/gpg-key')
+            msg = PreparedMessage(msg)  # encrypt while the keyring is held
 
-            msg.send()
+        send_message(msg)
     else:
         email = EmailMessage(subject, message, from_email=from_email, to=recipient_list, reply_to=reply_to,
                              headers=headers)
-        email.send()
+        send_message(email)
+
+
+@shared_task
+def warm_dnsbl_cache(*addresses):
+    """Check the given IP addresses for DNSBL listings so that the results are cached.
+
+    Usage::
+
+        >>> warm_dnsbl_cache.delay('192.0.2.1', '192.0.2.2')
+    """
+    for address in addresses:
+        try:
+            check_dnsbl(address)
+        except TemporaryError:
+            log.warning('%s: Could not check DNS-based blocklists.', address)
 
 
 @shared_task
@@ -27,6 +27,8 @@ from selenium.webdriver.support.wait import WebDriverWait
 
 from django.conf import settings
 from django.contrib.staticfiles.testing import StaticLiveServerTestCase
+from django.db import DEFAULT_DB_ALIAS
+from django.db import connections
 from django.test import TestCase as DjangoTestCase
 
 VIRTUAL_DISPLAY = os.environ.get('VIRTUAL_DISPLAY', 'y').lower().strip() == 'y'
@@ -62,6 +64,23 @@ class HomepageTestCaseMixin(object):
         with mock.patch('celery.app.task.Task.apply_async', side_effect=run, autospec=True) as mocked:
             yield mocked
 
+    @contextmanager
+    def captureOnCommitCallbacks(self, using=DEFAULT_DB_ALIAS, execute=False):
+        """Context manager to capture (and optionally execute) ``transaction.on_commit()`` callbacks.
+
+        Backport of ``TestCase.captureOnCommitCallbacks()`` from Django 3.2: Tests run in a transaction
+        that is never committed, so callbacks would otherwise never be executed.
+        """
+        callbacks = []
+        start_count = len(connections[using].run_on_commit)
+        try:
+            yield callbacks
+        finally:
+            callbacks[:] = [func for sids, func in connections[using].run_on_commit[start_count:]]
+            if execute:
+                for callback in callbacks:
+                    callback()
+
 
 class SeleniumMixin(object):
     @classmethod
@@ -14,16 +14,24 @@
 # <http://www.gnu.org/licenses/>.
 
 import doctest
+from io import StringIO
 
+from django.core.management import call_command
 from django.test import Client
 from django.test import override_settings
 
+from blog.models import Page
+
+from .. import menu
 from .. import utils
 from ..templatetags import icons
+from ..utils import SiteIndex
+from ..utils import absolutify_html
 from .base import TestCase
 
 
 def load_tests(loader, tests, ignore):
+    tests.addTests(doctest.DocTestSuite(menu))
     tests.addTests(doctest.DocTestSuite(utils))
     tests.addTests(doctest.DocTestSuite(icons))
     return tests
@@ -46,3 +54,65 @@ class MiddlewareTestCase(TestCase):
             # If we execute the test-suite with "manage.py test" instead of "fab test", localsettings will be
             # used and the results are different.
             self.assertEqual(response.wsgi_request.site['NAME'], 'example.com', 'Tested with fab test?')
+
+
+class SiteIndexTestCase(TestCase):
+    def test_last_match_wins(self):
+        a = {'ALLOWED_HOSTS': ['example.com', '.example.net']}
+        b = {'ALLOWED_HOSTS': ['.example.com', 'www.example.net']}
+        c = {'ALLOWED_HOSTS': ['example.org', 'EXAMPLE.com']}
+        index = SiteIndex({'a': a, 'b': b, 'c': c}, 'default')
+
+        self.assertIs(index.resolve('example.com'), c)  # exact match in a and c, wildcard in b
+        self.assertIs(index.resolve('Example.COM:8080'), c)
+        self.assertIs(index.resolve('www.example.com'), b)
+        self.assertIs(index.resolve('example.net'), a)
+        self.assertIs(index.resolve('www.example.net'), b)
+        self.assertIs(index.resolve('foo.example.net'), a)
+        self.assertIs(index.resolve('example.org'), c)
+        self.assertEqual(index.resolve('example.at'), 'default')
+        self.assertEqual(index.resolve('[invalid'), 'default')
+
+        # the order of sites decides the result
+        index = SiteIndex({'c': c, 'b': b, 'a': a}, 'default')
+        self.assertIs(index.resolve('example.com'), a)
+        self.assertIs(index.resolve('www.example.com'), b)
+
+    def test_catch_all(self):
+        a = {'ALLOWED_HOSTS': ['example.com']}
+        b = {'ALLOWED_HOSTS': ['*']}
+        self.assertIs(SiteIndex({'a': a, 'b': b}, 'default').resolve('example.com'), b)
+        self.assertIs(SiteIndex({'b': b, 'a': a}, 'default').resolve('example.com'), a)
+        self.assertIs(SiteIndex({'b': b, 'a': a}, 'default').resolve('example.net'), b)
+
+    def test_cache(self):
+        index = SiteIndex({'a': {'ALLOWED_HOSTS': ['example.com']}}, 'default')
+        index.resolve('example.com')
+        index.resolve('example.com')
+        self.assertEqual(index.resolve.cache_info().hits, 1)
+
+
+class AbsolutifyHtmlTestCase(TestCase):
+    def test_round_trip(self):
+        base_url = 'https://example.com'
+        for html in ['<p>foo <!-- comment --> bar</p>',
+                     '<svg><style><![CDATA[a > b { color: red; }]]></style></svg>',
+                     '<![if !IE]><p>foo</p><![endif]>',
+                     '<!DOCTYPE html><p>&amp; &lt; &#228;</p>']:
+            self.assertEqual(absolutify_html(html, base_url), html)
+
+        self.assertEqual(absolutify_html('<![CDATA[x]]><a href="/y">y</a>', base_url),
+                         '<![CDATA[x]]><a href="https://example.com/y">y</a>')
+
+
+class BenchmarkAbsolutifyHtmlTestCase(TestCase):
+    def test_command(self):
+        stdout = StringIO()
+        call_command('benchmark_absolutify_html', stdout=stdout)
+        self.assertEqual(stdout.getvalue(), 'No blog posts or pages found.\n')
+
+        Page.objects.create(title_en='t', title_de='t', slug_en='en', slug_de='de',
+                            text_en='<p><a href="/foo/">foo</a></p>', text_de='<p>bar</p>')
+        stdout = StringIO()
+        call_command('benchmark_absolutify_html', number=1, stdout=stdout)
+        self.assertIn('Speedup: ', stdout.getvalue())
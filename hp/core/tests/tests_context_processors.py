@@ -13,10 +13,15 @@
 # You should have received a copy of the GNU General Public License along with this project. If not, see
 # <http://www.gnu.org/licenses/>.
 
+from unittest import mock
+
+from ua_parser import user_agent_parser
+
 from django.conf import settings
 from django.test import Client
 from django.test import override_settings
 
+from ..middleware import parse_os
 from .base import TestCase
 
 
@@ -122,3 +127,35 @@ class ContextProcessorTestCase(TestCase):
         self.assertOS(
             'Mozilla/5.0 (Linux; Android; 4.1.2; GT-I9100 Build/000000) AppleWebKit/537.22 (KHTML, like Gecko) Chrome/25.0.1234.12 Mobile Safari/537.22 OPR/14.0.123.123',  # NOQA
             'android', True)
+
+    def test_os_override(self):
+        c = Client()
+        ua = 'Mozilla/5.0 (X11; Linux x86_64; rv:57.0) Gecko/20100101 Firefox/57.0'
+        response = c.get('/', {'os': 'ios'}, HTTP_USER_AGENT=ua)
+        self.assertEqual(response.context['os'], 'ios')
+        self.assertTrue(response.context['os_mobile'])
+
+        # unknown values are ignored
+        response = c.get('/', {'os': '<script>'}, HTTP_USER_AGENT=ua)
+        self.assertEqual(response.context['os'], 'linux')
+        self.assertFalse(response.context['os_mobile'])
+
+    def test_os_lazy(self):
+        c = Client()
+        ua = 'Mozilla/5.0 (X11; Linux x86_64; rv:58.0) Gecko/20100101 Firefox/58.0'
+        parse_os.cache_clear()
+
+        with mock.patch('ua_parser.user_agent_parser.ParseOS', wraps=user_agent_parser.ParseOS) as parse:
+            response = c.get('/', HTTP_USER_AGENT=ua)
+            self.assertEqual(response.status_code, 200)
+            parse.assert_not_called()  # the OS was not used during the request
+
+            self.assertEqual(response.context['os'], 'linux')
+            parse.assert_called_once_with(ua)
+
+            # the result is cached
+            response = c.get('/', HTTP_USER_AGENT=ua)
+            self.assertEqual(response.context['os'], 'linux')
+            parse.assert_called_once_with(ua)
+            self.assertEqual(parse_os.cache_info().hits, 1)
+            self.assertEqual(parse_os.cache_info().misses, 1)
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the jabber.at homepage (https://github.com/jabber-at/hp).
+#
+# This project is free software: you can redistribute it and/or modify it under the terms of the
+# GNU General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This project is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this project. If
+# not, see <http://www.gnu.org/licenses/>.
+
+import socket
+import threading
+from unittest import mock
+
+import dns.message
+import dns.rcode
+import dns.rdatatype
+import dns.resolver
+import dns.rrset
+
+from django.core.cache import cache
+from django.test import override_settings
+
+from ..exceptions import TemporaryError
+from ..utils import check_dnsbl
+from .base import TestCase
+
+
+class StubDnsServer(threading.Thread):
+    """A minimal DNS server answering A and TXT queries for the given names.
+
+    Queries for any other name are answered with NXDOMAIN, queries for names (or tuples of a name and
+    a record type) in ``silent`` are not answered at all.
+    """
+
+    def __init__(self, listed, silent=None):
+        super().__init__(daemon=True)
+        self.listed = listed
+        self.silent = silent or set()
+        self.queries = []
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.port = self.sock.getsockname()[1]
+
+    def run(self):
+        while True:
+            try:
+                data, addr = self.sock.recvfrom(4096)
+            except OSError:  # socket was closed
+                return
+
+            request = dns.message.from_wire(data)
+            question = request.question[0]
+            name = question.name.to_text()
+            self.queries.append((name, question.rdtype))
+            if name in self.silent or (name, question.rdtype) in self.silent:
+                continue
+
+            response = dns.message.make_response(request)
+            if name in self.listed:
+                if question.rdtype == dns.rdatatype.A:
+                    rrset = dns.rrset.from_text(question.name, 300, 'IN', 'A', '127.0.0.2')
+                else:
+                    rrset = dns.rrset.from_text(question.name, 300, 'IN', 'TXT', '"%s"' % self.listed[name])
+                response.answer.append(rrset)
+            else:
+                response.set_rcode(dns.rcode.NXDOMAIN)
+            self.sock.sendto(response.to_wire(), addr)
+
+    def get_resolver(self):
+        resolver = dns.resolver.Resolver(configure=False)
+        resolver.nameservers = ['127.0.0.1']
+        resolver.port = self.port
+        resolver.lifetime = 1
+        return resolver
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.sock.close()
+
+
+@override_settings(DNSBL=('one.example.com', 'two.example.com'), DNSBL_TIMEOUT=1)
+class CheckDnsblTests(TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def check(self, server, ip):
+        with mock.patch('core.utils.get_dnsbl_resolver', return_value=server.get_resolver()):
+            return check_dnsbl(ip)
+
+    def test_not_listed(self):
+        with StubDnsServer({}) as server:
+            self.assertEqual(self.check(server, '192.0.2.1'), [])
+            self.assertEqual(len(server.queries), 2)
+
+            # second check is cached
+            self.assertEqual(self.check(server, '192.0.2.1'), [])
+            self.assertEqual(len(server.queries), 2)
+
+    def test_listed(self):
+        with StubDnsServer({'1.2.0.192.two.example.com.': 'spammer'}) as server:
+            self.assertEqual(self.check(server, '192.0.2.1'), [('two.example.com', '"spammer"')])
+            self.assertEqual(self.check(server, '192.0.2.2'), [])
+
+    def test_timeout(self):
+        with StubDnsServer({}, silent={'1.2.0.192.one.example.com.'}) as server:
+            with self.assertRaises(TemporaryError):
+                self.check(server, '192.0.2.1')
+
+            # errors are not cached
+            self.assertIsNone(cache.get('dnsbl_192.0.2.1'))
+
+    def test_reason_timeout(self):
+        # The A record answered, so the listing is returned even if the reason is too slow
+        name = '1.2.0.192.two.example.com.'
+        with StubDnsServer({name: 'spammer'}, silent={(name, dns.rdatatype.TXT)}) as server:
+            self.assertEqual(self.check(server, '192.0.2.1'), [('two.example.com', None)])
+            self.assertEqual(cache.get('dnsbl_192.0.2.1'), [('two.example.com', None)])
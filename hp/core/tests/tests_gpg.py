@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the jabber.at homepage (https://github.com/jabber-at/hp).
+#
+# This project is free software: you can redistribute it and/or modify it under the terms of the
+# GNU General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This project is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this project. If
+# not, see <http://www.gnu.org/licenses/>.
+
+import copy
+import os
+import tempfile
+import threading
+from datetime import timedelta
+from unittest import mock
+from urllib.error import URLError
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache
+from django.test import override_settings
+from django.utils import timezone
+
+from gpgliblib.base import GpgBackendBase
+
+from ..gpg import KeyFetcher
+from ..gpg import Keyring
+from ..gpg import KeyringPool
+from ..gpg import get_keyring_pool
+from ..mail import mail_queue
+from .base import TestCase
+
+User = get_user_model()
+
+
+class FakeKey(object):
+    def __init__(self, backend, fp):
+        self.backend = backend
+        self.fp = fp
+
+    def delete(self):
+        self.backend.keys.remove(self.fp)
+
+
+class FakeBackend(object):
+    """Backend that only records which keys are in the keyring."""
+
+    def __init__(self):
+        self.keys = set()
+        self.imports = 0
+
+    def import_key(self, data):
+        self.imports += 1
+        fp = data.decode('utf-8').upper()
+        self.keys.add(fp)
+        return [FakeKey(self, fp)]
+
+    def list_keys(self, query=None):
+        return [FakeKey(self, fp) for fp in self.keys if fp == query]
+
+
+class StubGpgBackend(GpgBackendBase):
+    """Backend that records imported keys and "encrypts" messages without calling GnuPG."""
+
+    imported = []  # tuples of home directory, key data and if the key is a private key
+
+    def import_key(self, data):
+        self.imported.append((self._home, data, False))
+        return [FakeKey(self, data.decode('utf-8').upper())]
+
+    def import_private_key(self, data):
+        self.imported.append((self._home, data, True))
+
+    def list_keys(self, query=None, secret_keys=False):
+        return []
+
+    def encrypt(self, data, recipients, **kwargs):
+        return b'encrypted'
+
+    def sign_encrypt(self, data, recipients, signer, **kwargs):
+        return b'signed and encrypted'
+
+    def sign(self, data, signer):
+        return b'signature'
+
+
+class KeyringTestCase(TestCase):
+    def test_import(self):
+        backend = FakeBackend()
+        keyring = Keyring(backend, settings.DEFAULT_XMPP_HOST, size=2)
+
+        self.assertEqual(keyring.import_key('aa'), ['AA'])
+        self.assertEqual(keyring.import_key(b'aa'), ['AA'])
+        self.assertEqual(backend.imports, 1)  # second import is cached
+
+        keyring.import_key('bb')
+        keyring.import_key('aa')  # aa is now the most recently used key
+        keyring.import_key('cc')
+        self.assertEqual(backend.keys, {'AA', 'CC'})
+        self.assertEqual(list(keyring.keys.values()), [['AA'], ['CC']])
+
+        # evicted keys are imported again
+        keyring.import_key('bb')
+        self.assertEqual(backend.keys, {'CC', 'BB'})
+        self.assertEqual(backend.imports, 4)
+
+
+class KeyringPoolTestCase(TestCase):
+    """Test the keyring pool with a private key configured for the default host."""
+
+    fingerprint = 'HOSTFP'
+
+    def setUp(self):
+        super().setUp()
+        StubGpgBackend.imported = []
+
+        keydir = tempfile.TemporaryDirectory()
+        self.addCleanup(keydir.cleanup)
+        for ext, data in [('key', b'host-private'), ('pub', b'host-public')]:
+            with open(os.path.join(keydir.name, '%s.%s' % (self.fingerprint, ext)), 'wb') as stream:
+                stream.write(data)
+
+        hosts = copy.deepcopy(settings.XMPP_HOSTS)
+        hosts[settings.DEFAULT_XMPP_HOST]['GPG_FINGERPRINT'] = self.fingerprint
+        overridden = override_settings(GPG_KEYDIR=keydir.name, XMPP_HOSTS=hosts)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+
+        for patcher in [mock.patch('core.gpg.gpg_backend', new=StubGpgBackend()),
+                        mock.patch('core.gpg._pool', None)]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def private_imports(self):
+        return [(home, data) for home, data, private in StubGpgBackend.imported if private is True]
+
+    def test_keyring(self):
+        pool = KeyringPool(size=10)
+        host = settings.DEFAULT_XMPP_HOST
+
+        with pool.keyring(host) as keyring:
+            self.assertTrue(keyring.lock.locked())
+            self.assertEqual(keyring.fingerprint, self.fingerprint)
+            self.assertEqual(keyring.size, 10)
+        self.assertFalse(keyring.lock.locked())
+
+        with pool.keyring(host) as other:
+            self.assertIs(other, keyring)
+
+        # different backend settings use a different keyring
+        with pool.keyring(host, default_trust=True) as other:
+            self.assertIsNot(other, keyring)
+            self.assertNotEqual(other.backend._home, keyring.backend._home)
+            self.assertTrue(other.backend._default_trust)
+
+        # the private key was imported once per keyring
+        self.assertEqual(self.private_imports(), [
+            (keyring.backend._home, b'host-private'),
+            (other.backend._home, b'host-private'),
+        ])
+
+    def test_send_mail(self):
+        user = User.objects.create(username='user@%s' % settings.DEFAULT_XMPP_HOST, email='user@example.net')
+        user.gpg_keys.create(fingerprint='USERFP', key='userfp', expires=timezone.now() + timedelta(days=1))
+
+        user.send_mail('subject', 'message', '<p>message</p>')
+        with mail_queue():
+            user.send_mail('subject', 'message', '<p>message</p>')
+            user.send_mail('subject', 'message', '<p>message</p>')
+
+        self.assertEqual(len(mail.outbox), 3)
+        for message in mail.outbox:
+            self.assertEqual(message.message().get_content_type(), 'multipart/encrypted')
+
+        # private and public keys are imported only once
+        self.assertEqual(len(self.private_imports()), 1)
+        self.assertEqual([data for home, data, private in StubGpgBackend.imported if private is False],
+                         [b'host-public', b'userfp'])
+
+    def test_send_mail_unlocked(self):
+        # messages are encrypted while the keyring is held, but sent after it was released
+        user = User.objects.create(username='user@%s' % settings.DEFAULT_XMPP_HOST, email='user@example.net')
+        user.gpg_keys.create(fingerprint='USERFP', key='userfp', expires=timezone.now() + timedelta(days=1))
+        locked = []
+
+        def send_messages(backend, messages):
+            for keyring in get_keyring_pool().keyrings.values():
+                locked.append(keyring.lock.locked())
+            return len(messages)
+
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', autospec=True,
+                        side_effect=send_messages):
+            user.send_mail('subject', 'message', '<p>message</p>')
+        self.assertEqual(locked, [False])
+
+
+class KeyFetcherTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def mock_backend(self, fetch_key=None):
+        # NOTE: pass a new mock, introspecting the proxy would try to load the configured backend
+        backend = mock.Mock()
+        backend.fetch_key.side_effect = fetch_key or self.fetch_key
+        return mock.patch('core.gpg.gpg_backend', new=backend)
+
+    def fetch_key(self, search, keyserver=None):
+        if search == '0xBAD':
+            raise URLError('unreachable')
+        return search.encode('utf-8')
+
+    def test_fetch(self):
+        fetcher = KeyFetcher(keyserver='http://keys.example.com')
+
+        with self.mock_backend() as backend:
+            self.assertEqual(fetcher.fetch('aa'), b'0xAA')
+            self.assertEqual(fetcher.fetch('AA'), b'0xAA')  # cached
+        backend.fetch_key.assert_called_once_with('0xAA', keyserver='http://keys.example.com')
+
+        # refreshing bypasses and updates the cache
+        with self.mock_backend(lambda search, keyserver: b'refreshed') as backend:
+            self.assertEqual(fetcher.fetch('AA', refresh=True), b'refreshed')
+            self.assertEqual(fetcher.fetch('AA'), b'refreshed')
+        backend.fetch_key.assert_called_once_with('0xAA', keyserver='http://keys.example.com')
+
+        # errors are not cached
+        with self.mock_backend() as backend:
+            with self.assertRaises(URLError):
+                fetcher.fetch('bad')
+            with self.assertRaises(URLError):
+                fetcher.fetch('bad')
+        self.assertEqual(backend.fetch_key.call_count, 2)
+        self.assertEqual(fetcher.pending, {})
+
+    def test_concurrent(self):
+        fetcher = KeyFetcher()
+        started = threading.Event()
+        release = threading.Event()
+        results = []
+
+        def fetch_key(search, keyserver=None):
+            started.set()
+            release.wait(5)
+            return search.encode('utf-8')
+
+        def fetch():
+            results.append(fetcher.fetch('AA'))
+
+        with self.mock_backend(fetch_key) as backend:
+            threads = [threading.Thread(target=fetch) for i in range(3)]
+            threads[0].start()
+            started.wait(5)
+            for thread in threads[1:]:
+                thread.start()
+            release.set()
+            for thread in threads:
+                thread.join(5)
+
+        self.assertEqual(results, [b'0xAA'] * 3)
+        backend.fetch_key.assert_called_once_with('0xAA', keyserver=settings.GPG_KEYSERVER)
+
+    def test_fetch_many(self):
+        for workers in [1, 4]:
+            cache.clear()
+            fetcher = KeyFetcher(workers=workers)
+
+            with self.mock_backend() as backend:
+                futures = fetcher.fetch_many(['AA', 'BAD', 'CC'])
+
+            self.assertEqual(futures['AA'].result(), b'0xAA')
+            self.assertEqual(futures['CC'].result(), b'0xCC')
+            with self.assertRaises(URLError):
+                futures['BAD'].result()
+            self.assertEqual(backend.fetch_key.call_count, 3)
+
+            # refreshing fetches all keys again
+            with self.mock_backend() as backend:
+                futures = fetcher.fetch_many(['AA', 'CC'], refresh=True)
+            self.assertEqual(futures['AA'].result(), b'0xAA')
+            self.assertEqual(backend.fetch_key.call_count, 2)
+
+    def test_fetched_while_waiting(self):
+        # another thread finished fetching the key while this thread waited for the lock
+        fetcher = KeyFetcher()
+        with self.mock_backend() as backend, mock.patch('core.gpg.cache') as mocked_cache:
+            mocked_cache.get.side_effect = [None, b'fetched']
+            self.assertEqual(fetcher.fetch('AA'), b'fetched')
+        backend.fetch_key.assert_not_called()
+        self.assertEqual(fetcher.pending, {})
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the jabber.at homepage (https://github.com/jabber-at/hp).
+#
+# This project is free software: you can redistribute it and/or modify it under the terms of the
+# GNU General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This project is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this project. If
+# not, see <http://www.gnu.org/licenses/>.
+
+import asyncore
+import smtpd
+import smtplib
+import threading
+from unittest import mock
+
+from django.core import mail
+from django.core.mail import EmailMessage
+from django.core.mail import get_connection
+from django.test import override_settings
+from django.utils import translation
+
+from ..mail import MailQueue
+from ..mail import MailTemplate
+from ..mail import get_subject_template
+from ..mail import mail_queue
+from ..mail import send_message
+from .base import TestCase
+
+
+class DebuggingServer(smtpd.SMTPServer):
+    """A local SMTP server that records connections and received messages."""
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), None, decode_data=True)
+        self.port = self.socket.getsockname()[1]
+        self.connections = 0
+        self.messages = []
+
+    def handle_accepted(self, conn, addr):
+        self.connections += 1
+        super().handle_accepted(conn, addr)
+
+    def process_message(self, peer, mailfrom, rcpttos, data, **kwargs):
+        self.messages.append((mailfrom, rcpttos, data))
+
+    def start(self):
+        self.thread = threading.Thread(target=asyncore.loop, kwargs={'timeout': 0.1, 'map': self._map})
+        self.thread.start()
+
+    def stop(self):
+        asyncore.close_all(map=self._map)
+        self.thread.join()
+
+
+class MailQueueTestCase(TestCase):
+    def message(self, i):
+        return EmailMessage('subject %s' % i, 'body %s' % i, 'from@example.com', ['user%s@example.com' % i])
+
+    def test_queue(self):
+        with mail_queue(batch_size=2) as queue:
+            for i in range(3):
+                send_message(self.message(i))
+            self.assertEqual(len(mail.outbox), 2)  # first batch was already sent
+
+        self.assertEqual([m.subject for m in mail.outbox], ['subject 0', 'subject 1', 'subject 2'])
+        self.assertEqual(queue.sent, 3)
+
+        # without a queue, messages are sent immediately
+        send_message(self.message(3))
+        self.assertEqual(len(mail.outbox), 4)
+
+    def test_retry(self):
+        connection = get_connection()
+        queue = MailQueue(retries=1, connection=connection)
+        queue.add(self.message(0))
+        queue.add(self.message(1))
+
+        errors = [smtplib.SMTPServerDisconnected(), None, smtplib.SMTPServerDisconnected(),
+                  smtplib.SMTPServerDisconnected()]
+        with mock.patch.object(connection, 'send_messages', side_effect=errors):
+            failed = queue.flush()
+
+        # first message was retried successfully, second message failed twice
+        self.assertEqual(queue.sent, 1)
+        self.assertEqual([m.subject for m in failed], ['subject 1'])
+
+    def test_smtp(self):
+        server = DebuggingServer()
+        server.start()
+        try:
+            with override_settings(EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+                                   EMAIL_HOST='127.0.0.1', EMAIL_PORT=server.port, EMAIL_USE_TLS=False):
+                with mail_queue() as queue:
+                    for i in range(5):
+                        send_message(self.message(i))
+        finally:
+            server.stop()
+
+        self.assertEqual(queue.sent, 5)
+        self.assertEqual(len(server.messages), 5)
+        self.assertEqual(server.connections, 1)
+        self.assertEqual(server.messages[0][1], ['user0@example.com'])
+
+
+class MailTemplateTestCase(TestCase):
+    def test_render(self):
+        get_subject_template.cache_clear()
+        context = {'user': 'foo', 'domain': 'example.com', 'expires': 'tomorrow', 'jid': 'foo@example.com',
+                   'node': 'foo', 'uri': 'https://example.com/confirm/'}
+
+        with translation.override('en'):
+            mail = MailTemplate('account/confirm/register', 'Your new account on {{ domain }}')
+            subject, txt, html = mail.render(context)
+            self.assertEqual(subject, 'Your new account on example.com')
+            self.assertIn('https://example.com/confirm/', txt)
+            self.assertIn('https://example.com/confirm/', html)
+
+            # compiled subject templates are memoised
+            MailTemplate('account/confirm/register', 'Your new account on {{ domain }}')
+            self.assertEqual(get_subject_template.cache_info().hits, 1)
+
+        with translation.override('de'):
+            MailTemplate('account/confirm/register', 'Your new account on {{ domain }}')
+        self.assertEqual(get_subject_template.cache_info().misses, 2)
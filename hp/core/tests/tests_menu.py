@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the jabber.at homepage (https://github.com/jabber-at/hp).
+#
+# This project is free software: you can redistribute it and/or modify it under the terms of the
+# GNU General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This project is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this project. If
+# not, see <http://www.gnu.org/licenses/>.
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.utils import translation
+
+from blog.models import Page
+
+from ..constants import TARGET_MODEL
+from ..constants import TARGET_NAMED_URL
+from ..constants import TARGET_URL
+from ..menu import get_menu
+from ..models import MenuItem
+from .base import TestCase
+
+
+class MenuTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def create(self, title, target, parent=None):
+        return MenuItem.objects.create(title_en=title, title_de='%s (de)' % title, target=target,
+                                       parent=parent)
+
+    def test_cache(self):
+        item = self.create('foo', {'typ': TARGET_URL, 'url': '/foo'})
+        self.assertEqual([n.pk for n in get_menu()], [item.pk])
+
+        # menu is held in memory, no queries required
+        with self.assertNumQueries(0):
+            self.assertEqual([n.pk for n in get_menu()], [item.pk])
+
+        # saving a menu item reloads the menu once the transaction is committed
+        with self.captureOnCommitCallbacks() as callbacks:
+            other = self.create('bar', {'typ': TARGET_URL, 'url': '/bar'})
+        self.assertEqual([n.pk for n in get_menu()], [item.pk])
+        for callback in callbacks:
+            callback()
+        self.assertEqual([n.pk for n in get_menu()], [other.pk, item.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            item.delete()
+        self.assertEqual([n.pk for n in get_menu()], [other.pk])
+
+    def test_dummy_cache(self):
+        item = self.create('foo', {'typ': TARGET_URL, 'url': '/foo'})
+
+        # If the cache stores nothing, the menu is reloaded every time
+        with self.settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+            self.assertEqual([n.pk for n in get_menu()], [item.pk])
+            other = self.create('bar', {'typ': TARGET_URL, 'url': '/bar'})
+            self.assertEqual([n.pk for n in get_menu()], [other.pk, item.pk])
+
+    def test_tree(self):
+        page = Page.objects.create(title_en='page', title_de='page', slug_en='page-en', slug_de='page-de')
+        ct = ContentType.objects.get_for_model(Page)
+
+        root = self.create('root', {'typ': TARGET_URL, 'url': '/root'})
+        contact = self.create('contact', {'typ': TARGET_NAMED_URL, 'name': 'core:contact', 'args': [],
+                                          'kwargs': {}}, parent=root)
+        child = self.create('page', {'typ': TARGET_MODEL, 'content_type': ct.pk, 'object_id': page.pk},
+                            parent=root)
+        menu = get_menu()
+
+        with self.assertNumQueries(0):
+            node = menu.roots[0]
+            self.assertEqual(node.pk, root.pk)
+            self.assertFalse(node.is_leaf_node())
+            self.assertEqual([n.pk for n in node.get_children()], [contact.pk, child.pk])
+
+            self.assertTrue(node.is_active_parent('blog_page:%s' % page.pk))
+            self.assertTrue(node.is_active_parent(('core:contact', (), {})))
+            self.assertFalse(node.is_active_parent('blog_page:0'))
+            self.assertFalse(node.is_active_parent(''))
+            self.assertFalse(node.get_children()[0].is_active_parent(('core:contact', (), {})))
+
+            for lang in ['en', 'de']:
+                with translation.override(lang):
+                    self.assertEqual(node.title, root.title.current)
+                    self.assertEqual(node.get_children()[1].href, page.get_absolute_url())
+
+        # changing the slug of a page updates the menu
+        page.slug_en = 'changed'
+        with self.captureOnCommitCallbacks(execute=True):
+            page.save()
+        with translation.override('en'):
+            self.assertEqual(get_menu().roots[0].get_children()[1].href, page.get_absolute_url())
+
+    def test_model_without_absolute_url(self):
+        # ContentType has no get_absolute_url(), the item is displayed without a link
+        ct = ContentType.objects.get_for_model(ContentType)
+        item = self.create('ct', {'typ': TARGET_MODEL, 'content_type': ct.pk, 'object_id': ct.pk})
+
+        with self.assertLogs('core.menu', level='WARNING') as logs:
+            menu = get_menu()
+        self.assertEqual(logs.output, [
+            'WARNING:core.menu:contenttypes.ContentType: Model has no get_absolute_url()',
+        ] * len(settings.LANGUAGES))
+        self.assertEqual(menu.roots[0].pk, item.pk)
+        self.assertEqual(menu.roots[0].href, '')
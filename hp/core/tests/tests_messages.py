@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the jabber.at homepage (https://github.com/jabber-at/hp).
+#
+# This project is free software: you can redistribute it and/or modify it under the terms of the
+# GNU General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This project is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this project. If
+# not, see <http://www.gnu.org/licenses/>.
+
+from datetime import datetime
+from datetime import timedelta
+
+from freezegun import freeze_time
+
+from django.contrib.auth import get_user_model
+from django.contrib.messages import constants as messages
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import CachedMessage
+from .base import TestCase
+
+User = get_user_model()
+
+
+class CachedMessageTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.user = User.objects.create(username='user@example.com', email='user@example.net')
+        self.client.force_login(self.user)
+
+    def get(self):
+        """Get a page displaying messages, returns the messages and if messages where queried."""
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('account:log'))
+        self.assertEqual(response.status_code, 200)
+
+        queried = any(CachedMessage._meta.db_table in q['sql'] for q in queries.captured_queries)
+        return [str(m) for m in response.context['messages']], queried
+
+    def create_message(self, message):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.message(messages.INFO, message)
+
+    def test_marker(self):
+        self.assertTrue(CachedMessage.has_pending(self.user.pk))  # no marker yet
+        self.assertEqual(self.get(), ([], True))
+        self.assertFalse(CachedMessage.has_pending(self.user.pk))  # marker was reset
+
+        # no query if there are no messages
+        self.assertEqual(self.get(), ([], False))
+
+        self.create_message('first message')
+        self.assertTrue(CachedMessage.has_pending(self.user.pk))
+        self.assertEqual(self.get(), (['first message'], True))
+        self.assertFalse(CachedMessage.has_pending(self.user.pk))
+        self.assertFalse(CachedMessage.objects.exists())
+        self.assertEqual(self.get(), ([], False))
+
+    def test_marker_set_after_commit(self):
+        self.assertEqual(self.get(), ([], True))
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.user.message(messages.INFO, 'message')
+        self.assertEqual(len(callbacks), 1)
+        self.assertFalse(CachedMessage.has_pending(self.user.pk))
+
+        callbacks[0]()
+        self.assertTrue(CachedMessage.has_pending(self.user.pk))
+
+    def test_missing_marker(self):
+        # messages created before markers existed or with an expired marker are still displayed
+        self.assertEqual(self.get(), ([], True))
+        CachedMessage.objects.create(user=self.user, level=messages.INFO, message='old message')
+        cache.delete(CachedMessage.get_cache_key(self.user.pk))
+
+        self.assertEqual(self.get(), (['old message'], True))
+        self.assertEqual(self.get(), ([], False))
+
+    def test_expired_marker(self):
+        now = datetime.utcnow()
+        with freeze_time(now):
+            self.assertEqual(self.get(), ([], True))
+            self.assertEqual(self.get(), ([], False))
+
+        # marker expires, so the database is queried again
+        with freeze_time(now + timedelta(seconds=CachedMessage.PENDING_TIMEOUT + 1)):
+            self.assertTrue(CachedMessage.has_pending(self.user.pk))
+            self.client.force_login(self.user)  # session would have expired as well
+            self.assertEqual(self.get(), ([], True))
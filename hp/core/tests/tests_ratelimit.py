@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the jabber.at homepage (https://github.com/jabber-at/hp).
+#
+# This project is free software: you can redistribute it and/or modify it under the terms of the
+# GNU General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This project is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this project. If
+# not, see <http://www.gnu.org/licenses/>.
+
+from datetime import timedelta
+
+from django.core.cache import cache
+
+from ..ratelimit import CacheRateLimitBackend
+from .base import TestCase
+
+ADDR = '192.0.2.1'
+NOW = 1500000000
+
+
+class CacheRateLimitBackendTests(TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.backend = CacheRateLimitBackend(config={
+            'test': ((timedelta(hours=1), 3), (timedelta(days=1), 5)),
+        })
+
+    def test_basic(self):
+        for i in range(0, 4):
+            self.assertFalse(self.backend.is_limited('test', ADDR, now=NOW))
+            self.backend.hit('test', ADDR, now=NOW)
+
+        self.assertTrue(self.backend.is_limited('test', ADDR, now=NOW))
+        self.assertFalse(self.backend.is_limited('test', '192.0.2.2', now=NOW))
+        self.assertFalse(self.backend.is_limited('other', ADDR, now=NOW))
+
+    def test_window(self):
+        for i in range(0, 4):
+            self.backend.hit('test', ADDR, now=NOW)
+
+        # Hits are no longer in the hourly window
+        self.assertFalse(self.backend.is_limited('test', ADDR, now=NOW + 3600 * 2))
+
+        # ... but still in the daily window
+        for i in range(0, 2):
+            self.backend.hit('test', ADDR, now=NOW + 3600 * 2)
+        self.assertTrue(self.backend.is_limited('test', ADDR, now=NOW + 3600 * 2))
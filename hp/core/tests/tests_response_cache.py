@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the jabber.at homepage (https://github.com/jabber-at/hp).
+#
+# This project is free software: you can redistribute it and/or modify it under the terms of the
+# GNU General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This project is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this project. If
+# not, see <http://www.gnu.org/licenses/>.
+
+import ipaddress
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.db.models.signals import post_save
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import translation
+
+from antispam.utils import invalidate_ip_blacklist
+from blog.models import Page
+from blog.views import BlogPostListView
+from certs.models import Certificate
+
+from ..constants import TARGET_URL
+from ..models import MenuItem
+from ..views import ContactView
+from .base import TestCase
+
+User = get_user_model()
+
+
+@override_settings(RESPONSE_CACHE_TIMEOUT=300)
+class ResponseCacheTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.page = Page.objects.create(title_en='title', title_de='titel', slug_en='en', slug_de='de',
+                                        text_en='<p>English text.</p>', text_de='<p>Deutscher Text.</p>')
+        self.url = self.page.get_absolute_url()
+
+    def assertCached(self, url, **kwargs):
+        response = self.client.get(url, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(0):
+            cached = self.client.get(url, **kwargs)
+        self.assertEqual(cached.content, response.content)
+        return cached
+
+    def test_basic(self):
+        response = self.assertCached(self.url)
+        self.assertContains(response, 'English text.')
+
+        # saving the page invalidates the cache
+        self.page.text_en = '<p>Changed text.</p>'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.page.save()
+        self.assertContains(self.assertCached(self.url), 'Changed text.')
+
+    def test_invalidation(self):
+        self.assertCached(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            MenuItem.objects.create(title_en='foo', title_de='foo',
+                                    target={'typ': TARGET_URL, 'url': '/foo/'})
+        self.assertContains(self.assertCached(self.url), 'href="/foo/"')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            post_save.send(sender=Certificate, instance=Certificate(hostname='example.com'), created=True)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        self.assertGreater(len(queries), 0)
+        self.assertCached(self.url)
+
+    def test_vary(self):
+        self.assertCached(self.url)
+
+        # different operating systems, hosts and languages get different entries
+        response = self.assertCached(self.url, HTTP_USER_AGENT='Mozilla/5.0 (Linux; Android 8.0.0)')
+        self.assertNotEqual(response.wsgi_request.os, 'any')
+        with self.settings(ALLOWED_HOSTS=['testserver', 'example.org']):
+            self.assertCached(self.url, SERVER_NAME='example.org')
+        with translation.override('de'):
+            url = self.page.get_absolute_url()
+        self.assertContains(self.assertCached(url, HTTP_ACCEPT_LANGUAGE='de'), 'Deutscher Text.')
+
+    def test_not_cached(self):
+        self.client.get(self.url)
+
+        # query strings bypass the cache
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url, {'foo': 'bar'})
+        self.assertGreater(len(queries), 0)
+
+        # authenticated users bypass the cache
+        user = User.objects.create(username='user@example.com', email='user@example.com')
+        self.client.force_login(user)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.wsgi_request.user.is_authenticated)
+
+    def test_scheme(self):
+        self.assertCached(self.url)
+        response = self.assertCached(self.url, secure=True)
+        self.assertTrue(response.wsgi_request.is_secure())
+
+    def test_opt_in(self):
+        # views that do not opt in are never cached
+        url = reverse('blog:home')
+        with mock.patch.object(BlogPostListView, 'cache_response', False):
+            self.client.get(url)
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(url)
+            self.assertGreater(len(queries), 0)
+
+    @mock.patch.object(ContactView, 'cache_response', True, create=True)
+    def test_antispam(self):
+        # responses for blacklisted IPs must not be served to other clients, even if the view opts in
+        url = '/contact/'
+        with override_settings(SPAM_BLACKLIST={ipaddress.ip_network('192.0.2.0/24')}):
+            invalidate_ip_blacklist()
+            try:
+                response = self.client.get(url, REMOTE_ADDR='192.0.2.1')
+                self.assertTemplateUsed(response, ContactView.blacklist_template)
+                self.assertIn('no-store', response['Cache-Control'])
+
+                response = self.client.get(url, REMOTE_ADDR='198.51.100.1')
+                self.assertEqual(response.status_code, 200)
+                self.assertTemplateNotUsed(response, ContactView.blacklist_template)
+            finally:
+                invalidate_ip_blacklist()
+
+    def test_csrf(self):
+        # the contact form uses a CSRF token and must never be cached
+        url = '/contact/'
+        self.client.get(url)
+        response = self.client.get(url)
+        self.assertIn('csrftoken', response.cookies)
+
+    @override_settings(RESPONSE_CACHE_TIMEOUT=0)
+    def test_disabled(self):
+        self.client.get(self.url)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context is not None)
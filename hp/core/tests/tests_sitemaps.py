@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the jabber.at homepage (https://github.com/jabber-at/hp).
+#
+# This project is free software: you can redistribute it and/or modify it under the terms of the
+# GNU General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This project is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this project. If
+# not, see <http://www.gnu.org/licenses/>.
+
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from blog.models import BlogPost
+from blog.models import Page
+from blog.sitemaps import PageSitemap
+
+from .base import TestCase
+
+
+class SitemapTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.page = Page.objects.create(title_en='title', title_de='titel', slug_en='page-en',
+                                        slug_de='page-de')
+        self.post = BlogPost.objects.create(title_en='title', title_de='titel', slug_en='post-en',
+                                            slug_de='post-de')
+
+    def test_index(self):
+        response = self.client.get(reverse('core:sitemap'))
+        self.assertEqual(response.status_code, 200)
+        for section in ['blog', 'page', 'static']:
+            self.assertContains(response, reverse('core:sitemap-section', kwargs={'section': section}))
+
+    def test_section(self):
+        url = reverse('core:sitemap-section', kwargs={'section': 'page'})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertFalse([q for q in queries if 'text_en' in q['sql']])  # only required columns are loaded
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '/page-en/')
+        self.assertContains(response, '/page-de/')
+        self.assertNotContains(response, '/post-en/')
+
+        # second request is served from the cache
+        with self.assertNumQueries(0):
+            cached = self.client.get(url)
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(cached['X-Robots-Tag'], response['X-Robots-Tag'])
+
+        # saving a page invalidates the cache
+        self.page.slug_en = 'changed-en'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.page.save()
+        response = self.client.get(url)
+        self.assertContains(response, '/changed-en/')
+        self.assertNotContains(response, '/page-en/')
+
+        response = self.client.get(reverse('core:sitemap-section', kwargs={'section': 'foo'}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_pagination(self):
+        Page.objects.create(title_en='other', title_de='andere', slug_en='other-en', slug_de='other-de')
+
+        with mock.patch.object(PageSitemap, 'limit', 1):
+            response = self.client.get(reverse('core:sitemap'))
+            url = reverse('core:sitemap-section', kwargs={'section': 'page'})
+            self.assertContains(response, '%s?p=2' % url)
+
+            self.assertContains(self.client.get(url), '/page-en/')
+            response = self.client.get(url, {'p': 2})
+            self.assertContains(response, '/other-en/')
+            self.assertNotContains(response, '/page-en/')
@@ -14,12 +14,12 @@
 # <http://www.gnu.org/licenses/>.
 
 from django.conf.urls import url
-from django.contrib.sitemaps.views import sitemap
 from django.utils.translation import gettext_lazy as _
 
 from blog.sitemaps import BlogPostSitemap
 from blog.sitemaps import PageSitemap
 
+from . import sitemaps as sitemap_views
 from . import views
 from .sitemaps import StaticSitemap
 from .urlpatterns import i18n_re_path
@@ -34,6 +34,9 @@ sitemaps = {
 app_name = 'core'
 urlpatterns = [
     i18n_re_path(_(r'^contact/$'), views.ContactView.as_view(), name='contact'),
-    url(r'^sitemap\.xml$', sitemap, {'sitemaps': sitemaps, }, name='django.contrib.sitemaps.views.sitemap'),
+    url(r'^sitemap\.xml$', sitemap_views.index,
+        {'sitemaps': sitemaps, 'sitemap_url_name': 'core:sitemap-section'}, name='sitemap'),
+    url(r'^sitemap-(?P<section>\w+)\.xml$', sitemap_views.sitemap, {'sitemaps': sitemaps, },
+        name='sitemap-section'),
     url(r'^api/set-lang/$', views.SetLanguageView.as_view(), name='api-set-lang'),
 ]
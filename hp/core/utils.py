@@ -17,16 +17,24 @@ import logging
 import os
 import re
 import textwrap
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
 from contextlib import contextmanager
+from functools import lru_cache
+from html.parser import HTMLParser
 from urllib.parse import urljoin
 
 import dns.resolver
-import html5lib
 
 from django.conf import settings
 from django.core.cache import cache
+from django.db import transaction
 from django.forms.utils import flatatt
+from django.http.request import split_domain_port
 from django.utils.html import format_html
+from django.utils.http import is_same_domain
 from django.utils.text import normalize_newlines
 from django.utils.translation import gettext as _
 from django.utils.translation import ungettext
@@ -36,6 +44,12 @@ import reversion
 from .exceptions import TemporaryError
 
 log = logging.getLogger(__name__)
+_dnsbl_resolver = None
+_dnsbl_executor = None
+MENU_VERSION_CACHE_KEY = 'menu_version'
+FEED_VERSION_CACHE_KEY = 'feed_version'
+RESPONSE_CACHE_VERSION_CACHE_KEY = 'response_cache_version'
+SITEMAP_VERSION_CACHE_KEY = 'sitemap_version'
 
 
 def format_timedelta(delta):
@@ -71,6 +85,102 @@ def format_timedelta(delta):
         return _('Now')
 
 
+class SiteIndex(object):
+    """Index to find the site (as configured in the ``XMPP_HOSTS`` setting) for a ``Host`` header.
+
+    Every site matches the hosts in its ``ALLOWED_HOSTS`` setting, using the same syntax as Djangos
+    ``ALLOWED_HOSTS`` setting. If multiple sites match a host, the site configured *last* wins. If no site
+    matches, the default site is returned.
+
+    Exact host names are looked up in a dictionary, only wildcard patterns (``"*"`` or ``".example.com"``)
+    have to be checked one by one. Results are cached for the most recently seen ``Host`` headers.
+
+    >>> index = SiteIndex({'a': {'ALLOWED_HOSTS': ['a.example.com', '.example.net']},
+    ...                    'b': {'ALLOWED_HOSTS': ['b.example.net']}}, 'default')
+    >>> index.resolve('a.example.com:8000')
+    {'ALLOWED_HOSTS': ['a.example.com', '.example.net']}
+    >>> index.resolve('b.example.net')
+    {'ALLOWED_HOSTS': ['b.example.net']}
+    >>> index.resolve('example.org')
+    'default'
+
+    Parameters
+    ----------
+
+    sites : dict
+        The sites to index, usually the ``XMPP_HOSTS`` setting.
+    default
+        The site to return if no other site matches.
+    cache_size : int, optional
+        How many ``Host`` headers to cache.
+    """
+
+    def __init__(self, sites, default, cache_size=1024):
+        self.default = default
+        self.exact = {}  # host -> (position, site)
+        self.wildcards = []  # (position, pattern, site), the last site first
+
+        for position, site in enumerate(sites.values()):
+            for pattern in site.get('ALLOWED_HOSTS', []):
+                pattern = pattern.lower()
+                if pattern == '*' or pattern.startswith('.'):
+                    self.wildcards.insert(0, (position, pattern, site))
+                else:
+                    self.exact[pattern] = (position, site)  # later sites overwrite earlier ones
+
+        self.resolve = lru_cache(maxsize=cache_size)(self._resolve)
+
+    def _resolve(self, host):
+        domain, port = split_domain_port(host)
+        if not domain:
+            return self.default
+
+        position, site = self.exact.get(domain, (-1, self.default))
+        for wildcard_position, pattern, wildcard_site in self.wildcards:
+            if wildcard_position <= position:
+                break  # all remaining wildcards belong to sites configured before the exact match
+
+            if pattern == '*' or is_same_domain(domain, pattern):
+                return wildcard_site
+        return site
+
+
+def get_cache_version(key):
+    """Get the version stored in the cache under the given key.
+
+    Versions are used to invalidate data held in memory of every process: A process stores the
+    version along with the data and reloads it if the version changes. If no version is set yet,
+    a new one is created.
+    """
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+
+        if version is None:
+            # The cache does not store anything (e.g. DummyCache), so data is reloaded every time.
+            version = uuid.uuid4().hex
+    return version
+
+
+def bump_cache_version(key):
+    """Set a new version for the given key, see :py:func:`~core.utils.get_cache_version`."""
+    cache.set(key, uuid.uuid4().hex, None)
+
+
+def bump_cache_versions_on_commit(*keys):
+    """Set new versions for the given keys once the current transaction is committed.
+
+    Use this in signal handlers of models: If the version would be bumped before the transaction is
+    committed, another process could reload the old data and store it with the new version.
+    """
+    def bump():
+        for key in keys:
+            bump_cache_version(key)
+
+    transaction.on_commit(bump)
+
+
 def load_private_key(hostname):
     fp = settings.XMPP_HOSTS[hostname].get('GPG_FINGERPRINT')
     if fp:
@@ -97,10 +207,62 @@ def load_contact_keys(hostname):
     return keys
 
 
+def get_dnsbl_resolver():
+    """Get the resolver used for DNSBL lookups.
+
+    The resolver is created only once per process, the lifetime of a query is limited by the
+    ``DNSBL_TIMEOUT`` setting.
+    """
+    global _dnsbl_resolver
+
+    if _dnsbl_resolver is None:
+        _dnsbl_resolver = dns.resolver.Resolver()
+        _dnsbl_resolver.lifetime = settings.DNSBL_TIMEOUT
+    return _dnsbl_resolver
+
+
+def get_dnsbl_executor():
+    """Get the thread pool used for DNSBL lookups.
+
+    The pool is created only once per process. It has two threads per list, so the optional reasons
+    of one check can be fetched while the next check is already running.
+    """
+    global _dnsbl_executor
+
+    if _dnsbl_executor is None:
+        _dnsbl_executor = ThreadPoolExecutor(max_workers=len(settings.DNSBL) * 2,
+                                             thread_name_prefix='dnsbl')
+    return _dnsbl_executor
+
+
+def _query_dnsbl(resolver, query):
+    """Query a single DNSBL, returns ``True`` if the IP is listed."""
+
+    try:
+        resolver.query(query, "A")
+    except dns.resolver.NXDOMAIN:  # not blacklisted
+        return False
+    return True
+
+
+def _query_dnsbl_reason(resolver, query):
+    """Query the reason for a DNSBL listing, returns ``None`` if the list gives no reason."""
+
+    try:
+        return resolver.query(query, "TXT")[0].to_text()
+    except Exception:  # reason is optional
+        return None
+
+
 def check_dnsbl(ip):
     """Check the given IP for DNSBL listings.
 
-    This method caches results for an hour to improve speed.
+    All lists in the ``DNSBL`` setting are queried concurrently, if not all lists answer within
+    ``DNSBL_TIMEOUT`` seconds, a :py:class:`~core.exceptions.TemporaryError` is raised. The reasons
+    for listings are fetched in the time that is left, listings without a reason in time are
+    returned with ``None`` as reason. Listed and
+    not listed IPs are cached for ``DNSBL_CACHE_TIMEOUT`` and ``DNSBL_NEGATIVE_CACHE_TIMEOUT``
+    seconds, the cache can be warmed with the :py:func:`~core.tasks.warm_dnsbl_cache` task.
     """
 
     cache_key = 'dnsbl_%s' % ip
@@ -110,28 +272,42 @@ def check_dnsbl(ip):
         return blocks
 
     blocks = []
-    for dnsbl in settings.DNSBL:
-        reason = None
-        resolver = dns.resolver.Resolver()
-        query = '.'.join(reversed(str(ip).split("."))) + "." + dnsbl
+    if settings.DNSBL:
+        resolver = get_dnsbl_resolver()
+        reversed_ip = '.'.join(reversed(str(ip).split(".")))
+
+        executor = get_dnsbl_executor()
+        deadline = time.monotonic() + settings.DNSBL_TIMEOUT
+        queries = [(dnsbl, '%s.%s.' % (reversed_ip, dnsbl)) for dnsbl in settings.DNSBL]
+        futures = [(dnsbl, query, executor.submit(_query_dnsbl, resolver, query))
+                   for dnsbl, query in queries]
+        _done, not_done = wait([f for dnsbl, query, f in futures], timeout=settings.DNSBL_TIMEOUT)
 
         try:
-            resolver.query(query, "A")
+            if not_done:
+                raise dns.exception.Timeout()
+
+            listed = [(dnsbl, query) for dnsbl, query, future in futures if future.result()]
         except (dns.resolver.NoNameservers, dns.exception.Timeout, dns.resolver.NoAnswer):
             # Nameservers are unreachable
             raise TemporaryError(
                 _("Could not check DNS-based blocklists. Please try again later."))
-        except dns.resolver.NXDOMAIN:  # not blacklisted
-            continue
-
-        try:
-            reason = resolver.query(query, "TXT")[0].to_text()
-        except Exception:  # reason is optional
-            pass
-
-        blocks.append((dnsbl, reason))
 
-    cache.set(cache_key, blocks, 3600)  # cache this for an hour
+        # Reasons are optional, so they only get the time that is left until the deadline
+        reasons = [(dnsbl, executor.submit(_query_dnsbl_reason, resolver, query))
+                   for dnsbl, query in listed]
+        wait([f for dnsbl, f in reasons], timeout=max(deadline - time.monotonic(), 0))
+        for dnsbl, future in reasons:
+            if future.done():
+                blocks.append((dnsbl, future.result()))
+            else:
+                future.cancel()
+                blocks.append((dnsbl, None))
+
+    if blocks:
+        cache.set(cache_key, blocks, settings.DNSBL_CACHE_TIMEOUT)
+    else:
+        cache.set(cache_key, blocks, settings.DNSBL_NEGATIVE_CACHE_TIMEOUT)
     return blocks
 
 
@@ -152,10 +328,82 @@ def canonical_link(path, host=None):
     return urljoin(base_url, path)
 
 
+class LinkAbsolutifier(HTMLParser):
+    """Streaming HTML parser that makes relative links absolute, used by :py:func:`absolutify_html`.
+
+    The input is passed through unchanged, only tags with a link that has to be rewritten are serialized
+    again.
+    """
+
+    attributes = {
+        'a': 'href',
+        'img': 'src',
+        'link': 'href',
+        'script': 'src',
+    }
+
+    def __init__(self, base_url):
+        super().__init__(convert_charrefs=False)
+        self.base_url = base_url
+        self.output = []
+
+    def handle_starttag(self, tag, attrs):
+        attr = self.attributes.get(tag)
+        if attr is None or not any(name == attr and value for name, value in attrs):
+            self.output.append(self.get_starttag_text())
+            return
+
+        self.output.append('<%s' % tag)
+        for name, value in attrs:
+            if value is None:
+                self.output.append(' %s' % name)
+                continue
+
+            if name == attr and value:
+                value = urljoin(self.base_url, value)
+            self.output.append(' %s="%s"' % (name, value.replace('&', '&amp;').replace('"', '&quot;')))
+        self.output.append('>')
+
+    handle_startendtag = handle_starttag
+
+    def handle_endtag(self, tag):
+        self.output.append('</%s>' % tag)
+
+    def handle_data(self, data):
+        self.output.append(data)
+
+    def handle_entityref(self, name):
+        self.output.append('&%s;' % name)
+
+    def handle_charref(self, name):
+        self.output.append('&#%s;' % name)
+
+    def handle_comment(self, data):
+        self.output.append('<!--%s-->' % data)
+
+    def handle_decl(self, decl):
+        self.output.append('<!%s>' % decl)
+
+    def handle_pi(self, data):
+        self.output.append('<?%s>' % data)
+
+    def unknown_decl(self, data):
+        if data.startswith('CDATA['):  # the parser strips only the final "]]>" of CDATA sections
+            self.output.append('<![%s]]>' % data)
+        else:
+            self.output.append('<![%s]>' % data)
+
+    def absolutify(self, html):
+        self.feed(html)
+        self.close()
+        return ''.join(self.output)
+
+
 def absolutify_html(html, base_url):
     """Make relative links in the given html absolute.
 
-    This code is copied from `here <http://garethrees.org/2009/10/09/feed/>`_.
+    Note that we need to do this even for URLs that consist only of a fragment identifier, because Google
+    Reader changes href=#foo to href=http://site/#foo.
 
     Examle::
 
@@ -163,36 +411,11 @@ def absolutify_html(html, base_url):
         '<a href="https://example.com/foobar">test</a>'
         >>> absolutify_html('<a href="https://example.net/foobar">test</a>', 'https://example.com')
         '<a href="https://example.net/foobar">test</a>'
+        >>> absolutify_html('<p>Foo &amp; <img alt="Bar" src="bar.png"/></p>', 'https://example.com/p/')
+        '<p>Foo &amp; <img alt="Bar" src="https://example.com/p/bar.png"></p>'
     """
 
-    attributes = [
-        ('a', 'href'),
-        ('img', 'src'),
-        ('link', 'href'),
-        ('script', 'src')
-    ]
-
-    # Parse SRC as HTML.
-    tree_builder = html5lib.treebuilders.getTreeBuilder('dom')
-    parser = html5lib.html5parser.HTMLParser(tree=tree_builder)
-    dom = parser.parse(html)
-
-    # Change all relative URLs to absolute URLs by resolving them relative to
-    # BASE_URL. Note that we need to do this even for URLs that consist only of
-    # a fragment identifier, because Google Reader changes href=#foo to
-    # href=http://site/#foo
-    for tag, attr in attributes:
-        for e in dom.getElementsByTagName(tag):
-            u = e.getAttribute(attr)
-            if u:
-                e.setAttribute(attr, urljoin(base_url, u))
-
-    # Return the HTML5 serialization of the <BODY> of the result (we don't want
-    # the <HEAD>: this breaks feed readers).
-    body = dom.getElementsByTagName('body')[0]
-    tree_walker = html5lib.treewalkers.getTreeWalker('dom')
-    html_serializer = html5lib.serializer.HTMLSerializer()
-    return ''.join(html_serializer.serialize(tree_walker(body)))
+    return LinkAbsolutifier(base_url).absolutify(html)
 
 
 def format_link(url, text, **attrs):
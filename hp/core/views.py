@@ -17,14 +17,12 @@ import ipaddress
 import logging
 
 from django.conf import settings
-from django.core.cache import cache
-from django.db.models import Q
 from django.http import Http404
 from django.http import HttpResponseRedirect
 from django.template.response import TemplateResponse
 from django.urls import reverse_lazy
-from django.utils import timezone
 from django.utils import translation
+from django.utils.cache import add_never_cache_headers
 from django.utils.functional import Promise
 from django.utils.http import url_has_allowed_host_and_scheme
 from django.utils.translation import gettext as _
@@ -32,9 +30,10 @@ from django.views.generic.base import RedirectView
 from django.views.generic.edit import FormView
 
 from antispam.exceptions import BlockedException
-from antispam.models import BlockedIpAddress
+from antispam.utils import get_ip_blacklist
 from core.utils import canonical_link
 
+from . import ratelimit
 from .constants import ACTIVITY_CONTACT
 from .forms import AnonymousContactForm
 from .forms import ContactForm
@@ -42,9 +41,7 @@ from .tasks import send_contact_email
 from .utils import check_dnsbl
 
 log = logging.getLogger(__name__)
-_BLACKLIST = getattr(settings, 'SPAM_BLACKLIST', set())
 _RATELIMIT_WHITELIST = getattr(settings, 'RATELIMIT_WHITELIST', set())
-_RATELIMIT_CONFIG = getattr(settings, 'RATELIMIT_CONFIG', {})
 
 
 class HomepageViewMixin(object):
@@ -97,6 +94,8 @@ class TranslateSlugViewMixin(object):
 
        * There is a ``slug`` kwarg in the URL config
        * The model has a translated slug field (like core.BlogPost and core.Page)
+       * The queryset has a ``slug()`` method that filters for a slug in any language (like
+         :py:meth:`blog.querysets.BasePageQuerySet.slug`).
        * The model has a ``get_absolute_url()`` method.
 
     Background: By default, get_object() would filter for the slug field, the translated
@@ -109,8 +108,9 @@ class TranslateSlugViewMixin(object):
     this would result in a ``WHERE slug_en="foo"`` in an English browser). This means that
     the URL "/page/english-slug" works in an English browser but NOT in a German browser.
 
-    So ``get_object()`` is overwritten to filter for all language slugs. ``get()`` additionally
-    returns a redirect to the slug in the current language if it's not the same as the one viewed.
+    So ``get_object()`` is overwritten to filter for all language slugs using the ``slug()`` method of
+    the queryset. ``get()`` additionally returns a redirect to the slug in the current language if it's
+    not the same as the one viewed.
     """
 
     def get(self, request, *args, **kwargs):
@@ -131,11 +131,7 @@ class TranslateSlugViewMixin(object):
         slug = self.kwargs.get(self.slug_url_kwarg)
 
         # filter for slugs in all languages
-        filter = Q()
-        for lang, _name in settings.LANGUAGES:
-            filter |= Q(**{'slug_%s' % lang: slug})
-
-        queryset = queryset.filter(filter)
+        queryset = queryset.slug(slug)
 
         try:
             # Get the single item from the filtered queryset
@@ -152,9 +148,6 @@ class AntiSpamMixin(object):
     rate_template = 'core/antispam/rate.html'
     rate_activity = None
 
-    def get_rate_cache_key(self, request):
-        return 'rate_%s_%s' % (self.rate_activity, request.META['REMOTE_ADDR'])
-
     def check_rate(self, request, rate_addr):
         """Check if the given IP is currently ratelimited for this view.
 
@@ -171,16 +164,7 @@ class AntiSpamMixin(object):
         if rate_addr in _RATELIMIT_WHITELIST or settings.DEBUG is True:
             return True
 
-        cache_key = self.get_rate_cache_key(request)
-        now = timezone.now()
-        timestamps = cache.get(cache_key) or []
-        config = _RATELIMIT_CONFIG.get(self.rate_activity, {})
-
-        for delta, ratelimit in config:
-            offset = now - delta
-            if len([t for t in timestamps if t >= offset]) > ratelimit:
-                return False
-        return True
+        return not ratelimit.get_backend().is_limited(self.rate_activity, rate_addr)
 
     def ratelimit(self, request):
         if settings.DEBUG is True:
@@ -191,10 +175,16 @@ class AntiSpamMixin(object):
         if rate_addr in _RATELIMIT_WHITELIST or self.rate_activity is None:
             return
 
-        cache_key = self.get_rate_cache_key(request)
-        timestamps = cache.get(cache_key) or []
-        timestamps.append(timezone.now())
-        cache.set(cache_key, timestamps, timeout=86400)
+        ratelimit.get_backend().hit(self.rate_activity, rate_addr)
+
+    def render_spam_response(self, request, template, context):
+        """Render a response for a blacklisted, ratelimited or DNSBL-listed IP address.
+
+        The response depends on the IP address of the client, so it must never be cached.
+        """
+        response = TemplateResponse(request, template, context)
+        add_never_cache_headers(response)
+        return response
 
     def dispatch(self, request, *args, **kwargs):
         if settings.DEBUG is True:
@@ -204,26 +194,26 @@ class AntiSpamMixin(object):
         else:
             bl_addr = dnsbl_addr = rate_addr = request.META['REMOTE_ADDR']
 
-        if BlockedIpAddress.objects.is_blocked(bl_addr):
+        # Check blocked addresses (BlockedIpAddress) and static blacklist (settings.SPAM_BLACKLIST)
+        blacklist = get_ip_blacklist()
+        bl_addr = ipaddress.ip_address(bl_addr)
+        if blacklist.is_blocked(bl_addr):
             raise BlockedException(_('This address is blocked.'))
 
-        # Check static blacklist (settings.SPAM_BLACKLIST)
-        bl_addr = ipaddress.ip_address(bl_addr)
-        for network in _BLACKLIST:
-            if bl_addr in network:
-                log.info('%s: IP is in settings.BLACKLIST.', bl_addr)
-                return TemplateResponse(request, self.blacklist_template, {})
+        if blacklist.is_blacklisted(bl_addr):
+            log.info('%s: IP is in settings.BLACKLIST.', bl_addr)
+            return self.render_spam_response(request, self.blacklist_template, {})
 
         # Check ratelimits
         if self.check_rate(request, rate_addr) is False:
             log.info('%s: IP is ratelimited.', rate_addr)
-            return TemplateResponse(request, self.rate_template, {})
+            return self.render_spam_response(request, self.rate_template, {})
 
         # Check DNS Blacklists
         blocks = check_dnsbl(dnsbl_addr)
         if blocks:
             log.info('%s: IP is on at least one DNSBL.', dnsbl_addr)
-            return TemplateResponse(request, self.dnsbl_template, {
+            return self.render_spam_response(request, self.dnsbl_template, {
                 'blocks': blocks,
             })
 
@@ -1,3 +1,94 @@
-from django.test import TestCase  # NOQA
+# -*- coding: utf-8 -*-
+#
+# This file is part of the jabber.at homepage (https://github.com/jabber-at/hp).
+#
+# This project is free software: you can redistribute it and/or modify it under the terms of the GNU General
+# Public License as published by the Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# This project is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the
+# implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License along with this project. If not, see
+# <http://www.gnu.org/licenses/>.
 
-# Create your tests here.
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.test import Client
+from django.utils import timezone
+
+from account.models import User
+from blog.models import BlogPost
+from core.tests.base import TestCase
+
+
+class FeedTests(TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.user = User.objects.create(username='user@example.com', email='user@example.com')
+        self.post = self.create_post('first')
+
+    def create_post(self, slug, **kwargs):
+        kwargs.setdefault('publication_date', timezone.now() - timedelta(hours=1))
+        return BlogPost.objects.create(
+            title_en=slug, title_de=slug, slug_en=slug, slug_de='%s-de' % slug, author=self.user,
+            text_en='<p>Text of %s.</p>' % slug, text_de='<p>Text.</p>', **kwargs)
+
+    def assertFeed(self, url, *posts):
+        c = Client()
+        response = c.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/xml')
+        for post in posts:
+            self.assertIn(post.get_canonical_url().encode('utf-8'), response.content)
+        return response
+
+    def test_cache(self):
+        for url in ['/feed/en/atom.xml', '/feed/en/rss.xml']:
+            response = self.assertFeed(url, self.post)
+
+            # second request does not use the database
+            with self.assertNumQueries(0):
+                cached = self.assertFeed(url, self.post)
+            self.assertEqual(response.content, cached.content)
+            self.assertEqual(response['ETag'], cached['ETag'])
+
+        # a new blog post invalidates the cache
+        with self.captureOnCommitCallbacks(execute=True):
+            second = self.create_post('second')
+        self.assertFeed('/feed/en/atom.xml', self.post, second)
+        self.assertFeed('/feed/en/rss.xml', self.post, second)
+
+    def test_conditional(self):
+        c = Client()
+        response = self.assertFeed('/feed/en/atom.xml', self.post)
+
+        with self.assertNumQueries(0):
+            not_modified = c.get('/feed/en/atom.xml', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b'')
+
+        not_modified = c.get('/feed/en/atom.xml', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(not_modified.status_code, 304)
+
+        # modifying the post changes the ETag
+        self.post.title_en = 'changed'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.save()
+        response = c.get('/feed/en/atom.xml', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_scheduled(self):
+        self.assertFeed('/feed/en/atom.xml', self.post)
+
+        # create a post that is scheduled to be published in the near future
+        now = timezone.now()
+        scheduled = self.create_post('scheduled', publication_date=now + timedelta(seconds=30))
+        response = self.assertFeed('/feed/en/atom.xml', self.post)
+        self.assertNotIn(scheduled.get_canonical_url().encode('utf-8'), response.content)
+
+        view = response.resolver_match.func.view_class()
+        self.assertLessEqual(view.get_cache_timeout(), 31)
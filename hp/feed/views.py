@@ -13,26 +13,38 @@
 # You should have received a copy of the GNU General Public License along with this project. If
 # not, see <http://www.gnu.org/licenses/>.
 
+import hashlib
+
 from lxml import etree
 from strict_rfc3339 import timestamp_to_rfc3339_utcoffset
 
 from django.conf import settings
+from django.core.cache import cache
 from django.http import HttpResponse
 from django.templatetags.static import static
 from django.urls import reverse
 from django.utils import timezone
 from django.utils import translation
+from django.utils.cache import get_conditional_response
+from django.utils.cache import quote_etag
 from django.utils.http import http_date
 from django.utils.translation import gettext as _
 from django.views.generic.base import View
 from django.views.generic.list import MultipleObjectMixin
 
 from blog.models import BlogPost
+from core.utils import FEED_VERSION_CACHE_KEY
 from core.utils import absolutify_html
+from core.utils import get_cache_version
 
 
 class FeedMixin(MultipleObjectMixin):
-    queryset = BlogPost.objects.published().blog_order()
+    """Base class for feeds.
+
+    Rendered feeds are cached per feed type, language and host until a blog post changes, responses
+    include ``ETag`` and ``Last-Modified`` headers so that feed readers can use conditional requests.
+    """
+
     content_type = 'application/xml'
     atom_ns = 'http://www.w3.org/2005/Atom'
 
@@ -42,18 +54,68 @@ class FeedMixin(MultipleObjectMixin):
             e.text = text
         return e
 
+    def get_queryset(self):
+        return BlogPost.objects.published().blog_order()
+
     def get_content_type(self):
         return self.content_type
 
     def get_feed_title(self, request):
         return _('%s - Recent updates') % request.site['BRAND']
 
-    def get(self, request, language):
-        ctype = self.get_content_type()
+    def get_cache_key(self, request, language):
+        version = get_cache_version(FEED_VERSION_CACHE_KEY)
+        return 'feed_%s_%s_%s_%s_%s' % (self.__class__.__name__, language, request.scheme,
+                                        request.get_host(), version)
+
+    def get_cache_timeout(self):
+        """Cache feeds at most until the next blog post is scheduled to be published."""
+
+        timeout = settings.FEED_CACHE_TIMEOUT
+        now = timezone.now()
+        scheduled = BlogPost.objects.filter(published=True, publication_date__gte=now).order_by(
+            'publication_date').values_list('publication_date', flat=True).first()
+        if scheduled is not None:
+            timeout = min(timeout, int((scheduled - now).total_seconds()) + 1)
+        return timeout
+
+    def render_feed(self, request, language):
+        """Render the feed, returns a dict with the content, the ETag and the modification time."""
 
         with translation.override(language):
-            items = self.serialize_items(request, language, self.get_queryset()[:15])
-            return HttpResponse(etree.tostring(items), ctype, charset='utf-8')
+            posts = list(self.get_queryset()[:15])
+            content = etree.tostring(self.serialize_items(request, language, posts))
+
+        if posts:
+            last_modified = max([p.updated for p in posts])
+        else:
+            last_modified = timezone.now()
+
+        return {
+            'content': content,
+            'etag': quote_etag(hashlib.md5(content).hexdigest()),
+            'last_modified': int(last_modified.timestamp()),
+        }
+
+    def get(self, request, language):
+        # Feeds with a query string are not cached, as they would allow filling the cache arbitrarily
+        cache_key = None
+        if not request.GET:
+            cache_key = self.get_cache_key(request, language)
+            feed = cache.get(cache_key)
+
+        if cache_key is None or feed is None:
+            feed = self.render_feed(request, language)
+            if cache_key is not None:
+                cache.set(cache_key, feed, self.get_cache_timeout())
+
+        response = get_conditional_response(request, etag=feed['etag'], last_modified=feed['last_modified'])
+        if response is None:
+            response = HttpResponse(feed['content'], self.get_content_type(), charset='utf-8')
+
+        response['ETag'] = feed['etag']
+        response['Last-Modified'] = http_date(feed['last_modified'])
+        return response
 
 
 class AtomFeed(FeedMixin, View):
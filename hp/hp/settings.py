@@ -86,6 +86,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'core.middleware.HomepageMiddleware',
+    'core.middleware.ResponseCacheMiddleware',
     'blog.middleware.blog_middleware',
 ]
 
@@ -367,6 +368,10 @@ MESSAGE_TAGS = {
 ACCOUNT_EXPIRES_DAYS = None
 ACCOUNT_EXPIRES_NOTIFICATION_DAYS = None
 
+# Concurrent queries and bulk update size when updating the last activity of users
+ACCOUNT_LAST_ACTIVITY_WORKERS = 8
+ACCOUNT_LAST_ACTIVITY_BATCH_SIZE = 500
+
 ADMIN_URL = '/admin/'
 
 # Custom media root directory for Images uploaded via admin
@@ -377,12 +382,30 @@ BLOG_MEDIA_URL = None
 CLIENTS_PAGE = None
 FAQ_PAGE = None
 
+# How long (in seconds) RSS/Atom feeds are cached at most
+FEED_CACHE_TIMEOUT = 3600
+
+# How long (in seconds) sitemaps are cached at most
+SITEMAP_CACHE_TIMEOUT = 86400
+
+# How long (in seconds) complete pages are cached for anonymous users, set to 0 to disable the cache
+RESPONSE_CACHE_TIMEOUT = 300
+
 XMPP_HOSTS = {}
 CONTACT_ADDRESS = None
 CONTACT_MUC = None
 DEFAULT_XMPP_HOST = None
 DEFAULT_FROM_EMAIL = None
 
+# Messages sent in batches (e.g. notifications) are sent over one connection in batches of this size
+MAIL_BATCH_SIZE = 100
+
+# How often sending a message in a batch is retried
+MAIL_RETRIES = 2
+
+# Rate limit (per worker) for Celery tasks sending a batch of notifications
+MAIL_RATE_LIMIT = '10/m'
+
 # How long confirmation emails remain valid
 USER_CONFIRMATION_TIMEOUT = timedelta(hours=48)
 
@@ -470,6 +493,12 @@ _DEFAULT_SIDEBAR_PANELS = [
 ################
 GPG_KEYSERVER = 'http://pool.sks-keyservers.net:11371'
 
+# How long (in seconds) keys fetched from the keyserver are cached
+GPG_KEY_CACHE_TIMEOUT = 3600
+
+# How many keys are fetched concurrently when refreshing many keys at once
+GPG_FETCH_WORKERS = 8
+
 # Default GPG backend configuration
 GPG_BACKENDS = {
     'default': {
@@ -484,6 +513,9 @@ GPG_BACKENDS = {
 
 # Directory where public/private keys are stored for signing.
 GPG_KEYDIR = os.path.join(BASE_DIR, 'gpg-keys')
+
+# How many public keys are kept in the keyring used for sending mails (per host and process)
+GPG_KEYRING_SIZE = 100
 MAX_UPLOAD_SIZE = 1024 * 1024 * 2
 
 ###################
@@ -534,6 +566,13 @@ DNSBL = (
     'cbl.abuseat.org',
 )
 
+# Timeout in seconds for checking all DNSBL lists
+DNSBL_TIMEOUT = 3
+
+# How long (in seconds) results of DNSBL checks are cached for listed and not listed IPs
+DNSBL_CACHE_TIMEOUT = 3600
+DNSBL_NEGATIVE_CACHE_TIMEOUT = 3600
+
 # Ratelimit
 RATELIMIT_CONFIG = {
     ACTIVITY_REGISTER: (
@@ -547,6 +586,15 @@ RATELIMIT_CONFIG = {
         (timedelta(minutes=30), 3, ),
     ),
 }
+# Backend used for storing ratelimit counters. The cache backend uses the default cache, for
+# correct counting with multiple workers the cache should support atomic increments (e.g. Redis).
+RATELIMIT_BACKEND = {
+    'BACKEND': 'core.ratelimit.CacheRateLimitBackend',
+    'OPTIONS': {
+        #'cache': 'default',  # Cache alias (see CACHES) to use
+        #'buckets': 10,  # How many buckets a time window is split into
+    },
+}
 SPAM_BLACKLIST = set()
 BLOCKED_EMAIL_TIMEOUT = None
 BLOCKED_IPADDRESS_TIMEOUT = timedelta(days=31)
@@ -125,6 +125,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'core.middleware.HomepageMiddleware',
+    'core.middleware.ResponseCacheMiddleware',
 ]
 
 ROOT_URLCONF = 'hp.urls'
@@ -216,6 +217,9 @@ AUTHENTICATION_BACKENDS = [
 CONVERSEJS_CONFIG = {}
 FAQ_PAGE = None
 CLIENTS_PAGE = None
+FEED_CACHE_TIMEOUT = 3600
+SITEMAP_CACHE_TIMEOUT = 86400
+RESPONSE_CACHE_TIMEOUT = 0
 
 ############
 # TinyMCE4 #
@@ -369,6 +373,10 @@ MESSAGE_TAGS = {
 ACCOUNT_EXPIRES_DAYS = None
 ACCOUNT_EXPIRES_NOTIFICATION_DAYS = None
 
+# The fake XMPP backend stores data in the database, so it has to be queried in the same thread
+ACCOUNT_LAST_ACTIVITY_WORKERS = 1
+ACCOUNT_LAST_ACTIVITY_BATCH_SIZE = 500
+
 ADMIN_URL = '/admin/'
 
 # Custom media root directory for Images uploaded via admin
@@ -410,6 +418,9 @@ CONTACT_ADDRESS = 'contact@example.com'
 CONTACT_MUC = None
 DEFAULT_XMPP_HOST = 'example.com'
 DEFAULT_FROM_EMAIL = None
+MAIL_BATCH_SIZE = 100
+MAIL_RETRIES = 2
+MAIL_RATE_LIMIT = '10/m'
 
 # How long confirmation emails remain valid
 USER_CONFIRMATION_TIMEOUT = timedelta(hours=48)
@@ -486,6 +497,8 @@ ACCOUNT_USER_MENU = [
 # GPG settings #
 ################
 GPG_KEYSERVER = 'http://pool.sks-keyservers.net:11371'
+GPG_KEY_CACHE_TIMEOUT = 3600
+GPG_FETCH_WORKERS = 1
 
 # Default GPG backend configuration
 GPG_BACKENDS = {
@@ -501,6 +514,7 @@ GPG_BACKENDS = {
 
 # Directory where public/private keys are stored for signing.
 GPG_KEYDIR = os.path.join(BASE_DIR, 'gpg-keys')
+GPG_KEYRING_SIZE = 100
 
 ###################
 # Celery settings #
@@ -545,6 +559,13 @@ CAPTCHA_TEST_MODE = True  # PASSED is always a valid captcha
 # DNSBL lists
 DNSBL = ()
 
+# Timeout in seconds for checking all DNSBL lists
+DNSBL_TIMEOUT = 3
+
+# How long (in seconds) results of DNSBL checks are cached for listed and not listed IPs
+DNSBL_CACHE_TIMEOUT = 3600
+DNSBL_NEGATIVE_CACHE_TIMEOUT = 3600
+
 # Ratelimit
 RATELIMIT_CONFIG = {
     ACTIVITY_REGISTER: (
@@ -558,7 +579,18 @@ RATELIMIT_CONFIG = {
         (timedelta(minutes=30), 3, ),
     ),
 }
+# Backend used for storing ratelimit counters. The cache backend uses the default cache, for
+# correct counting with multiple workers the cache should support atomic increments (e.g. Redis).
+RATELIMIT_BACKEND = {
+    'BACKEND': 'core.ratelimit.CacheRateLimitBackend',
+    'OPTIONS': {
+        #'cache': 'default',  # Cache alias (see CACHES) to use
+        #'buckets': 10,  # How many buckets a time window is split into
+    },
+}
 SPAM_BLACKLIST = set()
+BLOCKED_EMAIL_TIMEOUT = None
+BLOCKED_IPADDRESS_TIMEOUT = timedelta(days=31)
 
 # Email addresses using these domains cannot be used for registration
 BANNED_EMAIL_DOMAINS = set()